@@ -0,0 +1,3 @@
+-- Adds the leaf embedding column used by similar-case search to an existing
+-- prediction_history table (new databases get it from code.sql)
+ALTER TABLE prediction_history ADD COLUMN embedding BLOB AFTER result_json;
@@ -3,22 +3,42 @@ Rice Stress Detector - Enhanced Flask Backend with Authentication
 Handles authentication, dashboards, and APIs
 """
 
-from flask import Flask, request, jsonify, send_from_directory, render_template, session, redirect, url_for
+from flask import Flask, request, jsonify, send_from_directory, send_file, render_template, session, redirect, url_for, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
-import tensorflow as tf
-from tensorflow import keras
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
-from PIL import Image
 import os
 import json
 from datetime import datetime
 import uuid
+import time
+import threading
+import zipfile
+from batching import MicroBatcher
+from inference_engine import InferenceEngine, BackgroundModelLoader, backend_model_path
+from image_preprocessing import ImageRejected
+from upload_handling import InMemoryUploadRequest, UploadWriter, read_archive, upload_limit
+from prediction_cache import PredictionCache, model_fingerprint
+from metrics import instrument_app, register_serving_gauges, stage_timer, STAGE_SECONDS, DB_QUERIES, DB_SECONDS
+from inference_executor import BoundedExecutor, Overloaded
+from model_cascade import ModelCascade, CASCADE_CONFIG_PATH
+from prediction_service import PredictionService, server_busy
+from embedding_index import EmbeddingIndex, encode_embedding, decode_embedding
+from explanations import GradCam, ExplanationCache, render_overlay, read_overlay_metadata
+from recommendations import RecommendationIndex, EMPTY_RECOMMENDATION
+from write_behind import WriteBehindBuffer
+from catalog_cache import CatalogCache
+from job_queue import JobQueue, Completed
+from model_registry import ModelRegistry, ShadowEvaluator, BuildBackoff
+from periodic import PeriodicTask
 import hashlib
+import hmac
 from functools import wraps
-from db_connect import DatabaseConnection
+from db_connect import DatabaseConnection, ConnectionPool
 
 # Set up Flask with correct template folder
 app = Flask(__name__, template_folder='website', static_folder='website')
+app.request_class = InMemoryUploadRequest
 CORS(app)
 
 # Session Configuration - using Flask built-in sessions
@@ -33,18 +53,234 @@ CLASS_INDICES_PATH = 'models/class_indices.json'
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 IMG_SIZE = 224
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')  # keras, tflite, onnx or graph
+MODEL_RETRY_AFTER_SECONDS = 5
+MODEL_BACKGROUND_LOAD = os.getenv('MODEL_BACKGROUND_LOAD', '1') == '1'  # serve.py loads per worker
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0)) or None
+PREDICTION_CACHE_DIR = 'cache/predictions'
+EXPLANATION_CACHE_DIR = 'cache/explanations'
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_DISK_ENTRIES = int(os.getenv('PREDICTION_CACHE_DISK_ENTRIES', 100000))
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 10))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', BATCH_MAX_SIZE))  # uploads decoded/classified at once
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', 32))
+INFERENCE_QUEUE_TIMEOUT_MS = float(os.getenv('INFERENCE_QUEUE_TIMEOUT_MS', 2000))
+MAX_UPLOAD_BYTES = int(float(os.getenv('MAX_UPLOAD_MB', 16)) * 1024 * 1024)  # request body, enforced while streaming
+MAX_IMAGE_SIDE = int(os.getenv('MAX_IMAGE_SIDE', 12000))
+MAX_IMAGE_PIXELS = int(float(os.getenv('MAX_IMAGE_MEGAPIXELS', 24)) * 1e6)  # after JPEG draft-mode scaling
+TOP_K = 3
+TTA_VIEWS = int(os.getenv('TTA_VIEWS', 8))  # test-time augmentation views per image
+TTA_AUTO_THRESHOLD = float(os.getenv('TTA_AUTO_THRESHOLD', 0))  # top-1 confidence %, 0 disables
+CASCADE = os.getenv('CASCADE', '0') == '1'  # fast model first, full model when unsure
+TILE_MAX = int(os.getenv('TILE_MAX', 12))  # tiles scored per image in tiled mode
+EXPLAIN_WORKERS = int(os.getenv('EXPLAIN_WORKERS', 1))  # Grad-CAM overlays rendered at once
+EXPLAIN_QUEUE_SIZE = 8
+EXPLAIN_QUEUE_TIMEOUT_MS = 10000
+MODEL_VERSION = '1.0'  # recorded when serving models/ directly rather than a registry version
+MODEL_REGISTRY_DIR = 'models/registry'
+MODEL_REGISTRY_POLL_SECONDS = 10
+MODEL_BUILD_RETRY_SECONDS = 60  # first retry of a version that failed to load; doubles up to an hour
+SHADOW_MAX_PENDING = 64
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # admin API is disabled when unset
+MAX_BATCH_IMAGES = int(os.getenv('MAX_BATCH_IMAGES', 200))
+MAX_ARCHIVE_MEMBER_BYTES = 20 * 1024 * 1024
+MAX_ARCHIVE_TOTAL_BYTES = int(float(os.getenv('MAX_ARCHIVE_UNCOMPRESSED_MB', 512)) * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.getenv('MAX_BATCH_UPLOAD_MB', 256)) * 1024 * 1024)
+JOB_QUEUE_PATH = 'jobs/prediction_jobs.db'
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MODEL_WAIT_SECONDS = 60
+JOB_EVENTS_POLL_SECONDS = 1
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+HISTORY_FLUSH_ROWS = int(os.getenv('HISTORY_FLUSH_ROWS', 50))  # prediction_history rows per multi-row insert
+HISTORY_FLUSH_MS = float(os.getenv('HISTORY_FLUSH_MS', 200))  # longest a prediction waits to be logged
+HISTORY_MAX_PENDING = int(os.getenv('HISTORY_MAX_PENDING', 5000))  # rows buffered in memory per worker
+HISTORY_MAX_ATTEMPTS = int(os.getenv('HISTORY_MAX_ATTEMPTS', 10))  # refusals before a spilled row is dead-lettered
+HISTORY_SPILL_PATH = 'jobs/prediction_history_spill.db'
+HISTORY_FLUSH_WAIT_SECONDS = 2
+CATALOG_TTL_SECONDS = float(os.getenv('CATALOG_TTL_SECONDS', 600))  # pesticides and fertilizers
+RESEARCH_LABS_TTL_SECONDS = float(os.getenv('RESEARCH_LABS_TTL_SECONDS', 300))
+CATALOG_TRIGGER_PATH = 'cache/catalog.refresh'  # touched when catalog rows change
+RECOMMENDATION_REFRESH_SECONDS = float(os.getenv('RECOMMENDATION_REFRESH_SECONDS', 300))
+RECOMMENDATION_CHECK_SECONDS = 5
+RECOMMENDATION_TRIGGER_PATH = 'cache/recommendations.refresh'  # touched by the admin refresh endpoint
+EMBEDDING_SYNC_SECONDS = float(os.getenv('EMBEDDING_SYNC_SECONDS', 5))  # lag before new uploads are searchable
+EMBEDDING_SYNC_ROWS = 5000
+# Ids behind the newest one re-read on every sync: concurrent inserts can commit out of id order
+EMBEDDING_SYNC_LOOKBACK_IDS = int(os.getenv('EMBEDDING_SYNC_LOOKBACK_IDS', 500))
+SIMILAR_CASES_K = 10
+SIMILAR_CASES_MAX_K = 100
+
+# Oversized bodies are refused with 413 while they stream in, before they are buffered
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
 # Create upload folder
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+upload_writer = UploadWriter(UPLOAD_FOLDER)
 
-# Load model and class indices
-print("Loading model...")
-model = keras.models.load_model(MODEL_PATH)
-print("✓ Model loaded successfully")
-
+# Load class indices; the model itself loads in the background so that
+# routes that don't need it are served while TensorFlow starts up
 with open(CLASS_INDICES_PATH, 'r') as f:
     class_indices = json.load(f)
 
+# The registry's live version is served when there is one, otherwise models/ as trained
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR)
+
+def registry_model_path(version):
+    """Keras model path of a registry version (None = models/rice_disease_model.h5)"""
+    return MODEL_PATH if version is None else model_registry.model_path(version)
+
+SERVING_MODEL_PATH = backend_model_path(registry_model_path(model_registry.live_version()), INFERENCE_BACKEND)
+prediction_cache = PredictionCache(SERVING_MODEL_PATH, PREDICTION_CACHE_DIR, max_entries=PREDICTION_CACHE_SIZE,
+                                   max_disk_entries=PREDICTION_CACHE_DISK_ENTRIES)
+
+def build_engine(version):
+    """Load and warm up the inference engine for a registry version"""
+    if version is None:
+        engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=INFERENCE_BACKEND,
+                                 num_threads=INFERENCE_THREADS, version=MODEL_VERSION)
+    else:
+        metadata = model_registry.metadata(version)
+        # The rest of the app assumes this input size and label set
+        if metadata['img_size'] != IMG_SIZE or metadata['class_indices'] != class_indices:
+            raise ValueError(f"Model {version} has a different input size or classes; restart to serve it")
+        engine = InferenceEngine(model_registry.model_path(version), model_registry.class_indices_path(version),
+                                 img_size=IMG_SIZE, backend=INFERENCE_BACKEND,
+                                 num_threads=INFERENCE_THREADS, version=version)
+    engine.warmup()
+    return engine
+
+# First stage of the model cascade; set by load_engine when CASCADE is on
+model_cascade = None
+
+def build_fast_engine(model_path):
+    """Load and warm up the cascade's fast model"""
+    engine = InferenceEngine(model_path, CLASS_INDICES_PATH, img_size=IMG_SIZE,
+                             backend=INFERENCE_BACKEND, num_threads=INFERENCE_THREADS)
+    engine.warmup()
+    return engine
+
+def load_engine():
+    """Load and warm up the live model (and the cascade's fast model)"""
+    global model_cascade
+    print("Loading model...")
+    engine = build_engine(model_registry.live_version())
+    if CASCADE:
+        model_cascade = ModelCascade.load(CASCADE_CONFIG_PATH, build_fast_engine)
+    return engine
+
+model_loader = BackgroundModelLoader(load_engine)
+
+# Candidate model scoring sampled traffic in the background (see sync_with_registry)
+shadow_evaluator = None
+registry_lock = threading.Lock()
+# Versions that failed to load are not rebuilt on every poll
+registry_backoff = BuildBackoff(MODEL_BUILD_RETRY_SECONDS)
+
+def build_from_registry(key, version, pointer):
+    """
+    build_engine(version) for the LIVE or SHADOW pointer, recording failures in
+    registry_backoff; None while a failed version waits for its retry
+    """
+    pointer_mtime = model_registry.pointer_mtime(pointer)
+    if not registry_backoff.should_build(key, version, pointer_mtime):
+        return None
+    try:
+        engine = build_engine(version)
+    except Exception as e:
+        delay = registry_backoff.failed(key, version, pointer_mtime, e)
+        print(f"✗ Could not load {key} model {version or MODEL_VERSION}; retrying in {delay:.0f}s "
+              f"or when it is promoted again")
+        raise
+    registry_backoff.succeeded(key)
+    return engine
+
+def sync_with_registry():
+    """Hot-swap to the registry's live version and start/stop shadow scoring to match it"""
+    global shadow_evaluator
+    
+    if not model_loader.is_ready():
+        return
+    
+    with registry_lock:
+        live_version = model_registry.live_version() or MODEL_VERSION
+        if live_version != model_loader.engine.version:
+            engine = build_from_registry('live', model_registry.live_version(), 'LIVE')
+            if engine is not None:
+                # Requests keep the engine they started on and use the cache only while it
+                # follows that engine's file, so the cache moves first and serves the new one at once
+                prediction_cache.set_model_path(engine.model_path)
+                previous = model_loader.swap(engine)
+                print(f"✓ Hot-swapped model {previous.version} -> {engine.version}")
+        else:
+            registry_backoff.succeeded('live')
+        
+        config = model_registry.shadow_config()
+        current = (shadow_evaluator.version, shadow_evaluator.sample_rate) if shadow_evaluator else None
+        wanted = (config['version'], config['sample_rate']) if config else None
+        if wanted != current:
+            if shadow_evaluator is not None:
+                shadow_evaluator.stop()
+                shadow_evaluator = None
+            if config is not None:
+                engine = build_from_registry('shadow', config['version'], 'SHADOW')
+                if engine is not None:
+                    shadow_evaluator = ShadowEvaluator(engine, config['sample_rate'], max_pending=SHADOW_MAX_PENDING)
+                    print(f"✓ Shadowing {config['sample_rate']:.0%} of traffic with model {config['version']}")
+        elif config is None:
+            registry_backoff.succeeded('shadow')
+
+# Each worker follows the registry on its own, so a promotion reaches all of them
+registry_watcher = PeriodicTask(sync_with_registry, MODEL_REGISTRY_POLL_SECONDS, name='model-registry')
+
+if MODEL_BACKGROUND_LOAD:
+    model_loader.start()
+    registry_watcher.start()
+
+# Concurrent uploads share one forward pass instead of running batches of one
+batcher = MicroBatcher(
+    lambda batch: model_loader.engine.predict_with_embeddings(batch),
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS
+)
+
+# Decoding and inference run on a fixed number of threads; uploads that can't
+# start within INFERENCE_QUEUE_TIMEOUT_MS get a 429 instead of queueing forever
+inference_executor = BoundedExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_QUEUE_TIMEOUT_MS)
+
+def submit_shadow(img_array, probabilities, inference_ms):
+    """Score a plain prediction with the shadow model as well, when one is running"""
+    shadow = shadow_evaluator
+    if shadow is not None:
+        shadow.submit(img_array, probabilities, inference_ms)
+
+# Upload checks, decoding, caching, TTA, tiling and the cascade, shared with the other apps
+predictions = PredictionService(
+    model_loader, prediction_cache, inference_executor,
+    lambda batch, engine: batcher.predict(batch, predict_fn=engine.predict_with_embeddings),
+    backend=INFERENCE_BACKEND, img_size=IMG_SIZE, get_cascade=lambda: model_cascade, on_inference=submit_shadow,
+    max_upload_bytes=MAX_UPLOAD_BYTES, max_image_side=MAX_IMAGE_SIDE, max_image_pixels=MAX_IMAGE_PIXELS,
+    tta_views=TTA_VIEWS, tta_auto_threshold=TTA_AUTO_THRESHOLD, tile_max=TILE_MAX,
+    retry_after_seconds=MODEL_RETRY_AFTER_SECONDS
+)
+
+# Grad-CAM explanations are rendered on request only, on their own small pool
+# so they never take an inference worker away from /api/predict
+explanation_executor = BoundedExecutor(EXPLAIN_WORKERS, EXPLAIN_QUEUE_SIZE, EXPLAIN_QUEUE_TIMEOUT_MS, name='explain')
+explanation_cache = ExplanationCache(EXPLANATION_CACHE_DIR)
+
+# Requests borrow MySQL connections from here instead of connecting each time
+# (size, checkout timeout and lifetime come from the DB_POOL_* variables)
+db_pool = ConnectionPool()
+
+# Products and research labs change rarely but are read on every dashboard
+# load; keys are registered next to their loaders below
+catalog_cache = CatalogCache(CATALOG_TRIGGER_PATH)
+
+# Per-route request timing and stage histograms, scraped from /metrics
+instrument_app(app)
+register_serving_gauges(model_loader, upload_writer, batcher, inference_executor, db_pool)
+
 # Treatment and pesticide recommendations database (fallback when DB doesn't have data)
 treatment_database = {
     "Bacterialblight": {
@@ -97,6 +333,18 @@ treatment_database = {
     }
 }
 
+# Treatment and pesticides per disease, read from MySQL once and refreshed in
+# the background, so predictions make no read queries for them. Each worker
+# holds its own copy; POST /api/admin/recommendations/refresh reloads them all.
+recommendation_index = RecommendationIndex(
+    lambda: DatabaseConnection(pool=db_pool), class_indices.values(), treatment_database,
+    refresh_seconds=RECOMMENDATION_REFRESH_SECONDS, trigger_path=RECOMMENDATION_TRIGGER_PATH
+)
+recommendation_refresher = PeriodicTask(recommendation_index.check, RECOMMENDATION_CHECK_SECONDS,
+                                        name='recommendations')
+if MODEL_BACKGROUND_LOAD:
+    recommendation_refresher.start()
+
 # =====================================================
 # UTILITY FUNCTIONS
 # =====================================================
@@ -110,10 +358,46 @@ def verify_password(stored_hash, provided_password):
     return stored_hash == hash_password(provided_password)
 
 def get_db():
-    """Get database connection"""
-    db = DatabaseConnection()
-    db.connect()
-    return db
+    """
+    Database handle for the current request
+
+    It borrows a pooled connection on its first query, is shared by every
+    get_db() call in the request and is returned to the pool at teardown.
+    Outside a request (job workers, periodic tasks) each call gets its own
+    handle, which the caller disconnects.
+    """
+    if not has_request_context():
+        return DatabaseConnection(pool=db_pool)
+    if 'db' not in g:
+        g.db = DatabaseConnection(pool=db_pool)
+    return g.db
+
+def close_db(db):
+    """
+    Done with a get_db() handle: disconnect it outside a request; inside one
+    it is shared by the rest of the request and released at teardown
+    """
+    if not has_request_context():
+        db.disconnect()
+
+@app.after_request
+def profile_database(response):
+    """Record the request's query count and DB time, and report them in a Server-Timing header"""
+    db = g.get('db')
+    if db is not None and db.queries:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        DB_QUERIES.observe(db.queries, route)
+        DB_SECONDS.observe(db.query_seconds, route)
+        STAGE_SECONDS.observe(db.connect_seconds, 'db_connect')
+        response.headers.add('Server-Timing', f'db;desc="{db.queries} queries";dur={db.query_seconds * 1000:.1f}')
+    return response
+
+@app.teardown_request
+def release_database(exc):
+    """Return the request's connection to the pool"""
+    db = g.pop('db', None)
+    if db is not None:
+        db.disconnect()
 
 def login_required(f):
     """Decorator to require login"""
@@ -124,18 +408,25 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    """Decorator to require the X-Admin-Token header to match ADMIN_TOKEN"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin API is disabled (set ADMIN_TOKEN)'}), 403
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({'error': 'Invalid admin token'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(image_path):
-    """Preprocess image for model prediction"""
-    img = Image.open(image_path)
-    img = img.convert('RGB')
-    img = img.resize((IMG_SIZE, IMG_SIZE))
-    img_array = np.array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+@app.errorhandler(413)
+def upload_too_large(error):
+    """JSON 413 for request bodies over the route's upload limit"""
+    return jsonify({'error': f'Upload is too large (max {request.max_content_length / 1048576:.0f} MB)'}), 413
 
 # =====================================================
 # AUTHENTICATION ROUTES
@@ -200,8 +491,6 @@ def login():
     except Exception as e:
         print(f"Login error: {e}")
         return render_template('login.html', error='Login failed. Please try again.')
-    finally:
-        db.disconnect()
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -297,6 +586,7 @@ def register():
                 """
                 
                 db.execute_query(researcher_query, (user_id, full_name, organization, department, research_focus, data.get('phone_number', '')))
+                catalog_cache.invalidate('research_labs')
             
             return redirect(url_for('login'))
         
@@ -307,8 +597,6 @@ def register():
         print(f"Registration error: {e}")
         return render_template('login.html', error=f'Registration failed: {str(e)}')
     
-    finally:
-        db.disconnect()
 
 @app.route('/logout')
 def logout():
@@ -396,8 +684,6 @@ def get_farmer_profile():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/farmer/prediction-history', methods=['GET'])
 @login_required
@@ -433,113 +719,119 @@ def get_prediction_history():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
+
+def cached_json(etag_parts, build):
+    """
+    JSON response for cached catalog data, tagged with an ETag; when the
+    client's If-None-Match already has it, 304 is returned without building the body
+    """
+    etag = hashlib.sha1('|'.join(etag_parts).encode()).hexdigest()[:20]
+    response = Response(status=304) if request.if_none_match.contains(etag) else jsonify(build())
+    response.set_etag(etag)
+    # Browsers keep the copy but revalidate it on every fetch
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def load_research_labs():
+    """Registered researchers as listed on the farmer dashboard"""
+    query = """
+        SELECT 
+            r.id,
+            r.full_name,
+            r.organization,
+            r.department,
+            r.research_focus,
+            r.phone_number,
+            u.email,
+            u.whatsapp_number
+        FROM researchers r
+        JOIN users u ON r.user_id = u.id
+        ORDER BY r.full_name
+    """
+    
+    researchers = get_db().fetch_query(query)
+    
+    # Check if query failed
+    if researchers is None:
+        print("✗ Query returned None - database error")
+        raise RuntimeError('Database query failed')
+    
+    labs_list = []
+    for researcher in researchers:
+        labs_list.append({
+            'id': researcher[0],
+            'name': researcher[1] or 'Researcher',
+            'description': researcher[4] or 'Research in rice diseases and stress analysis',
+            'address': researcher[2] or 'N/A',  # organization
+            'city': researcher[3] or 'N/A',  # department
+            'state': 'N/A',
+            'specialization': researcher[3] or 'Rice Disease Research',  # department
+            'email': researcher[6] or 'N/A',
+            'whatsapp_number': researcher[7] or 'N/A',
+            'phone_number': researcher[5] or 'N/A',
+            'website': 'N/A'
+        })
+    
+    print(f"✓ Successfully fetched {len(labs_list)} researchers")
+    return labs_list
+
+catalog_cache.register('research_labs', load_research_labs, RESEARCH_LABS_TTL_SECONDS)
 
 @app.route('/api/farmer/research-labs', methods=['GET'])
 @login_required
 def get_research_labs():
     """Get all registered researchers"""
-    db = get_db()
-    
     try:
-        query = """
-            SELECT 
-                r.id,
-                r.full_name,
-                r.organization,
-                r.department,
-                r.research_focus,
-                r.phone_number,
-                u.email,
-                u.whatsapp_number
-            FROM researchers r
-            JOIN users u ON r.user_id = u.id
-            ORDER BY r.full_name
-        """
-        
-        researchers = db.fetch_query(query)
-        
-        # Check if query failed
-        if researchers is None:
-            print("✗ Query returned None - database error")
-            return jsonify({'error': 'Database query failed'}), 500
-        
-        labs_list = []
-        for researcher in researchers:
-            labs_list.append({
-                'id': researcher[0],
-                'name': researcher[1] or 'Researcher',
-                'description': researcher[4] or 'Research in rice diseases and stress analysis',
-                'address': researcher[2] or 'N/A',  # organization
-                'city': researcher[3] or 'N/A',  # department
-                'state': 'N/A',
-                'specialization': researcher[3] or 'Rice Disease Research',  # department
-                'email': researcher[6] or 'N/A',
-                'whatsapp_number': researcher[7] or 'N/A',
-                'phone_number': researcher[5] or 'N/A',
-                'website': 'N/A'
-            })
-        
-        print(f"✓ Successfully fetched {len(labs_list)} researchers")
-        return jsonify({'labs': labs_list}), 200
+        labs = catalog_cache.entry('research_labs')
+        return cached_json([labs.etag], lambda: {'labs': labs.value})
     
     except Exception as e:
         print(f"✗ Error fetching researchers: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
-    finally:
-        try:
-            db.disconnect()
-        except:
-            pass
+
+# Product type (as in ?type= and cart items) -> catalog table and cache key
+PRODUCT_TABLES = {'pesticide': 'pesticides', 'fertilizer': 'fertilizers'}
+
+def product_loader(table):
+    """Loader for one product table, keyed by product id"""
+    def load():
+        rows = get_db().fetch_query(
+            f"SELECT id, name, description, price_per_unit, unit_type, stock_quantity FROM {table}"
+        )
+        if rows is None:
+            raise RuntimeError('Database query failed')
+        return {row[0]: {
+            'id': row[0],
+            'name': row[1],
+            'description': row[2],
+            'price': float(row[3]),
+            'unit': row[4],
+            'stock': row[5]
+        } for row in rows}
+    return load
+
+for product_table in PRODUCT_TABLES.values():
+    catalog_cache.register(product_table, product_loader(product_table), CATALOG_TTL_SECONDS)
 
 @app.route('/api/farmer/products', methods=['GET'])
 @login_required
 def get_products():
     """Get pesticides and fertilizers"""
-    db = get_db()
-    
     try:
         product_type = request.args.get('type', 'all')  # pesticide, fertilizer, all
         
-        products = {'pesticides': [], 'fertilizers': []}
+        entries = {table: catalog_cache.entry(table) for kind, table in PRODUCT_TABLES.items()
+                   if product_type in ('all', kind)}
         
-        if product_type in ['all', 'pesticide']:
-            pest_query = "SELECT id, name, description, price_per_unit, unit_type, stock_quantity FROM pesticides"
-            pesticides = db.fetch_query(pest_query)
-            
-            for p in pesticides:
-                products['pesticides'].append({
-                    'id': p[0],
-                    'name': p[1],
-                    'description': p[2],
-                    'price': float(p[3]),
-                    'unit': p[4],
-                    'stock': p[5]
-                })
-        
-        if product_type in ['all', 'fertilizer']:
-            fert_query = "SELECT id, name, description, price_per_unit, unit_type, stock_quantity FROM fertilizers"
-            fertilizers = db.fetch_query(fert_query)
-            
-            for f in fertilizers:
-                products['fertilizers'].append({
-                    'id': f[0],
-                    'name': f[1],
-                    'description': f[2],
-                    'price': float(f[3]),
-                    'unit': f[4],
-                    'stock': f[5]
-                })
-        
-        return jsonify(products), 200
+        return cached_json([product_type] + [entry.etag for entry in entries.values()], lambda: {
+            table: list(entries[table].value.values()) if table in entries else []
+            for table in PRODUCT_TABLES.values()
+        })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/farmer/shops', methods=['GET'])
 @login_required
@@ -632,8 +924,6 @@ def get_shops():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 # =====================================================
 # API ROUTES FOR RESEARCHERS
@@ -678,8 +968,6 @@ def get_all_farmers():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 
 @app.route('/api/researcher/gene-analysis', methods=['POST'])
@@ -753,8 +1041,6 @@ def submit_gene_analysis():
     except Exception as e:
         print(f"✗ Error submitting gene analysis data: {str(e)}")
         return jsonify({'error': f'Database error: {str(e)}'}), 500
-    finally:
-        db.disconnect()
 
 
 @app.route('/api/researcher/gene-analysis', methods=['GET'])
@@ -813,8 +1099,6 @@ def get_gene_analysis():
     except Exception as e:
         print(f"✗ Error fetching gene analysis data: {str(e)}")
         return jsonify({'error': f'Database error: {str(e)}'}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/researcher/gene-analysis/<int:analysis_id>', methods=['DELETE'])
 @login_required
@@ -838,22 +1122,365 @@ def delete_gene_analysis(analysis_id):
     except Exception as e:
         print(f"✗ Error deleting gene analysis: {str(e)}")
         return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+# =====================================================
+# SIMILAR CASE SEARCH API
+# =====================================================
+
+def prediction_history_has_embeddings():
+    """
+    Whether prediction_history has the embedding column; databases created
+    before it need add_prediction_embeddings.sql. Assumed when MySQL can't
+    be reached at start-up, as code.sql creates it.
+    """
+    db = DatabaseConnection(pool=db_pool)
+    try:
+        present = db.has_column('prediction_history', 'embedding')
+    finally:
+        db.disconnect()
+    
+    if present is None:
+        print("⚠ Could not check prediction_history for the embedding column; assuming it exists")
+        return True
+    if not present:
+        print("⚠ prediction_history has no embedding column: predictions are logged without embeddings and "
+              "similar-case search is off. Run add_prediction_embeddings.sql to enable them.")
+    return present
+
+STORE_EMBEDDINGS = prediction_history_has_embeddings()
+
+# Leaf embeddings of past predictions, across all farmers. Each worker keeps
+# its own copy and follows prediction_history every EMBEDDING_SYNC_SECONDS.
+embedding_index = EmbeddingIndex()
+
+EMBEDDING_SYNC_QUERY = """
+    SELECT id, embedding FROM prediction_history
+    WHERE id > %s AND model_version = %s AND embedding IS NOT NULL
+    ORDER BY id
+    LIMIT %s
+"""
+
+def sync_embedding_index():
+    """
+    Add new prediction_history embeddings to the index
+
+    A row with a lower id can commit after one with a higher id, so each
+    sync re-reads the last EMBEDDING_SYNC_LOOKBACK_IDS ids before the
+    newest one indexed; the index skips the rows it already has.
+    """
+    if not model_loader.is_ready():
+        return
+    
+    # Different models embed leaves differently, so only the serving model's rows are comparable
+    version = model_loader.engine.version
+    if embedding_index.model_version != version:
+        embedding_index.reset(version)
+    
+    after_id = max(embedding_index.max_id - EMBEDDING_SYNC_LOOKBACK_IDS, 0)
+    db = get_db()
+    try:
+        while True:
+            rows = db.fetch_query(EMBEDDING_SYNC_QUERY, (after_id, version, EMBEDDING_SYNC_ROWS))
+            if not rows:
+                break
+            embedding_index.add([row[0] for row in rows], np.stack([decode_embedding(row[1]) for row in rows]))
+            after_id = rows[-1][0]
+            if len(rows) < EMBEDDING_SYNC_ROWS:
+                break
     finally:
         db.disconnect()
 
+embedding_sync = PeriodicTask(sync_embedding_index, EMBEDDING_SYNC_SECONDS, name='embedding-index')
+if MODEL_BACKGROUND_LOAD and STORE_EMBEDDINGS:
+    embedding_sync.start()
+
+SIMILAR_CASES_DISABLED = ('Similar-case search needs the prediction_history.embedding column '
+                          '(run add_prediction_embeddings.sql)')
+
+def embed_image(image_bytes, engine):
+    """Full-model probabilities and embedding of one upload; the cascade's fast model has no embedding"""
+    with stage_timer('decode'):
+        img_array = predictions.preprocess_image(image_bytes)
+    probabilities, embeddings = batcher.predict(img_array, predict_fn=engine.predict_with_embeddings)
+    return probabilities[0], embeddings[0]
+
+def similar_cases_k():
+    """Requested neighbour count, clamped to SIMILAR_CASES_MAX_K"""
+    k = request.args.get('k', SIMILAR_CASES_K, type=int)
+    return max(1, min(k, SIMILAR_CASES_MAX_K))
+
+def similar_case_rows(db, matches):
+    """prediction_history details for (id, similarity) matches, in match order"""
+    if not matches:
+        return []
+    
+    placeholders = ', '.join(['%s'] * len(matches))
+    query = f"""
+        SELECT ph.id, ph.image_filename, ph.disease_detected, ph.confidence_score, ph.model_version,
+               ph.prediction_date, f.city, f.state
+        FROM prediction_history ph
+        JOIN farmers f ON ph.farmer_id = f.id
+        WHERE ph.id IN ({placeholders})
+    """
+    rows = {row[0]: row for row in db.fetch_query(query, tuple(match_id for match_id, _ in matches)) or []}
+    
+    cases = []
+    for match_id, similarity in matches:
+        row = rows.get(match_id)
+        if row is None:
+            continue  # deleted since it was indexed
+        cases.append({
+            'prediction_id': row[0],
+            'image_url': url_for('uploaded_file', filename=row[1]),
+            'disease': disease_display_name(row[2]),
+            'disease_key': row[2],
+            'confidence': round(float(row[3]), 2) if row[3] is not None else None,
+            'model_version': row[4],
+            'prediction_date': row[5].isoformat() if hasattr(row[5], 'isoformat') else row[5],
+            'city': row[6],
+            'state': row[7],
+            'similarity': similarity
+        })
+    return cases
+
+@app.route('/api/researcher/similar-cases', methods=['POST'])
+@login_required
+def find_similar_cases():
+    """Past uploads whose leaves look most like an uploaded image"""
+    if session.get('user_type') != 'researcher':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if not model_loader.is_ready():
+        return predictions.model_unavailable()
+    
+    if not STORE_EMBEDDINGS:
+        return jsonify({'error': SIMILAR_CASES_DISABLED}), 501
+    
+    engine = model_loader.engine
+    if not engine.embedding_size:
+        return jsonify({'error': f'The {INFERENCE_BACKEND} backend does not produce leaf embeddings'}), 501
+    
+    try:
+        file = request.files.get('image')
+        if file is None or file.filename == '':
+            return jsonify({'error': 'No image uploaded'}), 400
+        
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file type'}), 400
+        
+        image_bytes = file.read()
+        predictions.check_image(image_bytes)
+        # The query image is embedded but not stored in anyone's history
+        probabilities, embedding = inference_executor.run(embed_image, image_bytes, engine)
+        
+        with stage_timer('similar_search'):
+            matches = embedding_index.search(embedding, similar_cases_k())
+        
+        cases = similar_case_rows(get_db(), matches)
+        
+        predicted_disease, confidence = classify(probabilities)
+        return jsonify({
+            'disease': disease_display_name(predicted_disease),
+            'disease_key': predicted_disease,
+            'confidence': round(confidence, 2),
+            'searched': len(embedding_index),
+            'cases': cases
+        }), 200
+    
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+    except ImageRejected as e:
+        return jsonify({'error': str(e)}), e.status
+    except Overloaded as e:
+        return server_busy(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/researcher/similar-cases/<int:prediction_id>', methods=['GET'])
+@login_required
+def get_similar_cases(prediction_id):
+    """Past uploads whose leaves look most like an existing prediction's"""
+    if session.get('user_type') != 'researcher':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if not STORE_EMBEDDINGS:
+        return jsonify({'error': SIMILAR_CASES_DISABLED}), 501
+    
+    db = get_db()
+    
+    try:
+        row = db.fetch_one("SELECT embedding, model_version FROM prediction_history WHERE id = %s", (prediction_id,))
+        if row is None:
+            return jsonify({'error': 'Prediction not found'}), 404
+        
+        if row[0] is None or row[1] != embedding_index.model_version:
+            return jsonify({'error': 'No embedding from the serving model for this prediction'}), 404
+        
+        with stage_timer('similar_search'):
+            matches = embedding_index.search(decode_embedding(row[0]), similar_cases_k(), exclude_id=prediction_id)
+        
+        return jsonify({
+            'prediction_id': prediction_id,
+            'searched': len(embedding_index),
+            'cases': similar_case_rows(db, matches)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # =====================================================
 # PREDICTION API (Enhanced with DB logging)
 # =====================================================
 
+PREDICTION_INSERT_QUERY = """
+    INSERT INTO prediction_history 
+    (farmer_id, image_filename, disease_detected, disease_id, confidence_score, model_version, embedding,
+     prediction_date)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# For databases without the embedding column (see prediction_history_has_embeddings)
+PREDICTION_INSERT_QUERY_WITHOUT_EMBEDDING = """
+    INSERT INTO prediction_history 
+    (farmer_id, image_filename, disease_detected, disease_id, confidence_score, model_version, prediction_date)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Predictions are logged off the request path in multi-row inserts; rows
+# MySQL can't take are kept in a local spill file and retried. The date is
+# part of the row so that late writes keep the time of the prediction.
+history_writer = WriteBehindBuffer(
+    PREDICTION_INSERT_QUERY if STORE_EMBEDDINGS else PREDICTION_INSERT_QUERY_WITHOUT_EMBEDDING,
+    lambda: DatabaseConnection(pool=db_pool), HISTORY_SPILL_PATH,
+    max_rows=HISTORY_FLUSH_ROWS, flush_ms=HISTORY_FLUSH_MS, max_pending=HISTORY_MAX_PENDING,
+    max_attempts=HISTORY_MAX_ATTEMPTS
+)
+if MODEL_BACKGROUND_LOAD:
+    history_writer.start()
+
+def history_row(farmer_id, unique_filename, predicted_disease, recommendation, confidence, engine, embedding):
+    """history_writer's INSERT parameters for one prediction"""
+    prediction_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not STORE_EMBEDDINGS:
+        return (farmer_id, unique_filename, predicted_disease, recommendation.disease_id, confidence, engine.version,
+                prediction_date)
+    return (farmer_id, unique_filename, predicted_disease, recommendation.disease_id, confidence, engine.version,
+            encode_embedding(embedding) if embedding is not None else None, prediction_date)
+
+def disease_display_name(disease_key):
+    """Human readable disease name from the treatment database, if available"""
+    return treatment_database.get(disease_key, {}).get('disease_name', disease_key)
+
+def unique_upload_filename(filename):
+    """Timestamped, collision-free name for storing an upload"""
+    file_ext = filename.rsplit('.', 1)[1].lower()
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{file_ext}"
+
+def classify(probabilities):
+    """Return (disease key, confidence %) for one row of model output"""
+    predicted_class_idx = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_class_idx]) * 100
+    return class_indices[str(predicted_class_idx)], confidence
+
+def prediction_response(engine, probabilities, unique_filename, tta_views=1):
+    """
+    Prediction payload shared by /api/predict and /api/predict/batch; the
+    treatment fields are appended from the Recommendation when it is rendered
+    """
+    predicted_disease, confidence = classify(probabilities)
+    return {
+        'success': True,
+        'disease': disease_display_name(predicted_disease),
+        'disease_key': predicted_disease,
+        'confidence': round(confidence, 2),
+        'top_predictions': engine.top_k(probabilities, TOP_K),
+        'tta_views': tta_views,
+        'uploaded_image': unique_filename,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def run_prediction(engine, image_bytes, unique_filename, user_id, tta=False, shed=True, tiles=False,
+                   log=None):
+    """
+    Classify one upload, log it to the farmer's history; returns (response, Recommendation)
+
+    The history row goes to log(row), history_writer.add by default.
+    """
+    tile_grid = None
+    embedding = None
+    if tiles:
+        # Field photos: score overlapping tiles instead of shrinking the whole frame
+        probabilities, tile_grid = inference_executor.run(predictions.infer_tiles, image_bytes, engine, shed=shed)
+        tta_views = 1
+    else:
+        probabilities, tta_views, embedding = predictions.predict_probabilities(image_bytes, engine, tta, shed)
+    
+    predicted_disease, confidence = classify(probabilities)
+    
+    db = get_db()
+    recommendation = EMPTY_RECOMMENDATION
+    
+    try:
+        # Get farmer ID
+        farmer_query = "SELECT id FROM farmers WHERE user_id = %s"
+        with stage_timer('db_farmer_lookup'):
+            farmer = db.fetch_one(farmer_query, (user_id,))
+        
+        if farmer:
+            farmer_id = farmer[0]
+            recommendation = recommendation_index.get(predicted_disease)
+            (log or history_writer.add)(history_row(farmer_id, unique_filename, predicted_disease,
+                                                    recommendation, confidence, engine, embedding))
+    
+    except Exception as e:
+        print(f"Database logging error: {e}")
+    
+    finally:
+        close_db(db)
+    
+    response = prediction_response(engine, probabilities, unique_filename, tta_views)
+    if tile_grid is not None:
+        response['tiles'] = tile_grid
+    return response, recommendation
+
+def run_prediction_job(payload, image_bytes):
+    """Job queue handler: same prediction as /api/predict, run off the request thread"""
+    if not model_loader.wait(JOB_MODEL_WAIT_SECONDS):
+        raise RuntimeError('Model is not available')
+    # Logged only once the queue records this attempt as the one that finished the job
+    history_rows = []
+    response, recommendation = run_prediction(model_loader.engine, image_bytes, payload['uploaded_image'],
+                                              payload['user_id'], payload.get('tta', False), shed=False,
+                                              tiles=payload.get('tiles', False), log=history_rows.append)
+    return Completed({**response, **recommendation.fields}, lambda: history_writer.add_many(history_rows))
+
+# Durable queue for /api/predict?async=1; jobs survive restarts and are
+# retried if the worker holding them dies
+prediction_jobs = JobQueue(JOB_QUEUE_PATH, run_prediction_job, workers=JOB_WORKERS)
+if MODEL_BACKGROUND_LOAD:
+    prediction_jobs.start()
+
 @app.route('/api/predict', methods=['POST'])
 @login_required
 def predict():
     """Handle image upload and prediction"""
+    run_async = request.args.get('async') == '1'
+    tta = request.values.get('tta') == '1'
+    tiles = request.values.get('tiles') == '1'
+    
+    # Queued jobs wait for the model themselves
+    if not run_async and not model_loader.is_ready():
+        return predictions.model_unavailable()
+    
     try:
-        if 'image' not in request.files:
+        # Multipart parsing happens on first access to request.files
+        with stage_timer('upload_parse'):
+            files = request.files
+        
+        if 'image' not in files:
             return jsonify({'error': 'No image uploaded'}), 400
         
-        file = request.files['image']
+        file = files['image']
         
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
@@ -862,139 +1489,414 @@ def predict():
             return jsonify({'error': 'Invalid file type'}), 400
         
         # Generate unique filename
-        file_ext = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{file_ext}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        
-        file.save(file_path)
-        
-        # Preprocess and predict
-        img_array = preprocess_image(file_path)
-        predictions = model.predict(img_array, verbose=0)
-        
-        predicted_class_idx = int(np.argmax(predictions[0]))
-        confidence = float(predictions[0][predicted_class_idx]) * 100
-        predicted_disease = class_indices[str(predicted_class_idx)]
-        
-        # Get pesticide recommendations from database
+        unique_filename = unique_upload_filename(file.filename)
+        
+        # Decode from memory; the original is written to disk in the background
+        with stage_timer('upload_read'):
+            image_bytes = file.read()
+        with stage_timer('upload_inspect'):
+            predictions.check_image(image_bytes)
+        with stage_timer('upload_save'):
+            upload_writer.save(unique_filename, image_bytes)
+        
+        if run_async:
+            job_id = prediction_jobs.submit(
+                {'user_id': session.get('user_id'), 'uploaded_image': unique_filename,
+                 'filename': file.filename, 'tta': tta, 'tiles': tiles},
+                image_bytes
+            )
+            status_url = url_for('get_prediction_job', job_id=job_id)
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': status_url,
+                'events_url': url_for('prediction_job_events', job_id=job_id)
+            }), 202, {'Location': status_url}
+        
+        result, recommendation = run_prediction(model_loader.engine, image_bytes, unique_filename,
+                                                session.get('user_id'), tta, tiles=tiles)
+        # The treatment fields are spliced in pre-serialized
+        return Response(recommendation.render(result), 200, mimetype='application/json')
+    
+    except RequestEntityTooLarge as e:
+        # Raised while request.files streams in the multipart body
+        return upload_too_large(e)
+    except ImageRejected as e:
+        return jsonify({'error': str(e)}), e.status
+    except Overloaded as e:
+        return server_busy(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def find_user_job(job_id):
+    """Job owned by the logged-in user, or None"""
+    job = prediction_jobs.get(job_id)
+    if job is None or job['payload'].get('user_id') != session.get('user_id'):
+        return None
+    return job
+
+def job_response(job):
+    """(body, status) for a job: the /api/predict payload once done, progress otherwise"""
+    if job['status'] == 'done':
+        body = dict(job['result'])
+        body.update({'job_id': job['job_id'], 'status': 'done'})
+        return body, 200
+    if job['status'] == 'failed':
+        return {'error': job['error'] or 'Prediction failed', 'job_id': job['job_id'], 'status': 'failed'}, 500
+    return {'job_id': job['job_id'], 'status': job['status'], 'attempts': job['attempts']}, 202
+
+@app.route('/api/predict/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_prediction_job(job_id):
+    """Poll an asynchronous prediction"""
+    job = find_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    body, status = job_response(job)
+    return jsonify(body), status
+
+@app.route('/api/predict/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def prediction_job_events(job_id):
+    """Server-Sent Events stream of a job's status, ending with its result"""
+    job = find_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        last_status = None
+        last_sent = time.monotonic()
+        current = job
+        while current is not None:
+            if current['status'] != last_status:
+                last_status = current['status']
+                body, _ = job_response(current)
+                event = 'result' if last_status in ('done', 'failed') else 'status'
+                yield f"event: {event}\ndata: {json.dumps(body)}\n\n"
+                last_sent = time.monotonic()
+                if event == 'result':
+                    return
+            elif time.monotonic() - last_sent > JOB_EVENTS_KEEPALIVE_SECONDS:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            
+            # Wakes immediately for jobs finished in this process; jobs run by
+            # another server worker are picked up on the next poll
+            prediction_jobs.wait_for_change(JOB_EVENTS_POLL_SECONDS)
+            current = prediction_jobs.get(job_id)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def collect_batch_uploads():
+    """Gather (filename, bytes) pairs from multipart 'images' files and/or a zip 'archive'"""
+    uploads = []
+    
+    for file in request.files.getlist('images'):
+        if file.filename and allowed_file(file.filename):
+            uploads.append((file.filename, file.read()))
+    
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        uploads.extend(read_archive(archive.read(), allowed_file, max(MAX_BATCH_IMAGES - len(uploads), 0),
+                                    MAX_ARCHIVE_MEMBER_BYTES, MAX_ARCHIVE_TOTAL_BYTES))
+    
+    return uploads
+
+@app.route('/api/predict/batch', methods=['POST'])
+@upload_limit(MAX_BATCH_UPLOAD_BYTES)
+@login_required
+def predict_batch():
+    """Predict many images in real batches, streaming one NDJSON line per image"""
+    if not model_loader.is_ready():
+        return predictions.model_unavailable()
+    
+    try:
+        uploads = collect_batch_uploads()
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Invalid zip archive'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not uploads:
+        return jsonify({'error': 'No images uploaded'}), 400
+    
+    if len(uploads) > MAX_BATCH_IMAGES:
+        return jsonify({'error': f'Too many images (max {MAX_BATCH_IMAGES})'}), 400
+    
+    # Once streaming starts each chunk waits for a worker, so refuse up front
+    try:
+        inference_executor.check_capacity()
+    except Overloaded as e:
+        return server_busy(e)
+    
+    engine = model_loader.engine
+    user_id = session.get('user_id')
+    
+    def generate():
         db = get_db()
-        pesticides_list = []
-        treatment_info = ""
-        application_method = ""
-        frequency = ""
+        succeeded = 0
+        saved = 0
         
         try:
-            user_id = session.get('user_id')
+            farmer = db.fetch_one("SELECT id FROM farmers WHERE user_id = %s", (user_id,))
+            farmer_id = farmer[0] if farmer else None
             
-            # Get farmer ID
-            farmer_query = "SELECT id FROM farmers WHERE user_id = %s"
-            farmer = db.fetch_one(farmer_query, (user_id,))
-            
-            if farmer:
-                farmer_id = farmer[0]
-                
-                # Get disease ID and treatment info
-                disease_query = "SELECT id, treatment FROM diseases WHERE name = %s"
-                disease = db.fetch_one(disease_query, (predicted_disease,))
+            for start in range(0, len(uploads), BATCH_MAX_SIZE):
+                chunk = []
+                pending_arrays = []
+                history_rows = []
+                lines = []
                 
-                if disease:
-                    disease_id = disease[0]
-                    treatment_info = disease[1] if disease[1] else ""
-                    
+                for index, (filename, image_bytes) in enumerate(uploads[start:start + BATCH_MAX_SIZE], start):
                     try:
-                        # Get recommended pesticides for this disease
-                        pesticide_query = """
-                            SELECT p.id, p.name, p.description, p.price_per_unit, p.unit_type,
-                                   p.effectiveness_rating, p.application_method, p.dosage_per_acre
-                            FROM pesticides p
-                            WHERE p.id IN (
-                                SELECT pesticide_id FROM disease_pesticide_mapping 
-                                WHERE disease_id = %s
-                            )
-                            ORDER BY p.effectiveness_rating DESC
-                            LIMIT 5
-                        """
-                        pesticides = db.fetch_query(pesticide_query, (disease_id,))
-                        
-                        print(f"Found {len(pesticides) if pesticides else 0} pesticides from database for disease_id {disease_id}")
-                        
-                        if pesticides:
-                            for pest in pesticides:
-                                pesticides_list.append({
-                                    'id': pest[0],
-                                    'name': pest[1],
-                                    'description': pest[2],
-                                    'price': float(pest[3]),
-                                    'unit': pest[4],
-                                    'effectiveness': float(pest[5]) if pest[5] else 0,
-                                    'application_method': pest[6],
-                                    'dosage_per_acre': pest[7]
-                                })
-                    except Exception as pest_error:
-                        print(f"Error querying pesticides: {pest_error}")
-                        # Continue to fallback
-                else:
-                    disease_id = None
-                    print(f"Disease '{predicted_disease}' not found in database")
-                
-                # If no pesticides from database, use fallback data
-                if not pesticides_list and predicted_disease in treatment_database:
-                    print(f"Using fallback data for '{predicted_disease}'")
-                    treatment_data = treatment_database[predicted_disease]
-                    treatment_info = treatment_data.get('description', '')
-                    application_method = treatment_data.get('application_method', '')
-                    frequency = treatment_data.get('frequency', '')
+                        predictions.check_image(image_bytes)
+                    except ImageRejected as e:
+                        yield json.dumps({'index': index, 'filename': filename, 'success': False,
+                                          'error': str(e)}) + '\n'
+                        continue
+                    
+                    unique_filename = unique_upload_filename(filename)
+                    upload_writer.save(unique_filename, image_bytes)
+                    
+                    cache_key = predictions.plain_cache_key(prediction_cache.key_for(image_bytes))
+                    entry = prediction_cache.get_entry(cache_key, engine.fingerprint)
+                    probabilities, embedding = entry if entry is not None else (None, None)
+                    
+                    if probabilities is None:
+                        try:
+                            pending_arrays.append(predictions.preprocess_image(image_bytes))
+                        except Exception as e:
+                            yield json.dumps({'index': index, 'filename': filename, 'success': False,
+                                              'error': f'Could not read image: {e}'}) + '\n'
+                            continue
                     
-                    for idx, pest in enumerate(treatment_data.get('pesticides', []), 1):
-                        pesticides_list.append({
-                            'id': idx,
-                            'name': pest['name'],
-                            'description': pest['details'],
-                            'price': 0,  # Price not available in fallback
-                            'unit': 'liter/kg',
-                            'effectiveness': 85,  # Default effectiveness
-                            'application_method': application_method,
-                            'dosage_per_acre': pest['dosage']
-                        })
-                    print(f"Added {len(pesticides_list)} pesticides from fallback data")
-                elif not pesticides_list:
-                    print(f"No fallback data found for '{predicted_disease}'")
+                    chunk.append((index, filename, unique_filename, cache_key, probabilities, embedding))
                 
-                # Insert prediction
-                insert_query = """
-                    INSERT INTO prediction_history 
-                    (farmer_id, image_filename, disease_detected, disease_id, confidence_score, model_version, prediction_date)
-                    VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                """
+                # One forward pass for every image in the chunk that missed the cache
+                if pending_arrays:
+                    batch_predictions = zip(*inference_executor.run(
+                        predictions.predict_arrays, np.concatenate(pending_arrays, axis=0), engine, shed=False
+                    ))
+                
+                for index, filename, unique_filename, cache_key, probabilities, embedding in chunk:
+                    if probabilities is None:
+                        probabilities, embedding = next(batch_predictions)
+                        prediction_cache.put(cache_key, probabilities, engine.fingerprint, embedding)
+                    
+                    predicted_disease, confidence = classify(probabilities)
+                    
+                    recommendation = EMPTY_RECOMMENDATION
+                    if farmer_id:
+                        recommendation = recommendation_index.get(predicted_disease)
+                        history_rows.append(history_row(farmer_id, unique_filename, predicted_disease,
+                                                        recommendation, confidence, engine, embedding))
+                    
+                    result = prediction_response(engine, probabilities, unique_filename)
+                    result.update({'index': index, 'filename': filename})
+                    succeeded += 1
+                    lines.append(recommendation.render(result) + '\n')
                 
-                db.execute_query(insert_query, (farmer_id, unique_filename, predicted_disease, disease_id, confidence, '1.0'))
+                # Logged by the write-behind buffer in multi-row inserts. A chunk's rows are
+                # queued before its results are sent: a client that disconnects mid-stream
+                # closes the generator at a yield, and must not cost the rows already classified
+                history_writer.add_many(history_rows)
+                saved += len(history_rows)
+                for line in lines:
+                    yield line
+            
+            yield json.dumps({'done': True, 'total': len(uploads), 'succeeded': succeeded,
+                              'saved': saved}) + '\n'
         
         except Exception as e:
-            print(f"Database logging error: {e}")
+            print(f"✗ Batch prediction error: {e}")
+            yield json.dumps({'done': True, 'error': str(e)}) + '\n'
         
         finally:
-            db.disconnect()
-        
-        # Get display name from treatment database if available
-        disease_display_name = predicted_disease
-        if predicted_disease in treatment_database:
-            disease_display_name = treatment_database[predicted_disease].get('disease_name', predicted_disease)
-        
-        return jsonify({
-            'success': True,
-            'disease': disease_display_name,
-            'disease_key': predicted_disease,
-            'confidence': round(confidence, 2),
-            'uploaded_image': unique_filename,
-            'timestamp': datetime.now().isoformat(),
-            'treatment': treatment_info,
-            'application_method': application_method,
-            'frequency': frequency,
-            'recommended_pesticides': pesticides_list
-        }), 200
+            close_db(db)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# =====================================================
+# PREDICTION EXPLANATIONS
+# =====================================================
+
+# Loaded on the first explanation request and reloaded when the serving model changes
+grad_cam = None
+grad_cam_lock = threading.Lock()
+
+def serving_keras_model_path():
+    """Keras model behind the serving engine; exported backends keep no gradients, so Grad-CAM uses this"""
+    version = model_loader.engine.version
+    return registry_model_path(None if version == MODEL_VERSION else version)
+
+def get_grad_cam(model_path):
+    """Grad-CAM for a Keras model, loading it when the serving model has changed"""
+    global grad_cam
+    with grad_cam_lock:
+        if grad_cam is None or grad_cam.model_path != model_path:
+            grad_cam = GradCam(model_path, IMG_SIZE)
+        return grad_cam
+
+def render_explanation(image_bytes, model_path, class_index):
+    """Grad-CAM overlay PNG for an upload (runs on an explanation executor thread)"""
+    with stage_timer('explain'):
+        heatmap, probabilities, class_index = get_grad_cam(model_path).explain(image_bytes, class_index,
+                                                                               MAX_IMAGE_PIXELS)
+        disease_key = class_indices[str(class_index)]
+        return render_overlay(image_bytes, heatmap, {
+            'disease_key': disease_key,
+            'disease': disease_display_name(disease_key),
+            'confidence': round(float(probabilities[class_index]) * 100, 2)
+        })
+
+@app.route('/api/predict/explain/<filename>', methods=['GET'])
+@login_required
+def explain_prediction(filename):
+    """
+    Grad-CAM heatmap overlay (PNG) for a stored upload
+
+    Explains the top prediction, or ?disease=<key> for another class. Farmers
+    can explain their own predictions, researchers anyone's.
+    """
+    user_type = session.get('user_type')
+    if user_type not in ('farmer', 'researcher'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if not model_loader.is_ready():
+        return predictions.model_unavailable()
+    
+    disease_key = request.args.get('disease')
+    class_index = None
+    if disease_key is not None:
+        class_index = next((int(index) for index, key in class_indices.items() if key == disease_key), None)
+        if class_index is None:
+            return jsonify({'error': f'Unknown disease: {disease_key}'}), 400
     
+    # A prediction made moments ago may still be in this worker's write-behind buffer
+    if history_writer.pending():
+        history_writer.flush(HISTORY_FLUSH_WAIT_SECONDS)
+    
+    db = get_db()
+    if user_type == 'farmer':
+        owned = db.fetch_one("""
+            SELECT ph.id FROM prediction_history ph
+            JOIN farmers f ON ph.farmer_id = f.id
+            WHERE ph.image_filename = %s AND f.user_id = %s
+        """, (filename, session.get('user_id')))
+    else:
+        owned = db.fetch_one("SELECT id FROM prediction_history WHERE image_filename = %s", (filename,))
+    
+    if owned is None:
+        return jsonify({'error': 'Prediction not found'}), 404
+    
+    model_path = serving_keras_model_path()
+    if not os.path.exists(model_path):
+        return jsonify({'error': f'Explanations need the Keras model ({model_path})'}), 501
+    
+    try:
+        with open(os.path.join(UPLOAD_FOLDER, filename), 'rb') as f:
+            image_bytes = f.read()
+    except OSError:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        path = explanation_cache.path_for(model_fingerprint(model_path), prediction_cache.key_for(image_bytes),
+                                          disease_key or 'top')
+        path = explanation_cache.get_or_render(
+            path, lambda: explanation_executor.run(render_explanation, image_bytes, model_path, class_index)
+        )
+        metadata = read_overlay_metadata(path)
+    except ImageRejected as e:
+        return jsonify({'error': str(e)}), e.status
+    except Overloaded as e:
+        return server_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    response = send_file(os.path.abspath(path), mimetype='image/png', max_age=86400)
+    response.headers['X-Explained-Disease'] = metadata.get('disease_key', '')
+    response.headers['X-Explained-Confidence'] = metadata.get('confidence', '')
+    return response
+
+# =====================================================
+# MODEL ADMIN API
+# =====================================================
+
+def model_admin_status():
+    """Registry contents and what this worker is serving"""
+    shadow = shadow_evaluator
+    return {
+        'live_version': model_registry.live_version(),
+        'serving_version': model_loader.engine.version if model_loader.engine is not None else None,
+        'versions': model_registry.versions(),
+        'shadow': shadow.get_stats() if shadow is not None else None,
+        'failed_loads': registry_backoff.get_stats()
+    }
+
+@app.route('/api/admin/models', methods=['GET'])
+@admin_required
+def list_models():
+    """Registered model versions, live version and shadow statistics"""
+    return jsonify(model_admin_status()), 200
+
+@app.route('/api/admin/catalog/invalidate', methods=['POST'])
+@admin_required
+def invalidate_catalog():
+    """Drop cached products and research labs after their tables change; body {"keys": [...]} limits it"""
+    keys = (request.get_json(silent=True) or {}).get('keys') or []
+    unknown = [key for key in keys if key not in ('research_labs', *PRODUCT_TABLES.values())]
+    if unknown:
+        return jsonify({'error': f'Unknown cache keys: {", ".join(map(str, unknown))}'}), 400
+    catalog_cache.invalidate(*keys)
+    return jsonify({'success': True, 'catalog_cache': catalog_cache.get_stats()}), 200
+
+@app.route('/api/admin/recommendations/refresh', methods=['POST'])
+@admin_required
+def refresh_recommendations():
+    """Reload treatment recommendations after the diseases or pesticides tables change"""
+    recommendation_index.trigger()
+    return jsonify({'success': True, 'recommendations': recommendation_index.get_stats()}), 200
+
+@app.route('/api/admin/models/<version>/promote', methods=['POST'])
+@admin_required
+def promote_model(version):
+    """Make a version live; this worker swaps now, the others on their next registry check"""
+    try:
+        model_registry.promote(version)
+        sync_with_registry()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Model swap failed: {e}'}), 500
+    
+    return jsonify(model_admin_status()), 200
+
+@app.route('/api/admin/models/<version>/shadow', methods=['POST'])
+@admin_required
+def shadow_model(version):
+    """Score a sampled fraction of traffic with a candidate version"""
+    data = request.get_json(silent=True) or {}
+    try:
+        model_registry.set_shadow(version, float(data.get('sample_rate', 0.1)))
+        sync_with_registry()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Could not start shadow model: {e}'}), 500
+    
+    return jsonify(model_admin_status()), 200
+
+@app.route('/api/admin/models/shadow', methods=['DELETE'])
+@admin_required
+def stop_shadow_model():
+    """Stop shadow scoring"""
+    model_registry.clear_shadow()
+    sync_with_registry()
+    return jsonify(model_admin_status()), 200
 
 # =====================================================
 # STATIC FILE ROUTES
@@ -1076,8 +1978,6 @@ def get_cart():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/farmer/cart', methods=['POST'])
 @login_required
@@ -1113,16 +2013,17 @@ def add_to_cart():
         
         cart_id = cart[0]
         
-        # Get product price
-        if product_type == 'pesticide':
-            product = db.fetch_one("SELECT price_per_unit FROM pesticides WHERE id = %s", (product_id,))
-        else:
-            product = db.fetch_one("SELECT price_per_unit FROM fertilizers WHERE id = %s", (product_id,))
+        # Get product price from the cached catalog
+        products = catalog_cache.get(PRODUCT_TABLES.get(product_type, 'fertilizers'))
+        try:
+            product = products.get(int(product_id))
+        except (TypeError, ValueError):
+            product = None
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        price_per_unit = float(product[0])
+        price_per_unit = product['price']
         total_price = price_per_unit * quantity
         
         # Check if item already in cart
@@ -1151,8 +2052,6 @@ def add_to_cart():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/farmer/cart/<int:item_id>', methods=['DELETE'])
 @login_required
@@ -1186,8 +2085,6 @@ def remove_from_cart(item_id):
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/farmer/stats', methods=['GET'])
 @login_required
@@ -1241,8 +2138,6 @@ def get_farmer_stats():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/farmer/checkout', methods=['POST'])
 @login_required
@@ -1330,15 +2225,31 @@ def checkout_cart():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check"""
+    shadow = shadow_evaluator
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None
+        'live': True,
+        'ready': model_loader.is_ready(),
+        'model_loaded': model_loader.is_ready(),
+        'model': model_loader.get_status(),
+        'backend': INFERENCE_BACKEND,
+        'batching': batcher.get_stats(),
+        'inference': inference_executor.get_stats(),
+        'database': db_pool.get_stats(),
+        'cascade': model_cascade.get_stats() if model_cascade is not None else None,
+        'recommendations': recommendation_index.get_stats(),
+        'prediction_log': history_writer.get_stats(),
+        'catalog_cache': catalog_cache.get_stats(),
+        'explanations': explanation_cache.get_stats(),
+        'embedding_index': embedding_index.get_stats(),
+        'prediction_cache': prediction_cache.get_stats(),
+        'jobs': prediction_jobs.get_stats(),
+        'tta': {'views': TTA_VIEWS, 'auto_threshold': TTA_AUTO_THRESHOLD},
+        'shadow': shadow.get_stats() if shadow is not None else None
     }), 200
 
 # =====================================================
@@ -1403,8 +2314,6 @@ def get_researcher_reports():
     except Exception as e:
         print(f"Error fetching reports: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/researcher/reports', methods=['POST'])
 def create_researcher_report():
@@ -1463,8 +2372,6 @@ def create_researcher_report():
     except Exception as e:
         print(f"Error creating report: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/researcher/reports/<int:report_id>', methods=['GET'])
 def get_researcher_report(report_id):
@@ -1521,8 +2428,6 @@ def get_researcher_report(report_id):
     except Exception as e:
         print(f"Error fetching report: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/researcher/reports/<int:report_id>', methods=['DELETE'])
 def delete_researcher_report(report_id):
@@ -1558,8 +2463,6 @@ def delete_researcher_report(report_id):
     except Exception as e:
         print(f"Error deleting report: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
 
 @app.route('/api/researcher/reports/<int:report_id>/download', methods=['GET'])
 def download_researcher_report(report_id):
@@ -1577,7 +2480,7 @@ if __name__ == '__main__':
     print("\n" + "=" * 60)
     print("Rice Stress Detector - Enhanced Flask Backend")
     print("=" * 60)
-    print(f"Model: {MODEL_PATH}")
+    print(f"Model: {SERVING_MODEL_PATH} ({INFERENCE_BACKEND})")
     print(f"Upload folder: {UPLOAD_FOLDER}")
     print("Features: Authentication, Dashboards, Database Integration")
     print("=" * 60)
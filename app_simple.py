@@ -5,16 +5,23 @@ Serves predictions and handles image uploads
 
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
-from keras.models import load_model
-from keras.preprocessing import image
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
-from PIL import Image
 import os
 import json
 from datetime import datetime
 import uuid
+from inference_engine import InferenceEngine, BackgroundModelLoader, backend_model_path
+from image_preprocessing import ImageRejected
+from upload_handling import InMemoryUploadRequest, UploadWriter
+from prediction_cache import PredictionCache
+from metrics import instrument_app, register_serving_gauges, stage_timer
+from inference_executor import BoundedExecutor, Overloaded
+from model_cascade import ModelCascade, CASCADE_CONFIG_PATH
+from prediction_service import PredictionService, server_busy
 
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 CORS(app)
 
 # Configuration
@@ -23,18 +30,83 @@ CLASS_INDICES_PATH = 'models/class_indices.json'
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 IMG_SIZE = 224
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')  # keras, tflite, onnx or graph
+SERVING_MODEL_PATH = backend_model_path(MODEL_PATH, INFERENCE_BACKEND)
+MODEL_RETRY_AFTER_SECONDS = 5
+MODEL_BACKGROUND_LOAD = os.getenv('MODEL_BACKGROUND_LOAD', '1') == '1'  # serve.py loads per worker
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0)) or None
+PREDICTION_CACHE_DIR = 'cache/predictions'
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_DISK_ENTRIES = int(os.getenv('PREDICTION_CACHE_DISK_ENTRIES', 100000))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 4))  # uploads decoded/classified at once
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', 32))
+INFERENCE_QUEUE_TIMEOUT_MS = float(os.getenv('INFERENCE_QUEUE_TIMEOUT_MS', 2000))
+MAX_UPLOAD_BYTES = int(float(os.getenv('MAX_UPLOAD_MB', 16)) * 1024 * 1024)  # request body, enforced while streaming
+MAX_IMAGE_SIDE = int(os.getenv('MAX_IMAGE_SIDE', 12000))
+MAX_IMAGE_PIXELS = int(float(os.getenv('MAX_IMAGE_MEGAPIXELS', 24)) * 1e6)  # after JPEG draft-mode scaling
+TOP_K = 3
+TTA_VIEWS = int(os.getenv('TTA_VIEWS', 8))  # test-time augmentation views per image
+TTA_AUTO_THRESHOLD = float(os.getenv('TTA_AUTO_THRESHOLD', 0))  # top-1 confidence %, 0 disables
+CASCADE = os.getenv('CASCADE', '0') == '1'  # fast model first, full model when unsure
+TILE_MAX = int(os.getenv('TILE_MAX', 12))  # tiles scored per image in tiled mode
+
+# Oversized bodies are refused with 413 while they stream in, before they are buffered
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
 # Create upload folder
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+upload_writer = UploadWriter(UPLOAD_FOLDER)
 
-# Load model and class indices
-print("Loading model...")
-model = load_model(MODEL_PATH)
-print("✓ Model loaded successfully")
-
+# Load class indices; the model itself loads in the background so that
+# routes that don't need it are served while TensorFlow starts up
 with open(CLASS_INDICES_PATH, 'r') as f:
     class_indices = json.load(f)
 
+prediction_cache = PredictionCache(SERVING_MODEL_PATH, PREDICTION_CACHE_DIR, max_entries=PREDICTION_CACHE_SIZE,
+                                   max_disk_entries=PREDICTION_CACHE_DISK_ENTRIES)
+
+# First stage of the model cascade; set by load_engine when CASCADE is on
+model_cascade = None
+
+def build_fast_engine(model_path):
+    """Load and warm up the cascade's fast model"""
+    engine = InferenceEngine(model_path, CLASS_INDICES_PATH, img_size=IMG_SIZE,
+                             backend=INFERENCE_BACKEND, num_threads=INFERENCE_THREADS)
+    engine.warmup()
+    return engine
+
+def load_engine():
+    """Load and warm up the inference engine (and the cascade's fast model)"""
+    global model_cascade
+    print("Loading model...")
+    engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE,
+                             backend=INFERENCE_BACKEND, num_threads=INFERENCE_THREADS)
+    engine.warmup()
+    if CASCADE:
+        model_cascade = ModelCascade.load(CASCADE_CONFIG_PATH, build_fast_engine)
+    return engine
+
+model_loader = BackgroundModelLoader(load_engine)
+if MODEL_BACKGROUND_LOAD:
+    model_loader.start()
+
+# Decoding and inference run on a fixed number of threads; uploads that can't
+# start within INFERENCE_QUEUE_TIMEOUT_MS get a 429 instead of queueing forever
+inference_executor = BoundedExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_QUEUE_TIMEOUT_MS)
+
+# Upload checks, decoding, caching, TTA, tiling and the cascade, shared with the other apps
+predictions = PredictionService(
+    model_loader, prediction_cache, inference_executor, lambda batch, engine: engine.predict(batch),
+    backend=INFERENCE_BACKEND, img_size=IMG_SIZE, get_cascade=lambda: model_cascade,
+    max_upload_bytes=MAX_UPLOAD_BYTES, max_image_side=MAX_IMAGE_SIDE, max_image_pixels=MAX_IMAGE_PIXELS,
+    tta_views=TTA_VIEWS, tta_auto_threshold=TTA_AUTO_THRESHOLD, tile_max=TILE_MAX,
+    retry_after_seconds=MODEL_RETRY_AFTER_SECONDS
+)
+
+# Per-route request timing and stage histograms, scraped from /metrics
+instrument_app(app)
+register_serving_gauges(model_loader, upload_writer, executor=inference_executor)
+
 # Treatment and pesticide recommendations database
 treatment_database = {
     "Bacterialblight": {
@@ -116,14 +188,10 @@ def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(image_path):
-    """Preprocess image for model prediction"""
-    img = Image.open(image_path)
-    img = img.convert('RGB')
-    img = img.resize((IMG_SIZE, IMG_SIZE))
-    img_array = np.array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+@app.errorhandler(413)
+def upload_too_large(error):
+    """JSON 413 for request bodies over the route's upload limit"""
+    return jsonify({'error': f'Upload is too large (max {request.max_content_length / 1048576:.0f} MB)'}), 413
 
 @app.route('/')
 def index():
@@ -138,12 +206,20 @@ def serve_static(path):
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """Handle image upload and prediction"""
+    if not model_loader.is_ready():
+        return predictions.model_unavailable()
+    
+    engine = model_loader.engine
+    
     try:
-        # Check if image was uploaded
-        if 'image' not in request.files:
+        # Check if image was uploaded; multipart parsing happens on first access
+        with stage_timer('upload_parse'):
+            files = request.files
+        
+        if 'image' not in files:
             return jsonify({'error': 'No image uploaded'}), 400
         
-        file = request.files['image']
+        file = files['image']
         
         # Check if file is valid
         if file.filename == '':
@@ -155,19 +231,27 @@ def predict():
         # Generate unique filename
         file_ext = file.filename.rsplit('.', 1)[1].lower()
         unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{file_ext}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
         
-        # Save uploaded file
-        file.save(file_path)
-        print(f"✓ Image saved: {file_path}")
+        # Decode from memory; the original is written to disk in the background
+        with stage_timer('upload_read'):
+            image_bytes = file.read()
+        with stage_timer('upload_inspect'):
+            predictions.check_image(image_bytes)
+        with stage_timer('upload_save'):
+            upload_writer.save(unique_filename, image_bytes)
         
-        # Preprocess and predict
-        img_array = preprocess_image(file_path)
-        predictions = model.predict(img_array, verbose=0)
+        tile_grid = None
+        if request.values.get('tiles') == '1':
+            # Field photos: score overlapping tiles instead of shrinking the whole frame
+            probabilities, tile_grid = inference_executor.run(predictions.infer_tiles, image_bytes, engine)
+            tta_views = 1
+        else:
+            probabilities, tta_views, _ = predictions.predict_probabilities(image_bytes, engine,
+                                                                            tta=request.values.get('tta') == '1')
         
         # Get predicted class and confidence
-        predicted_class_idx = int(np.argmax(predictions[0]))
-        confidence = float(predictions[0][predicted_class_idx]) * 100
+        predicted_class_idx = int(np.argmax(probabilities))
+        confidence = float(probabilities[predicted_class_idx]) * 100
         
         # Get class name
         predicted_disease = class_indices[str(predicted_class_idx)]
@@ -181,6 +265,8 @@ def predict():
             'disease': treatment_info.get('disease_name', predicted_disease),
             'disease_key': predicted_disease,
             'confidence': round(confidence, 2),
+            'top_predictions': engine.top_k(probabilities, TOP_K),
+            'tta_views': tta_views,
             'description': treatment_info.get('description', ''),
             'pesticides': treatment_info.get('pesticides', []),
             'application_method': treatment_info.get('application_method', ''),
@@ -190,10 +276,20 @@ def predict():
             'timestamp': datetime.now().isoformat()
         }
         
+        if tile_grid is not None:
+            response['tiles'] = tile_grid
+        
         print(f"✓ Prediction: {predicted_disease} ({confidence:.2f}%)")
         
         return jsonify(response), 200
         
+    except RequestEntityTooLarge as e:
+        # Raised while request.files streams in the multipart body
+        return upload_too_large(e)
+    except ImageRejected as e:
+        return jsonify({'error': str(e)}), e.status
+    except Overloaded as e:
+        return server_busy(e)
     except Exception as e:
         print(f"✗ Error: {str(e)}")
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
@@ -203,8 +299,16 @@ def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None,
-        'classes': list(class_indices.values())
+        'live': True,
+        'ready': model_loader.is_ready(),
+        'model_loaded': model_loader.is_ready(),
+        'model': model_loader.get_status(),
+        'backend': INFERENCE_BACKEND,
+        'classes': list(class_indices.values()),
+        'inference': inference_executor.get_stats(),
+        'cascade': model_cascade.get_stats() if model_cascade is not None else None,
+        'prediction_cache': prediction_cache.get_stats(),
+        'tta': {'views': TTA_VIEWS, 'auto_threshold': TTA_AUTO_THRESHOLD}
     }), 200
 
 @app.route('/uploads/<filename>')
@@ -216,7 +320,7 @@ if __name__ == '__main__':
     print("\n" + "=" * 50)
     print("Rice Disease Detection API Server")
     print("=" * 50)
-    print(f"Model: {MODEL_PATH}")
+    print(f"Model: {SERVING_MODEL_PATH} ({INFERENCE_BACKEND})")
     print(f"Classes: {list(class_indices.values())}")
     print(f"Upload folder: {UPLOAD_FOLDER}")
     print("=" * 50)
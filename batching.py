@@ -0,0 +1,176 @@
+"""
+Rice Disease Detection - Dynamic Micro-Batching
+Collects preprocessed images from concurrent requests and runs them
+through the model in a single forward pass
+"""
+
+import os
+import threading
+import queue
+import time
+import numpy as np
+
+# Upper bounds of the queue-depth histogram buckets
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class _PendingPrediction:
+    """A request waiting for its slice of a batched forward pass"""
+
+    __slots__ = ('inputs', 'rows', 'predict_fn', 'event', 'result', 'error')
+
+    def __init__(self, inputs, predict_fn):
+        self.inputs = inputs
+        self.rows = inputs.shape[0]
+        self.predict_fn = predict_fn
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Dynamic batching scheduler in front of a model's predict function"""
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10):
+        """
+        Start the batching worker thread
+
+        Args:
+            predict_fn (callable): Takes an (N, H, W, C) array, returns (N, classes) predictions
+                or a tuple of per-row arrays
+            max_batch_size (int): Maximum number of images per forward pass
+            max_wait_ms (float): Longest time the first request waits for others to join
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._batch_size_counts = {}
+        self._queue_depth_counts = {bucket: 0 for bucket in QUEUE_DEPTH_BUCKETS}
+        self._queue_depth_overflow = 0
+        self._batches = 0
+        self._images = 0
+
+        self._start()
+        # Threads don't survive fork(); pre-forked workers need their own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        """Create the request queue and start the worker thread"""
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def predict(self, img_array, timeout=None, predict_fn=None):
+        """
+        Queue an (N, H, W, C) array and block until its predictions are ready
+
+        predict_fn overrides the batcher's own, e.g. to pin a request to the
+        engine it started on; requests share a forward pass only with others
+        that use the same function.
+        """
+        pending = _PendingPrediction(img_array, predict_fn or self.predict_fn)
+        self._queue.put(pending)
+
+        if not pending.event.wait(timeout):
+            raise TimeoutError('Timed out waiting for batched prediction')
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def shutdown(self):
+        """Stop the worker thread after the queued requests are served"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def get_stats(self):
+        """Return queue depth and batch-size histograms for tuning"""
+        with self._stats_lock:
+            depth_histogram = {f'<={bucket}': count for bucket, count in self._queue_depth_counts.items()}
+            depth_histogram[f'>{QUEUE_DEPTH_BUCKETS[-1]}'] = self._queue_depth_overflow
+
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'images': self._images,
+                'avg_batch_size': round(self._images / self._batches, 2) if self._batches else 0,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_size_counts.items())},
+                'queue_depth_histogram': depth_histogram
+            }
+
+    def _run(self):
+        """Worker loop: gather a batch, run it, hand each caller its rows"""
+        running = True
+
+        while running:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            rows = first.rows
+            deadline = time.perf_counter() + self.max_wait
+
+            while rows < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    running = False
+                    break
+
+                batch.append(item)
+                rows += item.rows
+
+            # Usually one group; two only while a hot-swapped engine takes over
+            groups = {}
+            for item in batch:
+                groups.setdefault(item.predict_fn, []).append(item)
+            for predict_fn, group in groups.items():
+                self._record_batch(sum(item.rows for item in group), self._queue.qsize())
+                self._run_batch(group, predict_fn)
+
+    def _run_batch(self, batch, predict_fn):
+        """Run one forward pass and split the output back to the callers"""
+        try:
+            if len(batch) == 1:
+                inputs = batch[0].inputs
+            else:
+                inputs = np.concatenate([item.inputs for item in batch], axis=0)
+
+            predictions = predict_fn(inputs)
+
+            offset = 0
+            for item in batch:
+                # predict_fn may return several per-row outputs, e.g. (probabilities, embeddings)
+                if isinstance(predictions, tuple):
+                    item.result = tuple(output[offset:offset + item.rows] for output in predictions)
+                else:
+                    item.result = predictions[offset:offset + item.rows]
+                offset += item.rows
+        except Exception as e:
+            for item in batch:
+                item.error = e
+        finally:
+            for item in batch:
+                item.event.set()
+
+    def _record_batch(self, rows, queue_depth):
+        """Update the batch-size and queue-depth histograms"""
+        with self._stats_lock:
+            self._batches += 1
+            self._images += rows
+            self._batch_size_counts[rows] = self._batch_size_counts.get(rows, 0) + 1
+
+            for bucket in QUEUE_DEPTH_BUCKETS:
+                if queue_depth <= bucket:
+                    self._queue_depth_counts[bucket] += 1
+                    break
+            else:
+                self._queue_depth_overflow += 1
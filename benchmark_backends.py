@@ -0,0 +1,102 @@
+"""
+Rice Disease Detection - Backend Benchmark
+Compares latency, throughput and memory (RSS) of each inference backend
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+import numpy as np
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+RESULTS_DIR = 'results'
+IMG_SIZE = 224
+BACKEND_NAMES = ['keras', 'tflite', 'onnx']
+LATENCY_RUNS = 100
+THROUGHPUT_BATCH = 8
+THROUGHPUT_SECONDS = 10
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_backend(backend):
+    """Benchmark one backend in this process and return its measurements"""
+    from inference_engine import InferenceEngine
+
+    start = time.perf_counter()
+    engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=backend)
+    engine.warmup()
+    load_seconds = time.perf_counter() - start
+    rss_after_load = peak_rss_mb()
+
+    rng = np.random.default_rng(0)
+    single = rng.random((1, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+    batch = rng.random((THROUGHPUT_BATCH, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+
+    latencies = []
+    for _ in range(LATENCY_RUNS):
+        t0 = time.perf_counter()
+        engine.predict(single)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    images = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < THROUGHPUT_SECONDS:
+        engine.predict(batch)
+        images += THROUGHPUT_BATCH
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'backend': backend,
+        'load_seconds': round(load_seconds, 2),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'throughput_img_per_s': round(images / elapsed, 1),
+        'rss_after_load_mb': round(rss_after_load, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+if __name__ == '__main__':
+    # Child mode: measure one backend so RSS is not shared between runtimes
+    if len(sys.argv) == 3 and sys.argv[1] == '--backend':
+        print(json.dumps(run_backend(sys.argv[2])))
+        sys.exit(0)
+
+    print("=" * 50)
+    print("Backend Benchmark")
+    print("=" * 50)
+
+    results = []
+    for backend in BACKEND_NAMES:
+        proc = subprocess.run(
+            [sys.executable, __file__, '--backend', backend],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"⚠ {backend}: skipped ({proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'})")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'Backend':<8} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'RSS MB':>8}")
+    print("-" * 44)
+    for r in results:
+        print(f"{r['backend']:<8} {r['latency_p50_ms']:>8.2f} {r['latency_p95_ms']:>8.2f} "
+              f"{r['throughput_img_per_s']:>8.1f} {r['peak_rss_mb']:>8.1f}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, 'benchmark_backends.json')
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    print(f"\n✓ Results saved to {output_path}")
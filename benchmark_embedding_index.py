@@ -0,0 +1,127 @@
+"""
+Rice Disease Detection - Similar-Case Index Benchmark
+Measures query latency and recall@k of the leaf embedding index against an
+exact scan, at the collection sizes where it switches from a scan to IVF
+"""
+
+import os
+
+# The README quotes single-core figures; numpy's BLAS must not fan out
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(variable, '1')
+
+import sys
+import json
+import time
+import numpy as np
+from embedding_index import EmbeddingIndex, BRUTE_FORCE_MAX
+
+# Configuration
+RESULTS_DIR = 'results'
+SIZES = (20000, 50000, 200000)
+DIM = 256  # width of the classifier's penultimate dense layer
+CLUSTERS = 2000  # leaves photographed alike: same disease, stage and lighting
+CLUSTER_SPREAD = 0.35
+QUERIES = 200
+K = 10
+SYNC_ROWS = 1000  # rows per insert, as the index sync adds them
+
+
+def synthetic_embeddings(count, rng):
+    """
+    Unit vectors drawn around CLUSTERS centres; real leaf embeddings are
+    clustered as well, while uniformly random ones would have no neighbours
+    worth finding
+    """
+    centres = rng.standard_normal((CLUSTERS, DIM)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    vectors = centres[rng.integers(0, CLUSTERS, count)]
+    vectors = vectors + rng.standard_normal((count, DIM)).astype(np.float32) * CLUSTER_SPREAD / np.sqrt(DIM)
+    return vectors, centres
+
+
+def query_vectors(centres, rng):
+    """New uploads: fresh draws around the same centres"""
+    queries = centres[rng.integers(0, len(centres), QUERIES)]
+    return queries + rng.standard_normal((QUERIES, DIM)).astype(np.float32) * CLUSTER_SPREAD / np.sqrt(DIM)
+
+
+def exact_top_k(vectors, queries):
+    """Ground truth: row indices of the K most similar stored vectors per query"""
+    stored = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    stored = stored.astype(np.float16).astype(np.float32)
+    truth = []
+    for query in queries:
+        scores = stored @ (query / np.linalg.norm(query))
+        top = np.argpartition(-scores, K - 1)[:K]
+        truth.append(set(top.tolist()))
+    return truth
+
+
+def benchmark(size, rng):
+    vectors, centres = synthetic_embeddings(size, rng)
+    queries = query_vectors(centres, rng)
+
+    index = EmbeddingIndex()
+    start = time.perf_counter()
+    for first in range(0, size, SYNC_ROWS):
+        rows = np.arange(first, min(first + SYNC_ROWS, size))
+        index.add(rows + 1, vectors[rows])  # prediction_history ids start at 1
+    build_seconds = time.perf_counter() - start
+
+    for query in queries[:10]:
+        index.search(query, K)
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        matches = index.search(query, K)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append({match_id - 1 for match_id, _ in matches})
+
+    truth = exact_top_k(vectors, queries)
+    recall = np.mean([len(hits & expected) / K for hits, expected in zip(found, truth)])
+    latencies = np.array(latencies)
+    stats = index.get_stats()
+    return {
+        'vectors': size,
+        'mode': stats['mode'],
+        'lists': stats['lists'],
+        'nprobe': stats['nprobe'],
+        'build_seconds': round(build_seconds, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        f'recall_at_{K}': round(float(recall), 4),
+        'memory_mb': stats['memory_mb']
+    }
+
+
+if __name__ == '__main__':
+    # python benchmark_embedding_index.py [size ...]
+    sizes = [int(arg) for arg in sys.argv[1:]] or list(SIZES)
+
+    print("=" * 50)
+    print("Similar-Case Index Benchmark")
+    print("=" * 50)
+    print(f"{DIM}-d embeddings around {CLUSTERS} centres, {QUERIES} queries, "
+          f"exact scan up to {BRUTE_FORCE_MAX} vectors")
+
+    rng = np.random.default_rng(0)
+    results = {'dim': DIM, 'clusters': CLUSTERS, 'queries': QUERIES, 'k': K, 'sizes': []}
+    for size in sizes:
+        results['sizes'].append(benchmark(size, rng))
+
+    print(f"\n{'Vectors':>9} {'Mode':>6} {'Lists':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+          f"{f'Recall@{K}':>10} {'Build (s)':>10} {'MB':>7}")
+    print("-" * 72)
+    for r in results['sizes']:
+        print(f"{r['vectors']:>9} {r['mode']:>6} {r['lists']:>6} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r[f'recall_at_{K}']:>10.4f} {r['build_seconds']:>10.2f} {r['memory_mb']:>7.1f}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, 'benchmark_embedding_index.json')
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    print(f"\n✓ Results saved to {output_path}")
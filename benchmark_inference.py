@@ -0,0 +1,78 @@
+"""
+Rice Disease Detection - Inference Benchmark
+Compares per-image latency of keras model.predict() against the shared InferenceEngine
+"""
+
+import os
+import json
+import time
+import numpy as np
+from tensorflow import keras
+from inference_engine import InferenceEngine
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+RESULTS_DIR = 'results'
+IMG_SIZE = 224
+BATCH_SIZES = [1, 4, 8]
+WARMUP_RUNS = 5
+TIMED_RUNS = 50
+
+
+def time_per_image(fn, batch):
+    """Return per-image latency statistics in milliseconds"""
+    for _ in range(WARMUP_RUNS):
+        fn(batch)
+
+    samples = []
+    for _ in range(TIMED_RUNS):
+        start = time.perf_counter()
+        fn(batch)
+        samples.append((time.perf_counter() - start) * 1000 / batch.shape[0])
+
+    samples = np.array(samples)
+    return {
+        'mean_ms': round(float(samples.mean()), 3),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3)
+    }
+
+
+if __name__ == '__main__':
+    print("=" * 50)
+    print("Inference Benchmark")
+    print("=" * 50)
+
+    keras_model = keras.models.load_model(MODEL_PATH)
+    engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE)
+    engine.warmup()
+
+    rng = np.random.default_rng(0)
+    results = []
+
+    for batch_size in BATCH_SIZES:
+        batch = rng.random((batch_size, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+
+        baseline = time_per_image(lambda x: keras_model.predict(x, verbose=0), batch)
+        traced = time_per_image(engine.predict, batch)
+
+        results.append({
+            'batch_size': batch_size,
+            'model_predict': baseline,
+            'inference_engine': traced,
+            'speedup': round(baseline['mean_ms'] / traced['mean_ms'], 2)
+        })
+
+    print(f"\n{'Batch':>6} {'model.predict (ms/img)':>24} {'engine (ms/img)':>18} {'Speedup':>9}")
+    print("-" * 60)
+    for r in results:
+        print(f"{r['batch_size']:>6} {r['model_predict']['mean_ms']:>24.3f} "
+              f"{r['inference_engine']['mean_ms']:>18.3f} {r['speedup']:>8.2f}x")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, 'benchmark_inference.json')
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    print(f"\n✓ Results saved to {output_path}")
@@ -0,0 +1,140 @@
+"""
+Rice Disease Detection - Preprocessing Benchmark
+Compares end-to-end per-request CPU time and peak memory of decoding with PIL
+in Python against the 'graph' export that decodes raw bytes inside the model
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import resource
+import tracemalloc
+import subprocess
+import numpy as np
+from PIL import Image
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+DATA_DIR = 'Rice Leaf Disease Images'
+RESULTS_DIR = 'results'
+IMG_SIZE = 224
+MODES = ['pil', 'graph']
+SAMPLE_IMAGES = 16
+SYNTHETIC_SIZE = (1600, 1200)
+WARMUP_RUNS = 5
+TIMED_RUNS = 100
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def load_uploads():
+    """Raw JPEG bytes as a phone would upload them (dataset images, or synthetic ones)"""
+    uploads = []
+    if os.path.isdir(DATA_DIR):
+        for class_name in sorted(os.listdir(DATA_DIR)):
+            class_dir = os.path.join(DATA_DIR, class_name)
+            if not os.path.isdir(class_dir):
+                continue
+            for filename in sorted(os.listdir(class_dir))[:SAMPLE_IMAGES // 4]:
+                with open(os.path.join(class_dir, filename), 'rb') as f:
+                    uploads.append(f.read())
+
+    if not uploads:
+        rng = np.random.default_rng(0)
+        for _ in range(SAMPLE_IMAGES):
+            pixels = rng.integers(0, 256, SYNTHETIC_SIZE[::-1] + (3,), dtype=np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+            uploads.append(buffer.getvalue())
+
+    return uploads
+
+
+def run_mode(mode):
+    """Benchmark one preprocessing path in this process and return its measurements"""
+    from inference_engine import InferenceEngine
+    from image_preprocessing import decode_image, encoded_batch
+
+    backend = 'graph' if mode == 'graph' else 'keras'
+    engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=backend)
+    engine.warmup()
+    rss_after_load = peak_rss_mb()
+
+    if mode == 'graph':
+        def handle(data):
+            return engine.predict(encoded_batch(data))[0]
+    else:
+        def handle(data):
+            return engine.predict(decode_image(data, IMG_SIZE))[0]
+
+    uploads = load_uploads()
+    for i in range(WARMUP_RUNS):
+        handle(uploads[i % len(uploads)])
+
+    wall_ms, cpu_ms = [], []
+    for i in range(TIMED_RUNS):
+        data = uploads[i % len(uploads)]
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        handle(data)
+        wall_ms.append((time.perf_counter() - wall_start) * 1000)
+        cpu_ms.append((time.process_time() - cpu_start) * 1000)
+
+    # Python-heap allocations for one request (the arrays built before the model call)
+    tracemalloc.start()
+    handle(uploads[0])
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'mode': mode,
+        'backend': backend,
+        'wall_p50_ms': round(float(np.percentile(wall_ms, 50)), 3),
+        'wall_p95_ms': round(float(np.percentile(wall_ms, 95)), 3),
+        'cpu_mean_ms': round(float(np.mean(cpu_ms)), 3),
+        'python_peak_kb': round(python_peak / 1024, 1),
+        'rss_after_load_mb': round(rss_after_load, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+if __name__ == '__main__':
+    # Child mode: measure one path so RSS is not shared between runtimes
+    if len(sys.argv) == 3 and sys.argv[1] == '--mode':
+        print(json.dumps(run_mode(sys.argv[2])))
+        sys.exit(0)
+
+    print("=" * 50)
+    print("Preprocessing Benchmark")
+    print("=" * 50)
+
+    results = []
+    for mode in MODES:
+        proc = subprocess.run(
+            [sys.executable, __file__, '--mode', mode],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"⚠ {mode}: skipped ({proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'})")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'Mode':<6} {'p50 ms':>8} {'p95 ms':>8} {'CPU ms':>8} {'Py KB':>9} {'RSS MB':>8}")
+    print("-" * 52)
+    for r in results:
+        print(f"{r['mode']:<6} {r['wall_p50_ms']:>8.2f} {r['wall_p95_ms']:>8.2f} {r['cpu_mean_ms']:>8.2f} "
+              f"{r['python_peak_kb']:>9.1f} {r['peak_rss_mb']:>8.1f}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, 'benchmark_preprocessing.json')
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    print(f"\n✓ Results saved to {output_path}")
@@ -0,0 +1,133 @@
+"""
+Rice Disease Detection - Test-Time Augmentation Benchmark
+Measures the latency cost of each extra TTA view (decode + one batched
+forward pass) and, when the dataset is available, the accuracy it buys
+"""
+
+import os
+import io
+import json
+import time
+import numpy as np
+from PIL import Image
+from inference_engine import InferenceEngine
+from image_preprocessing import decode_image, decode_tta_views, TTA_VIEW_NAMES
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+DATA_DIR = 'Rice Leaf Disease Images'
+RESULTS_DIR = 'results'
+IMG_SIZE = 224
+BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')
+IMAGES_PER_CLASS = 25
+WARMUP_RUNS = 5
+TIMED_RUNS = 50
+
+
+def sample_upload():
+    """A phone-sized JPEG to time against (first dataset image, or a synthetic one)"""
+    if os.path.isdir(DATA_DIR):
+        for class_name in sorted(os.listdir(DATA_DIR)):
+            class_dir = os.path.join(DATA_DIR, class_name)
+            if os.path.isdir(class_dir) and os.listdir(class_dir):
+                with open(os.path.join(class_dir, sorted(os.listdir(class_dir))[0]), 'rb') as f:
+                    return f.read()
+
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (1200, 1600, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def labelled_samples(class_indices):
+    """(image bytes, class index) pairs from the dataset, or [] if it is absent"""
+    if not os.path.isdir(DATA_DIR):
+        return []
+
+    class_ids = {name: int(idx) for idx, name in class_indices.items()}
+    samples = []
+    for class_name in sorted(os.listdir(DATA_DIR)):
+        class_dir = os.path.join(DATA_DIR, class_name)
+        if not os.path.isdir(class_dir) or class_name not in class_ids:
+            continue
+        for filename in sorted(os.listdir(class_dir))[-IMAGES_PER_CLASS:]:
+            with open(os.path.join(class_dir, filename), 'rb') as f:
+                samples.append((f.read(), class_ids[class_name]))
+    return samples
+
+
+def time_request(fn):
+    """Return end-to-end latency statistics in milliseconds"""
+    for _ in range(WARMUP_RUNS):
+        fn()
+
+    samples = []
+    for _ in range(TIMED_RUNS):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples = np.array(samples)
+    return {
+        'mean_ms': round(float(samples.mean()), 3),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3)
+    }
+
+
+if __name__ == '__main__':
+    print("=" * 50)
+    print("Test-Time Augmentation Benchmark")
+    print("=" * 50)
+
+    engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=BACKEND)
+    engine.warmup()
+    upload = sample_upload()
+
+    baseline = time_request(lambda: engine.predict(decode_image(upload, IMG_SIZE)))
+    results = {'backend': BACKEND, 'baseline': baseline, 'views': []}
+
+    for num_views in range(1, len(TTA_VIEW_NAMES) + 1):
+        latency = time_request(lambda: engine.predict(decode_tta_views(upload, IMG_SIZE, num_views)).mean(axis=0))
+        results['views'].append({
+            'views': num_views,
+            'added_view': TTA_VIEW_NAMES[num_views - 1],
+            'latency': latency,
+            'overhead': round(latency['mean_ms'] / baseline['mean_ms'], 2)
+        })
+
+    print(f"\nBaseline (no TTA): {baseline['mean_ms']:.2f} ms")
+    print(f"\n{'Views':>6} {'Added view':>18} {'p50 (ms)':>10} {'p95 (ms)':>10} {'Overhead':>9}")
+    print("-" * 57)
+    for r in results['views']:
+        print(f"{r['views']:>6} {r['added_view']:>18} {r['latency']['p50_ms']:>10.2f} "
+              f"{r['latency']['p95_ms']:>10.2f} {r['overhead']:>8.2f}x")
+
+    samples = labelled_samples(engine.class_indices)
+    if samples:
+        labels = np.array([label for _, label in samples])
+        plain = np.array([np.argmax(engine.predict(decode_image(data, IMG_SIZE))[0]) for data, _ in samples])
+        results['accuracy'] = {'images': len(samples), 'baseline': round(float(np.mean(plain == labels)), 4)}
+
+        for num_views in (2, 4, 8, len(TTA_VIEW_NAMES)):
+            predicted = np.array([
+                np.argmax(engine.predict(decode_tta_views(data, IMG_SIZE, num_views)).mean(axis=0))
+                for data, _ in samples
+            ])
+            results['accuracy'][f'tta_{num_views}'] = round(float(np.mean(predicted == labels)), 4)
+
+        print(f"\nTop-1 accuracy on {len(samples)} images:")
+        for name, value in results['accuracy'].items():
+            if name != 'images':
+                print(f"  {name:>10}: {value * 100:.2f}%")
+    else:
+        print(f"\n⚠ '{DATA_DIR}' not found, skipping accuracy comparison")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, 'benchmark_tta.json')
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    print(f"\n✓ Results saved to {output_path}")
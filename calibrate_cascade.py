@@ -0,0 +1,130 @@
+"""
+Rice Disease Detection - Model Cascade Calibration
+Scores the fast and full models on the validation split, picks the lowest
+fast-model confidence threshold that keeps accuracy within budget, and
+reports the fast-path share, latency saved and accuracy delta
+
+Usage:
+    python calibrate_cascade.py [max_accuracy_drop]
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from datetime import datetime
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from inference_engine import InferenceEngine
+from image_preprocessing import decode_image
+from model_cascade import (FAST_MODEL_PATH, CASCADE_CONFIG_PATH, MAX_ACCURACY_DROP,
+                           calibrate_threshold, cascade_outcome)
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+DATA_DIR = 'Rice Leaf Disease Images'
+RESULTS_DIR = 'results'
+IMG_SIZE = 224
+BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')
+SCORE_BATCH_SIZE = 8
+WARMUP_RUNS = 5
+TIMED_RUNS = 50
+
+
+def validation_files():
+    """(paths, labels) of the validation split train_model.py and train_fast_model.py hold out"""
+    generator = ImageDataGenerator(validation_split=0.2).flow_from_directory(
+        DATA_DIR, target_size=(IMG_SIZE, IMG_SIZE), class_mode='sparse', subset='validation', shuffle=False
+    )
+    return generator.filepaths, np.asarray(generator.classes)
+
+
+def score(engine, paths):
+    """Model output for every image, decoded the same way the apps decode uploads"""
+    outputs = []
+    for start in range(0, len(paths), SCORE_BATCH_SIZE):
+        batch = []
+        for path in paths[start:start + SCORE_BATCH_SIZE]:
+            with open(path, 'rb') as f:
+                batch.append(decode_image(f.read(), IMG_SIZE))
+        outputs.append(engine.predict(np.concatenate(batch, axis=0)))
+    return np.concatenate(outputs, axis=0)
+
+
+def time_single_image(engine, image):
+    """Mean latency in milliseconds of one single-image forward pass"""
+    for _ in range(WARMUP_RUNS):
+        engine.predict(image)
+
+    start = time.perf_counter()
+    for _ in range(TIMED_RUNS):
+        engine.predict(image)
+    return (time.perf_counter() - start) * 1000 / TIMED_RUNS
+
+
+if __name__ == '__main__':
+    max_accuracy_drop = float(sys.argv[1]) if len(sys.argv) > 1 else MAX_ACCURACY_DROP
+
+    print("=" * 50)
+    print("Model Cascade Calibration")
+    print("=" * 50)
+
+    fast_engine = InferenceEngine(FAST_MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=BACKEND)
+    full_engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=BACKEND)
+    fast_engine.warmup()
+    full_engine.warmup()
+
+    paths, labels = validation_files()
+    print(f"✓ Scoring {len(paths)} validation images with both models...")
+    fast_probs = score(fast_engine, paths)
+    full_probs = score(full_engine, paths)
+
+    threshold, outcome = calibrate_threshold(fast_probs, full_probs, labels, max_accuracy_drop)
+
+    with open(paths[0], 'rb') as f:
+        image = decode_image(f.read(), IMG_SIZE)
+    fast_ms = time_single_image(fast_engine, image)
+    full_ms = time_single_image(full_engine, image)
+    # Every image pays for the fast model; the unsure ones pay for the full model too
+    cascade_ms = fast_ms + (1 - outcome['fast_path_fraction']) * full_ms
+
+    report = {
+        'backend': BACKEND,
+        'images': len(paths),
+        'max_accuracy_drop': max_accuracy_drop,
+        'validation': outcome,
+        'accuracy_delta': round(outcome['accuracy_cascade'] - outcome['accuracy_full'], 4),
+        'latency': {
+            'fast_ms': round(fast_ms, 3),
+            'full_ms': round(full_ms, 3),
+            'cascade_ms': round(cascade_ms, 3),
+            'saved_ms': round(full_ms - cascade_ms, 3),
+            'saved_fraction': round(1 - cascade_ms / full_ms, 4)
+        },
+        'thresholds': [cascade_outcome(fast_probs, full_probs, labels, t) for t in (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)]
+    }
+
+    config = {
+        'fast_model': FAST_MODEL_PATH,
+        'threshold': threshold,
+        'calibrated_at': datetime.now().isoformat(),
+        'validation': outcome
+    }
+    with open(CASCADE_CONFIG_PATH, 'w') as f:
+        json.dump(config, f, indent=4)
+
+    print(f"\nThreshold:          {threshold:.4f} (max accuracy drop {max_accuracy_drop * 100:.2f}%)")
+    print(f"Fast-path traffic:  {outcome['fast_path_fraction'] * 100:.1f}%")
+    print(f"Accuracy full:      {outcome['accuracy_full'] * 100:.2f}%")
+    print(f"Accuracy cascade:   {outcome['accuracy_cascade'] * 100:.2f}% ({report['accuracy_delta'] * 100:+.2f}%)")
+    print(f"Latency full:       {full_ms:.2f} ms")
+    print(f"Latency cascade:    {cascade_ms:.2f} ms (saves {report['latency']['saved_ms']:.2f} ms per image)")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, 'cascade_report.json')
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print(f"\n✓ Cascade config saved to {CASCADE_CONFIG_PATH}")
+    print(f"✓ Report saved to {output_path}")
@@ -0,0 +1,154 @@
+"""
+Rice Disease Detection - Catalog Cache
+Read-through TTL cache for catalog queries (products, research labs) that
+change rarely but are read on every dashboard load; concurrent misses for
+a key run one query, and every entry carries an ETag for conditional GETs
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+# How often get() looks at the trigger file for invalidations from other workers
+TRIGGER_CHECK_SECONDS = 1
+
+
+class CacheEntry:
+    """A loaded value with its ETag and expiry"""
+
+    __slots__ = ('value', 'etag', 'expires_at')
+
+    def __init__(self, value, ttl):
+        self.value = value
+        self.etag = hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:20]
+        self.expires_at = time.monotonic() + ttl
+
+
+class _PendingLoad:
+    """A key being loaded; later requests for it wait instead of querying again"""
+
+    __slots__ = ('event', 'entry', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class CatalogCache:
+    """Per-process cache of registered keys, each with its own loader and TTL"""
+
+    def __init__(self, trigger_path=None):
+        """
+        Args:
+            trigger_path (str): File whose mtime change clears the cache, so an
+                invalidation in one worker reaches all of them
+        """
+        self.trigger_path = trigger_path
+        self._loaders = {}
+        self._entries = {}
+        self._pending = {}
+        self._generation = 0  # bumped by invalidate(); loads that straddle it are not stored
+        self._lock = threading.Lock()
+        self._trigger_mtime = self._read_trigger()
+        self._next_trigger_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def register(self, key, load, ttl):
+        """Cache load() -> JSON-serialisable value under key for ttl seconds"""
+        self._loaders[key] = (load, ttl)
+
+    def entry(self, key):
+        """
+        CacheEntry for a key, calling its loader on a miss
+
+        Raises whatever the loader raised, in every request that waited for it.
+        """
+        self._check_trigger()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached.expires_at > time.monotonic():
+                self.hits += 1
+                return cached
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _PendingLoad()
+                generation = self._generation
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.entry
+
+        try:
+            load, ttl = self._loaders[key]
+            pending.entry = CacheEntry(load(), ttl)
+            return pending.entry
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+                if pending.entry is not None and generation == self._generation:
+                    self._entries[key] = pending.entry
+            pending.event.set()
+
+    def get(self, key):
+        """Cached value for a key, loading it on a miss"""
+        return self.entry(key).value
+
+    def invalidate(self, *keys):
+        """Drop the given keys (all when none are given) here, and everything in the other workers"""
+        self._clear(keys)
+        if self.trigger_path:
+            os.makedirs(os.path.dirname(self.trigger_path) or '.', exist_ok=True)
+            with open(self.trigger_path, 'w') as f:
+                f.write(str(time.time()))
+            self._trigger_mtime = self._read_trigger()
+
+    def get_stats(self):
+        """Hit/miss counters and entry ages for the health endpoint"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'invalidations': self.invalidations,
+                'entries': {key: {'etag': entry.etag, 'expires_in': round(entry.expires_at - now, 1)}
+                            for key, entry in self._entries.items()}
+            }
+
+    def _clear(self, keys=()):
+        with self._lock:
+            for key in keys or list(self._entries):
+                self._entries.pop(key, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def _check_trigger(self):
+        now = time.monotonic()
+        if not self.trigger_path or now < self._next_trigger_check:
+            return
+        self._next_trigger_check = now + TRIGGER_CHECK_SECONDS
+        trigger_mtime = self._read_trigger()
+        if trigger_mtime != self._trigger_mtime:
+            self._trigger_mtime = trigger_mtime
+            self._clear()
+
+    def _read_trigger(self):
+        try:
+            return os.stat(self.trigger_path).st_mtime_ns if self.trigger_path else None
+        except OSError:
+            return None
@@ -0,0 +1,89 @@
+"""
+Rice Disease Detection - Backend Parity Check
+Verifies that the exported models agree with the Keras model, leaf embeddings included
+"""
+
+import os
+import sys
+import numpy as np
+from inference_engine import InferenceEngine, BACKENDS, backend_model_path
+from image_preprocessing import decode_image
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+DATA_DIR = 'Rice Leaf Disease Images'
+IMG_SIZE = 224
+IMAGES_PER_CLASS = 16
+MIN_AGREEMENT = 0.99
+MAX_ABS_DIFF = 1e-3
+MIN_EMBEDDING_COSINE = 0.999
+
+
+def load_sample_set():
+    """Load a few validation images per class, or random inputs if the dataset is absent"""
+    images = []
+    if os.path.isdir(DATA_DIR):
+        for class_name in sorted(os.listdir(DATA_DIR)):
+            class_dir = os.path.join(DATA_DIR, class_name)
+            if not os.path.isdir(class_dir):
+                continue
+            for filename in sorted(os.listdir(class_dir))[:IMAGES_PER_CLASS]:
+                with open(os.path.join(class_dir, filename), 'rb') as f:
+                    images.append(decode_image(f.read(), IMG_SIZE)[0])
+
+    if not images:
+        print(f"⚠ '{DATA_DIR}' not found, using random inputs")
+        rng = np.random.default_rng(0)
+        return rng.random((IMAGES_PER_CLASS * 4, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+
+    return np.stack(images)
+
+
+if __name__ == '__main__':
+    print("=" * 50)
+    print("Backend Parity Check")
+    print("=" * 50)
+
+    samples = load_sample_set()
+    print(f"✓ Loaded {len(samples)} sample images")
+
+    reference = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend='keras')
+    expected, expected_embeddings = reference.predict_with_embeddings(samples)
+    expected_classes = np.argmax(expected, axis=1)
+
+    failed = False
+    for backend in BACKENDS:
+        if backend == 'keras':
+            continue
+
+        if not os.path.exists(backend_model_path(MODEL_PATH, backend)):
+            print(f"⚠ {backend}: artifact missing, run export_model.py first")
+            continue
+
+        engine = InferenceEngine(MODEL_PATH, CLASS_INDICES_PATH, img_size=IMG_SIZE, backend=backend)
+        actual, embeddings = engine.predict_with_embeddings(samples)
+
+        agreement = float(np.mean(np.argmax(actual, axis=1) == expected_classes))
+        max_diff = float(np.max(np.abs(actual - expected)))
+        passed = agreement >= MIN_AGREEMENT and max_diff <= MAX_ABS_DIFF
+
+        # Similar-case search compares embeddings across backends, so they must match too
+        if embeddings.shape != expected_embeddings.shape:
+            embedding_report = f"embedding width {embeddings.shape[1]}, expected {expected_embeddings.shape[1]}"
+            passed = False
+        elif embeddings.shape[1]:
+            norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(expected_embeddings, axis=1)
+            cosine = float(np.min(np.sum(embeddings * expected_embeddings, axis=1) / np.maximum(norms, 1e-12)))
+            embedding_report = f"min embedding cosine {cosine:.5f}"
+            passed = passed and cosine >= MIN_EMBEDDING_COSINE
+        else:
+            embedding_report = "no embeddings"
+        failed = failed or not passed
+
+        mark = '✓' if passed else '✗'
+        print(f"{mark} {backend}: top-1 agreement {agreement * 100:.2f}%, max |Δp| {max_diff:.2e}, "
+              f"{embedding_report}")
+
+    print("=" * 50)
+    sys.exit(1 if failed else 0)
@@ -167,6 +167,7 @@ CREATE TABLE IF NOT EXISTS prediction_history (
     confidence_score DECIMAL(5, 2),
     model_version VARCHAR(50),
     result_json LONGTEXT,
+    embedding BLOB,  -- float16 leaf embedding for similar-case search
     prediction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (farmer_id) REFERENCES farmers(id) ON DELETE CASCADE,
     FOREIGN KEY (disease_id) REFERENCES diseases(id) ON DELETE SET NULL
@@ -1,15 +1,180 @@
 import mysql.connector
 from mysql.connector import Error
 import os
+import time
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+
+def connection_settings(host=None, user=None, password=None, database=None):
+    """mysql.connector.connect() arguments from the given or environment credentials"""
+    return {
+        'host': host or os.getenv('DB_HOST', '127.0.0.1'),
+        'user': user or os.getenv('DB_USER', 'root'),
+        'password': password or os.getenv('DB_PASSWORD', 'Kishore@276'),
+        'database': database or os.getenv('DB_NAME', 'rice_disease'),
+        'port': int(os.getenv('DB_PORT', 3306))
+    }
+
+
+class PoolTimeout(Error):
+    """Raised when no pooled connection frees up within the checkout timeout"""
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections shared by the request threads of one process"""
+    
+    def __init__(self, max_size=None, checkout_timeout=None, max_lifetime=None, ping_after=None, **credentials):
+        """
+        Initialize an empty pool; connections are opened on demand
+        
+        Args:
+            max_size (int): Open connections, idle or in use (DB_POOL_SIZE, default 10)
+            checkout_timeout (float): Seconds to wait for a free connection (DB_POOL_TIMEOUT, default 5)
+            max_lifetime (float): Seconds before a connection is replaced (DB_POOL_MAX_LIFETIME, default 1800)
+            ping_after (float): Idle seconds after which a connection is pinged before reuse
+                (DB_POOL_PING_AFTER, default 30)
+            **credentials: host, user, password, database as for DatabaseConnection
+        """
+        self.settings = connection_settings(**credentials)
+        self.max_size = max_size or int(os.getenv('DB_POOL_SIZE', 10))
+        self.checkout_timeout = checkout_timeout or float(os.getenv('DB_POOL_TIMEOUT', 5))
+        self.max_lifetime = max_lifetime or float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+        self.ping_after = ping_after if ping_after is not None else float(os.getenv('DB_POOL_PING_AFTER', 30))
+        
+        self._reset()
+        # Sockets must not be shared across fork(); pre-forked workers start empty
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        self._available = threading.Condition(threading.Lock())
+        self._idle = []  # (connection, opened_at, returned_at), most recently returned last
+        self._opened_at = {}  # id(connection) -> opened_at, for connections in use
+        self._size = 0
+        self._waiters = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.discarded = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+    
+    def checkout(self):
+        """
+        Borrow a connection, opening one if the pool has room
+        
+        Raises:
+            PoolTimeout: No connection was returned within checkout_timeout
+            mysql.connector.Error: A new connection could not be opened
+        """
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        
+        with self._available:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {self.checkout_timeout:.1f}s "
+                                      f"({self.max_size} in use)")
+                self._waiters += 1
+                try:
+                    self._available.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                self._size += 1  # reserve the slot; the connection is opened outside the lock
+            
+            waited = time.monotonic() - start
+            self.checkouts += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        
+        if entry is not None:
+            connection, opened_at, returned_at = entry
+            now = time.monotonic()
+            expired = now - opened_at > self.max_lifetime
+            # is_connected() pings the server; skip it for connections that were just in use
+            if expired or (now - returned_at > self.ping_after and not connection.is_connected()):
+                self._close(connection)
+                with self._available:
+                    self.discarded += 1
+                entry = None
+        
+        if entry is None:
+            try:
+                connection = mysql.connector.connect(**self.settings)
+            except Exception:
+                self._release_slot()
+                raise
+            opened_at = time.monotonic()
+            with self._available:
+                self.opened += 1
+        
+        with self._available:
+            self._opened_at[id(connection)] = opened_at
+        return connection
+    
+    def checkin(self, connection):
+        """Return a borrowed connection; one that fails to roll back is closed instead"""
+        with self._available:
+            opened_at = self._opened_at.pop(id(connection), None)
+        if opened_at is None:
+            return  # borrowed before a fork, or already returned
+        
+        try:
+            # Ends the read snapshot so the next borrower sees current data
+            connection.rollback()
+        except Error:
+            self._close(connection)
+            with self._available:
+                self.discarded += 1
+            self._release_slot()
+            return
+        
+        with self._available:
+            self._idle.append((connection, opened_at, time.monotonic()))
+            self._available.notify()
+    
+    def get_stats(self):
+        """Pool occupancy and checkout wait times for the health endpoint"""
+        with self._available:
+            return {
+                'max_size': self.max_size,
+                'open': self._size,
+                'in_use': self._size - len(self._idle),
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'discarded': self.discarded,
+                'avg_wait_ms': round(self._wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait_seconds * 1000, 3)
+            }
+    
+    def _release_slot(self):
+        with self._available:
+            self._size -= 1
+            self._available.notify()
+    
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+
 class DatabaseConnection:
     """MySQL database connection class for Rice Disease Detection project"""
     
-    def __init__(self, host=None, user=None, password=None, database=None):
+    def __init__(self, host=None, user=None, password=None, database=None, pool=None):
         """
         Initialize database connection with provided or environment credentials
         
@@ -18,18 +183,33 @@ class DatabaseConnection:
             user (str): MySQL username
             password (str): MySQL password
             database (str): Database name
+            pool (ConnectionPool): Borrow the connection from this pool instead of opening one
         """
-        self.host = host or os.getenv('DB_HOST', '127.0.0.1')
-        self.user = user or os.getenv('DB_USER', 'root')
-        self.password = password or os.getenv('DB_PASSWORD', 'Kishore@276')
-        self.database = database or os.getenv('DB_NAME', 'rice_disease')
-        self.port = int(os.getenv('DB_PORT', 3306))
+        settings = connection_settings(host, user, password, database)
+        self.host = settings['host']
+        self.user = settings['user']
+        self.password = settings['password']
+        self.database = settings['database']
+        self.port = settings['port']
+        self.pool = pool
         self.connection = None
         self.cursor = None
+        # Profiling counters, kept across disconnect()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.connect_seconds = 0.0
+        self._connect_failed = False
     
     def connect(self):
-        """Establish connection to MySQL database"""
+        """Establish connection to MySQL database (or borrow one from the pool)"""
+        start = time.perf_counter()
         try:
+            if self.pool is not None:
+                self.connection = self.pool.checkout()
+                # Buffered, so a fetch_one() that leaves rows unread doesn't block the next query
+                self.cursor = self.connection.cursor(buffered=True)
+                return True
+            
             self.connection = mysql.connector.connect(
                 host=self.host,
                 user=self.user,
@@ -46,33 +226,79 @@ class DatabaseConnection:
                 return True
         except Error as e:
             print(f"✗ Error while connecting to MySQL: {e}")
+            self._connect_failed = True
             return False
+        finally:
+            self.connect_seconds += time.perf_counter() - start
+    
+    def _ensure_connected(self):
+        """Connect on the first query if connect() was not called; one attempt per handle"""
+        if self.cursor is not None:
+            return True
+        if self._connect_failed:
+            return False
+        return bool(self.connect())
     
     def disconnect(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            if self.cursor:
+        """Close database connection (or return it to the pool)"""
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        self._connect_failed = False
+        
+        if self.cursor:
+            try:
                 self.cursor.close()
-            self.connection.close()
+            except Error:
+                pass
+            self.cursor = None
+        
+        if self.pool is not None:
+            self.pool.checkin(connection)
+        elif connection.is_connected():
+            connection.close()
             print("✓ MySQL connection closed")
     
     def execute_query(self, query, params=None):
         """Execute a single query"""
+        if not self._ensure_connected():
+            return False
+        start = time.perf_counter()
         try:
             if params:
                 self.cursor.execute(query, params)
             else:
                 self.cursor.execute(query)
             self.connection.commit()
-            print(f"✓ Query executed successfully")
             return True
         except Error as e:
             print(f"✗ Error executing query: {e}")
             self.connection.rollback()
             return False
+        finally:
+            self._record_query(start)
+    
+    def execute_many(self, query, rows):
+        """Execute one query for many parameter rows in a single commit"""
+        if not self._ensure_connected():
+            return False
+        start = time.perf_counter()
+        try:
+            self.cursor.executemany(query, rows)
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"✗ Error executing batch query: {e}")
+            self.connection.rollback()
+            return False
+        finally:
+            self._record_query(start)
     
     def fetch_query(self, query, params=None):
         """Fetch results from a SELECT query"""
+        if not self._ensure_connected():
+            return None
+        start = time.perf_counter()
         try:
             if params:
                 self.cursor.execute(query, params)
@@ -82,9 +308,14 @@ class DatabaseConnection:
         except Error as e:
             print(f"✗ Error fetching data: {e}")
             return None
+        finally:
+            self._record_query(start)
     
     def fetch_one(self, query, params=None):
         """Fetch a single row from query result"""
+        if not self._ensure_connected():
+            return None
+        start = time.perf_counter()
         try:
             if params:
                 self.cursor.execute(query, params)
@@ -94,6 +325,24 @@ class DatabaseConnection:
         except Error as e:
             print(f"✗ Error fetching data: {e}")
             return None
+        finally:
+            self._record_query(start)
+    
+    def has_column(self, table, column):
+        """
+        Whether a table of this database has a column; None when MySQL could
+        not be asked, so an outage isn't mistaken for an old schema
+        """
+        row = self.fetch_one(
+            "SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (self.database, table, column)
+        )
+        return None if row is None else row[0] > 0
+    
+    def _record_query(self, start):
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - start
 
 
 if __name__ == "__main__":
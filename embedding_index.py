@@ -0,0 +1,232 @@
+"""
+Rice Disease Detection - Leaf Embedding Index
+Cosine nearest-neighbour search over float16 leaf embeddings: an exact
+numpy scan for small collections, an inverted-file (IVF) index beyond that
+"""
+
+import math
+import threading
+import numpy as np
+
+# Collections up to this size are scanned exactly
+BRUTE_FORCE_MAX = 20000
+# Inverted lists scanned per query once the IVF index is in use
+DEFAULT_NPROBE = 16
+# Rows converted to float32 at a time during a scan
+SCAN_CHUNK_ROWS = 16384
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLES_PER_LIST = 32
+
+
+def encode_embedding(vector):
+    """L2-normalise a 1-D embedding and pack it as float16 bytes for storage"""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if not np.isfinite(norm) or norm == 0:
+        return None
+    return (vector / norm).astype(np.float16).tobytes()
+
+
+def decode_embedding(blob):
+    """Float16 bytes from encode_embedding -> 1-D float16 array"""
+    return np.frombuffer(blob, dtype=np.float16)
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """Top-k cosine search with incremental inserts; ids are prediction_history ids"""
+
+    def __init__(self, brute_force_max=BRUTE_FORCE_MAX, nprobe=DEFAULT_NPROBE, seed=0):
+        """
+        Args:
+            brute_force_max (int): Vectors scanned exactly before an IVF index is built
+            nprobe (int): Inverted lists searched per query
+            seed (int): Seed for k-means initialisation
+        """
+        self.brute_force_max = brute_force_max
+        self.nprobe = nprobe
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, model_version=None):
+        """Drop every vector, e.g. when a new model changes the embedding space"""
+        with self._lock:
+            self.model_version = model_version
+            self.dim = None
+            self.max_id = 0
+            self._size = 0
+            self._vectors = None
+            self._ids = np.empty(0, dtype=np.int64)
+            # IVF state: centroids and, per centroid, the rows assigned to it
+            self._centroids = None
+            self._lists = None
+            self._trained_size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, ids, vectors):
+        """
+        Append vectors; they are searchable as soon as this returns. Returns
+        how many were new: ids already in the index are skipped, so a sync
+        may re-read rows it has seen.
+
+        Rows are assigned to their nearest IVF list. The lists are retrained
+        whenever the collection has doubled since the last training.
+        """
+        vectors = _normalise(vectors).astype(np.float16)
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return 0
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding size {vectors.shape[1]} does not match index size {self.dim}")
+
+            # Re-read ids are all recent, so only the stored ids above the smallest one are compared
+            stored = self._ids[:self._size]
+            new = ~np.isin(ids, stored[stored >= ids.min()])
+            ids, vectors = ids[new], vectors[new]
+            if len(ids) == 0:
+                return 0
+
+            start = self._size
+            self._reserve(start + len(ids))
+            self._vectors[start:start + len(ids)] = vectors
+            self._ids[start:start + len(ids)] = ids
+            self._size = start + len(ids)
+            self.max_id = max(self.max_id, int(ids.max()))
+
+            if self._centroids is not None:
+                self._assign(np.arange(start, self._size))
+
+            needs_training = self._size > self.brute_force_max and self._size >= 2 * self._trained_size
+
+        if needs_training:
+            self._train()
+        return len(ids)
+
+    def search(self, query, k=10, exclude_id=None):
+        """
+        The k most similar stored embeddings to a query vector
+
+        Returns:
+            list: (id, cosine similarity) pairs, most similar first
+        """
+        if self._size == 0:
+            return []
+        query = _normalise(np.asarray(query, dtype=np.float32)[np.newaxis])[0]
+
+        with self._lock:
+            size = self._size
+            vectors = self._vectors
+            ids = self._ids
+            centroids = self._centroids
+            lists = self._lists
+
+        if centroids is None:
+            rows = None
+            scores = np.concatenate([
+                vectors[start:min(start + SCAN_CHUNK_ROWS, size)].astype(np.float32) @ query
+                for start in range(0, size, SCAN_CHUNK_ROWS)
+            ])
+        else:
+            nearest_lists = np.argsort(centroids @ query)[::-1][:self.nprobe]
+            rows = np.concatenate([np.asarray(lists[i], dtype=np.int64) for i in nearest_lists])
+            # Rows assigned after the snapshot may lie past the buffer it holds
+            rows = rows[rows < size]
+            scores = vectors[rows].astype(np.float32) @ query
+
+        if exclude_id is not None:
+            candidate_ids = ids[rows] if rows is not None else ids[:size]
+            scores = np.where(candidate_ids == exclude_id, -np.inf, scores)
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top_rows = rows[top] if rows is not None else top
+        return [(int(ids[row]), round(float(score), 4))
+                for row, score in zip(top_rows, scores[top]) if np.isfinite(score)]
+
+    def get_stats(self):
+        """Index size and mode for the health endpoint"""
+        with self._lock:
+            return {
+                'model_version': self.model_version,
+                'vectors': self._size,
+                'dim': self.dim,
+                'mode': 'ivf' if self._centroids is not None else 'exact',
+                'lists': len(self._centroids) if self._centroids is not None else 0,
+                'nprobe': self.nprobe,
+                'memory_mb': round(self._vectors.nbytes / 1e6, 1) if self._vectors is not None else 0.0
+            }
+
+    def _reserve(self, rows):
+        """Grow the vector and id buffers geometrically"""
+        capacity = self._vectors.shape[0] if self._vectors is not None else 0
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, 1024)
+        vectors = np.empty((capacity, self.dim), dtype=np.float16)
+        ids = np.empty(capacity, dtype=np.int64)
+        if self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+            ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._ids = vectors, ids
+
+    def _assign(self, rows):
+        """Append rows to the inverted list of their nearest centroid"""
+        for start in range(0, len(rows), SCAN_CHUNK_ROWS):
+            chunk = rows[start:start + SCAN_CHUNK_ROWS]
+            nearest = np.argmax(self._vectors[chunk].astype(np.float32) @ self._centroids.T, axis=1)
+            for row, list_index in zip(chunk.tolist(), nearest.tolist()):
+                self._lists[list_index].append(row)
+
+    def _train(self):
+        """
+        Spherical k-means over a sample, then assign every stored vector
+
+        Runs on the caller's thread (the index sync task) outside the lock;
+        searches keep using the previous state until the new one is swapped in.
+        """
+        with self._lock:
+            size = self._size
+            vectors = self._vectors
+
+        num_lists = int(min(4096, max(64, math.sqrt(size)), size))
+        sample_size = min(size, num_lists * KMEANS_SAMPLES_PER_LIST)
+        sample = vectors[self._rng.choice(size, sample_size, replace=False)].astype(np.float32)
+
+        centroids = sample[self._rng.choice(sample_size, num_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = ~sums.any(axis=1)
+            # Empty lists are re-seeded from random sample points
+            sums[empty] = sample[self._rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalise(sums)
+
+        lists = [[] for _ in range(num_lists)]
+        for start in range(0, size, SCAN_CHUNK_ROWS):
+            stop = min(start + SCAN_CHUNK_ROWS, size)
+            nearest = np.argmax(vectors[start:stop].astype(np.float32) @ centroids.T, axis=1)
+            for row, list_index in enumerate(nearest.tolist(), start):
+                lists[list_index].append(row)
+
+        with self._lock:
+            # Rows added while training get assigned against the new centroids
+            self._centroids, self._lists = centroids, lists
+            self._trained_size = size
+            if self._size > size:
+                self._assign(np.arange(size, self._size))
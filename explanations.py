@@ -0,0 +1,206 @@
+"""
+Rice Disease Detection - Prediction Explanations
+Grad-CAM heatmaps from the last convolutional block of the CNN, rendered as
+PNG overlays and cached on disk by image hash, model version and class
+"""
+
+import io
+import os
+import threading
+import numpy as np
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+from image_preprocessing import decode_image, inspect_image, MAX_IMAGE_PIXELS
+
+# Longer side of the rendered overlay
+OVERLAY_MAX_SIDE = 512
+# Heatmap opacity where the activation is strongest
+OVERLAY_ALPHA = 0.5
+
+
+def heatmap_colors(heatmap):
+    """Map a [0, 1] heatmap to (H, W, 3) uint8 blue-green-yellow-red colours"""
+    h = np.clip(heatmap, 0.0, 1.0)[..., np.newaxis]
+    centres = np.array([3.0, 2.0, 1.0], dtype=np.float32)
+    return (np.clip(1.5 - np.abs(4 * h - centres), 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def render_overlay(data, heatmap, metadata=None, max_side=OVERLAY_MAX_SIDE, alpha=OVERLAY_ALPHA,
+                   max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Blend a heatmap over the upload and encode it as PNG
+
+    The model sees the whole frame squashed to a square, so the heatmap is
+    stretched back to the photo's own aspect ratio.
+
+    Args:
+        data (bytes): Uploaded image bytes
+        heatmap (np.ndarray): (h, w) activation map in [0, 1]
+        metadata (dict): Written to PNG text chunks, e.g. the explained class
+
+    Returns:
+        bytes: PNG file contents
+    """
+    img = inspect_image(data, max_side, max_bytes=len(data), max_pixels=max_pixels).convert('RGB')
+    img.thumbnail((max_side, max_side))
+
+    heat = Image.fromarray((np.clip(heatmap, 0.0, 1.0) * 255).astype(np.uint8))
+    heat = np.asarray(heat.resize(img.size, Image.BILINEAR), dtype=np.float32) / 255.0
+
+    # Weak activations stay transparent so the leaf itself remains visible
+    weight = (alpha * heat)[..., np.newaxis]
+    blended = np.asarray(img, dtype=np.float32) * (1 - weight) + heatmap_colors(heat) * weight
+
+    info = PngInfo()
+    for key, value in (metadata or {}).items():
+        info.add_text(key, str(value))
+    buffer = io.BytesIO()
+    Image.fromarray(blended.astype(np.uint8)).save(buffer, format='PNG', pnginfo=info, optimize=True)
+    return buffer.getvalue()
+
+
+def read_overlay_metadata(path):
+    """PNG text chunks of a rendered overlay, read without decoding the pixels"""
+    with Image.open(path) as img:
+        return dict(img.text)
+
+
+class GradCam:
+    """Grad-CAM over the last Conv2D layer of a Keras classifier ending in a softmax Dense layer"""
+
+    def __init__(self, model_path, img_size=224):
+        """
+        Load the Keras model and trace the heatmap function
+
+        Args:
+            model_path (str): Keras model file (the other backends have no gradients)
+            img_size (int): Model input size
+        """
+        import tensorflow as tf
+        from tensorflow import keras
+
+        self.model_path = model_path
+        self.img_size = img_size
+        model = keras.models.load_model(model_path, compile=False)
+
+        conv_layers = [layer for layer in model.layers if isinstance(layer, keras.layers.Conv2D)]
+        classifier = model.layers[-1]
+        if not conv_layers or not isinstance(classifier, keras.layers.Dense):
+            raise ValueError(f"{model_path} has no Conv2D layer followed by a Dense classifier")
+        self.layer_name = conv_layers[-1].name
+
+        features = keras.Model(model.inputs, [conv_layers[-1].output, classifier.input])
+        kernel, bias = classifier.kernel, classifier.bias
+
+        @tf.function(input_signature=[tf.TensorSpec([1, img_size, img_size, 3], tf.float32),
+                                      tf.TensorSpec([], tf.int32)])
+        def explain(image, class_index):
+            with tf.GradientTape() as tape:
+                activations, hidden = features(image, training=False)
+                # Gradients of the pre-softmax score; the softmax saturates on confident predictions
+                logits = tf.matmul(hidden, kernel) + bias
+                probabilities = tf.nn.softmax(logits)[0]
+                class_index = tf.where(class_index < 0, tf.argmax(probabilities, output_type=tf.int32), class_index)
+                score = tf.gather(logits[0], class_index)
+            gradients = tape.gradient(score, activations)
+            weights = tf.reduce_mean(gradients, axis=(1, 2))
+            heatmap = tf.nn.relu(tf.reduce_sum(activations * weights[:, tf.newaxis, tf.newaxis, :], axis=-1))[0]
+            return heatmap / (tf.reduce_max(heatmap) + 1e-8), probabilities, class_index
+
+        self._explain = explain
+
+    def explain(self, data, class_index=None, max_pixels=MAX_IMAGE_PIXELS):
+        """
+        Heatmap for one upload
+
+        Args:
+            data (bytes): Uploaded image bytes
+            class_index (int): Class to explain; None explains the top prediction
+
+        Returns:
+            tuple: ((h, w) heatmap in [0, 1], class probabilities, explained class index)
+        """
+        image = decode_image(data, self.img_size, max_pixels)
+        heatmap, probabilities, class_index = self._explain(image, -1 if class_index is None else int(class_index))
+        return heatmap.numpy(), probabilities.numpy(), int(class_index)
+
+
+class _PendingExplanation:
+    """An overlay being rendered; later requests for it wait instead of rendering it again"""
+
+    __slots__ = ('event', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.error = None
+
+
+class ExplanationCache:
+    """On-disk PNG cache whose misses are rendered once however many requests ask concurrently"""
+
+    def __init__(self, cache_dir='cache/explanations'):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def path_for(self, model_version, image_hash, class_key):
+        return os.path.join(self.cache_dir, model_version, image_hash[:2], f"{image_hash}-{class_key}.png")
+
+    def get_or_render(self, path, render):
+        """
+        Path of a cached overlay, calling render() -> PNG bytes to create it on a miss
+
+        Raises whatever render() raised, in every request that waited for it.
+        """
+        if os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._lock:
+            pending = self._pending.get(path)
+            if pending is None and os.path.exists(path):
+                # Rendered by another request since the check above
+                self.hits += 1
+                return path
+            owner = pending is None
+            if owner:
+                pending = self._pending[path] = _PendingExplanation()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return path
+
+        try:
+            png = render()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[path]
+            pending.event.set()
+
+    def get_stats(self):
+        """Hit/miss counters for the health endpoint"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'rendering': len(self._pending)
+            }
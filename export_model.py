@@ -0,0 +1,145 @@
+"""
+Rice Disease Detection - Model Export
+Converts the trained Keras model into TFLite, ONNX and bytes-in SavedModel
+artifacts for CPU serving
+"""
+
+import os
+import sys
+import tensorflow as tf
+from tensorflow import keras
+from inference_engine import backend_model_path
+
+# Configuration
+MODEL_PATH = 'models/rice_disease_model.h5'
+IMG_SIZE = 224
+ONNX_OPSET = 13
+# JPEG DCT scaling factors, the in-graph equivalent of PIL's draft mode
+JPEG_DECODE_RATIOS = (8, 4, 2, 1)
+
+
+def with_embedding_output(model):
+    """
+    The model with outputs named 'probabilities' and 'embedding', the
+    penultimate Dense layer's activations that KerasBackend returns as the
+    leaf embedding; a model with a single Dense layer is returned unchanged
+    """
+    dense_layers = [layer for layer in model.layers if isinstance(layer, keras.layers.Dense)]
+    if len(dense_layers) < 2:
+        return model
+    # Identity layers only give the outputs stable names for the backends to look them up by
+    probabilities = keras.layers.Activation('linear', name='probabilities')(model.output)
+    embedding = keras.layers.Activation('linear', name='embedding')(dense_layers[-2].output)
+    return keras.Model(model.inputs, [probabilities, embedding])
+
+
+def export_tflite(model, output_path):
+    """Convert the Keras model and its embedding output to a float32 TFLite flatbuffer"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(with_embedding_output(model))
+    tflite_model = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"✓ TFLite model saved to {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+
+def export_onnx(model, output_path):
+    """Convert the Keras model and its embedding output to ONNX with a dynamic batch dimension"""
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec([None, IMG_SIZE, IMG_SIZE, 3], tf.float32, name='input')]
+    tf2onnx.convert.from_keras(with_embedding_output(model), input_signature=input_signature, opset=ONNX_OPSET,
+                               output_path=output_path)
+    print(f"✓ ONNX model saved to {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+
+class ServingModule(tf.Module):
+    """Keras model wrapped with in-graph decoding, resizing and rescaling"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = with_embedding_output(model)
+
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string, name='image_bytes')])
+    def serve_bytes(self, image_bytes):
+        """Encoded JPEG/PNG bytes -> class probabilities and leaf embeddings"""
+        images = tf.map_fn(
+            decode_and_resize, image_bytes,
+            fn_output_signature=tf.TensorSpec([IMG_SIZE, IMG_SIZE, 3], tf.uint8)
+        )
+        return self.serve_uint8(images)
+
+    @tf.function(input_signature=[tf.TensorSpec([None, IMG_SIZE, IMG_SIZE, 3], tf.uint8, name='images')])
+    def serve_uint8(self, images):
+        """Already-decoded uint8 images -> class probabilities and leaf embeddings"""
+        return self.serve_float(tf.cast(images, tf.float32) / 255.0)
+
+    @tf.function(input_signature=[tf.TensorSpec([None, IMG_SIZE, IMG_SIZE, 3], tf.float32, name='images')])
+    def serve_float(self, images):
+        """Preprocessed float32 images in [0, 1] -> class probabilities and leaf embeddings"""
+        outputs = self.model(images, training=False)
+        if isinstance(outputs, (list, tuple)):
+            return {'probabilities': outputs[0], 'embedding': outputs[1]}
+        return {'probabilities': outputs}
+
+
+def decode_and_resize(data):
+    """Decode one image to IMG_SIZE x IMG_SIZE uint8 RGB, scaling JPEGs down while decoding"""
+    def decode_jpeg():
+        # Largest DCT scaling that still leaves at least IMG_SIZE pixels per side
+        shape = tf.image.extract_jpeg_shape(data)
+        short_side = tf.minimum(shape[0], shape[1])
+        fits = tf.stack([short_side // ratio >= IMG_SIZE if ratio > 1 else tf.constant(True)
+                         for ratio in JPEG_DECODE_RATIOS])
+        branch = tf.argmax(tf.cast(fits, tf.int32), output_type=tf.int32)
+        branches = [
+            lambda ratio=ratio: tf.io.decode_jpeg(data, channels=3, ratio=ratio)
+            for ratio in JPEG_DECODE_RATIOS
+        ]
+        return tf.switch_case(branch, branches)
+
+    def decode_other():
+        return tf.io.decode_image(data, channels=3, expand_animations=False)
+
+    image = tf.cond(tf.io.is_jpeg(data), decode_jpeg, decode_other)
+    image = tf.image.resize(image, [IMG_SIZE, IMG_SIZE], method='bilinear', antialias=True)
+    return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+
+def export_graph(model, output_path):
+    """Save a SavedModel whose default signature takes raw image bytes"""
+    module = ServingModule(model)
+    signatures = {
+        'serving_default': module.serve_bytes,
+        'serve_uint8': module.serve_uint8,
+        'serve_float': module.serve_float
+    }
+    tf.saved_model.save(module, output_path, signatures=signatures)
+    print(f"✓ Bytes-in SavedModel saved to {output_path}")
+
+
+if __name__ == '__main__':
+    # python export_model.py [tflite] [onnx] [graph] [--model path.h5]
+    args = sys.argv[1:]
+    model_path = MODEL_PATH
+    if '--model' in args:
+        index = args.index('--model')
+        model_path = args[index + 1]
+        del args[index:index + 2]
+    targets = args or ['tflite', 'onnx', 'graph']
+
+    print("=" * 50)
+    print("Exporting Model")
+    print("=" * 50)
+
+    model = keras.models.load_model(model_path, compile=False)
+
+    if 'tflite' in targets:
+        export_tflite(model, backend_model_path(model_path, 'tflite'))
+
+    if 'onnx' in targets:
+        export_onnx(model, backend_model_path(model_path, 'onnx'))
+
+    if 'graph' in targets:
+        export_graph(model, backend_model_path(model_path, 'graph'))
+
+    print("\nRun check_backend_parity.py to verify the exported models")
@@ -0,0 +1,279 @@
+"""
+Rice Disease Detection - Image Preprocessing
+Decodes uploaded image bytes in memory into model-ready arrays
+"""
+
+import io
+import numpy as np
+from PIL import Image
+
+# Test-time augmentation views, in the order they are added as more are requested
+TTA_VIEW_NAMES = (
+    'identity',
+    'flip_horizontal',
+    'flip_vertical',
+    'rotate_left',
+    'rotate_right',
+    'crop_center',
+    'crop_top_left',
+    'crop_top_right',
+    'crop_bottom_left',
+    'crop_bottom_right'
+)
+# Small enough that a rotated, centre-cropped frame has no blank corners
+TTA_ROTATION_DEGREES = 8
+# Crops are img_size windows taken from the image resized to img_size * TTA_CROP_SCALE
+TTA_CROP_SCALE = 8 / 7
+
+# Tiled inference: overlapping img_size tiles over the image scaled so its
+# longer side spans TILE_GRID tiles; at most TILE_MAX tiles are scored
+TILE_GRID = 4
+TILE_OVERLAP = 0.25
+TILE_MAX = 12
+# A tile is scored when this fraction of its pixels look like plant tissue
+TILE_MIN_FOREGROUND = 0.2
+# Excess-green index (2G - R - B, 0-255 scale) above which a pixel counts as plant
+TILE_EXCESS_GREEN = 20
+
+# Decode limits; a JPEG is checked at its draft-mode size, other formats at full size
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_IMAGE_SIDE = 12000
+MAX_IMAGE_PIXELS = 24_000_000
+
+
+class ImageRejected(ValueError):
+    """Raised when image bytes are unreadable or too large to decode; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def open_image(data):
+    """Open image bytes with PIL without decoding the pixel data yet"""
+    return Image.open(io.BytesIO(data))
+
+
+def inspect_image(data, img_size=None, max_bytes=MAX_IMAGE_BYTES, max_side=MAX_IMAGE_SIDE,
+                  max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Open image bytes and check them against the decode limits from the header alone
+
+    With img_size set, a JPEG is put in draft mode for that size first, so a
+    large phone photo that the decoder will scale down by 1/2, 1/4 or 1/8 is
+    only charged for the pixels it actually produces. Pass img_size=None when
+    the full frame will be decoded (the 'graph' backend).
+
+    Returns:
+        PIL.Image.Image: The opened, not yet decoded image
+
+    Raises:
+        ImageRejected: status 400 for unreadable data, 413 for oversized images
+    """
+    if len(data) > max_bytes:
+        raise ImageRejected(f'Image is too large ({len(data) / 1048576:.1f} MB, max {max_bytes / 1048576:.0f} MB)', 413)
+
+    try:
+        img = open_image(data)
+    except Image.DecompressionBombError:
+        raise ImageRejected('Image dimensions are too large', 413)
+    except (OSError, SyntaxError):
+        raise ImageRejected('Could not read image; use PNG or JPEG')
+
+    width, height = img.size
+    if width < 1 or height < 1:
+        raise ImageRejected('Image has no pixels')
+    if max(width, height) > max_side:
+        raise ImageRejected(f'Image is {width}x{height}, max {max_side} pixels per side', 413)
+
+    if img_size is not None and img.format == 'JPEG':
+        img.draft('RGB', (img_size, img_size))
+    decoded_width, decoded_height = img.size
+    if decoded_width * decoded_height > max_pixels:
+        # Report the size that was checked: after draft mode, what the decoder would produce
+        size = f'{width}x{height}'
+        if (decoded_width, decoded_height) != (width, height):
+            size += f' and decodes at {decoded_width}x{decoded_height}'
+        raise ImageRejected(f'Image is {size} ({decoded_width * decoded_height / 1e6:.1f} megapixels), '
+                            f'max {max_pixels / 1e6:g} megapixels', 413)
+    return img
+
+
+def _decode_rgb(data, size, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode image bytes into a size x size RGB PIL image"""
+    img = inspect_image(data, size, max_bytes=len(data), max_pixels=max_pixels)
+    return img.convert('RGB').resize((size, size))
+
+
+def decode_image(data, img_size=224, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode image bytes into a (1, img_size, img_size, 3) float32 array in [0, 1]
+
+    JPEGs are decoded in draft mode, so the decoder scales large phone photos
+    down by 1/2, 1/4 or 1/8 while decoding instead of producing the full frame.
+    Raises ImageRejected if the image would decode to more than max_pixels.
+    """
+    img = _decode_rgb(data, img_size, max_pixels)
+    img_array = np.asarray(img, dtype=np.float32) / 255.0
+    return img_array[np.newaxis]
+
+
+def encoded_batch(data):
+    """
+    Wrap image bytes as a (1,) object array for the 'graph' backend, which
+    decodes, resizes and rescales inside the model instead of in Python
+    """
+    batch = np.empty(1, dtype=object)
+    batch[0] = data
+    return batch
+
+
+def decode_tta_views(data, img_size=224, num_views=8, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode image bytes once into an (num_views, img_size, img_size, 3) float32
+    batch of test-time augmentation views (see TTA_VIEW_NAMES)
+
+    The views are stacked so the model scores all of them in one forward pass.
+    """
+    num_views = max(1, min(int(num_views), len(TTA_VIEW_NAMES)))
+    names = TTA_VIEW_NAMES[:num_views]
+
+    large_size = int(round(img_size * TTA_CROP_SCALE))
+    large = _decode_rgb(data, large_size, max_pixels)
+    large_array = np.asarray(large)
+    full = np.asarray(large.resize((img_size, img_size)))
+
+    margin = large_size - img_size
+    center = margin // 2
+    crop_offsets = {
+        'crop_center': (center, center),
+        'crop_top_left': (0, 0),
+        'crop_top_right': (0, margin),
+        'crop_bottom_left': (margin, 0),
+        'crop_bottom_right': (margin, margin)
+    }
+
+    views = np.empty((num_views, img_size, img_size, 3), dtype=np.uint8)
+    for i, name in enumerate(names):
+        if name == 'identity':
+            views[i] = full
+        elif name == 'flip_horizontal':
+            views[i] = full[:, ::-1]
+        elif name == 'flip_vertical':
+            views[i] = full[::-1]
+        elif name in ('rotate_left', 'rotate_right'):
+            angle = TTA_ROTATION_DEGREES if name == 'rotate_left' else -TTA_ROTATION_DEGREES
+            rotated = np.asarray(large.rotate(angle, resample=Image.BILINEAR))
+            views[i] = rotated[center:center + img_size, center:center + img_size]
+        else:
+            top, left = crop_offsets[name]
+            views[i] = large_array[top:top + img_size, left:left + img_size]
+
+    return views.astype(np.float32) / 255.0
+
+
+def _tile_starts(length, size, stride):
+    """Offsets of overlapping windows covering [0, length), the last one flush with the edge"""
+    starts = list(range(0, max(1, length - size + 1), stride))
+    if starts[-1] != length - size:
+        starts.append(length - size)
+    return starts
+
+
+def decode_tiles(data, img_size=224, grid=TILE_GRID, overlap=TILE_OVERLAP, max_tiles=TILE_MAX,
+                 min_foreground=TILE_MIN_FOREGROUND, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode image bytes once into a batch of overlapping img_size tiles
+
+    The image is scaled (in JPEG draft mode where possible) so its longer side
+    spans `grid` tiles, and tiles that are mostly background are dropped using
+    an excess-green mask summed through an integral image. At most max_tiles
+    tiles are kept, the most plant-covered first, so the cost per image is
+    bounded no matter how large the upload is. If no tile qualifies, the
+    whole frame is returned as a single view.
+
+    Returns:
+        tuple: ((T, img_size, img_size, 3) float32 batch, layout dict for aggregate_tiles)
+    """
+    stride = max(1, int(round(img_size * (1 - overlap))))
+    span = img_size + (grid - 1) * stride
+
+    img = inspect_image(data, span, max_bytes=len(data), max_pixels=max_pixels).convert('RGB')
+    width, height = img.size
+    scale = min(1.0, span / max(width, height))
+    # Narrow images are stretched to at least one tile across
+    width = max(img_size, int(round(width * scale)))
+    height = max(img_size, int(round(height * scale)))
+    pixels = np.asarray(img.resize((width, height)))
+
+    rgb = pixels.astype(np.int16)
+    plant = (2 * rgb[..., 1] - rgb[..., 0] - rgb[..., 2]) > TILE_EXCESS_GREEN
+    integral = np.pad(plant.cumsum(axis=0, dtype=np.int32).cumsum(axis=1), ((1, 0), (1, 0)))
+
+    row_starts = _tile_starts(height, img_size, stride)
+    col_starts = _tile_starts(width, img_size, stride)
+    candidates = []
+    for row, top in enumerate(row_starts):
+        for col, left in enumerate(col_starts):
+            bottom, right = top + img_size, left + img_size
+            covered = (integral[bottom, right] - integral[top, right]
+                       - integral[bottom, left] + integral[top, left])
+            foreground = covered / (img_size * img_size)
+            if foreground >= min_foreground:
+                candidates.append((foreground, row, col, top, left))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    candidates = candidates[:max_tiles]
+
+    layout = {
+        'rows': len(row_starts),
+        'cols': len(col_starts),
+        'tile_size': img_size,
+        'stride': stride,
+        'positions': [(row, col) for _, row, col, _, _ in candidates],
+        'foreground': [float(f) for f, _, _, _, _ in candidates]
+    }
+
+    if not candidates:
+        full = np.asarray(img.resize((img_size, img_size)))
+        return full[np.newaxis].astype(np.float32) / 255.0, layout
+
+    tiles = np.empty((len(candidates), img_size, img_size, 3), dtype=np.uint8)
+    for i, (_, _, _, top, left) in enumerate(candidates):
+        tiles[i] = pixels[top:top + img_size, left:left + img_size]
+    return tiles.astype(np.float32) / 255.0, layout
+
+
+def aggregate_tiles(probabilities, layout):
+    """
+    Combine per-tile model output into an image-level prediction and a heat grid
+
+    Tiles are averaged with weights of plant coverage times top-1 confidence,
+    so clear, leafy tiles count most. The heat grid holds, per tile, the
+    probability (%) of the image-level class, or None for skipped tiles.
+
+    Returns:
+        tuple: (image-level probabilities, grid dict for the API response)
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    if not layout['positions']:
+        image_probabilities = probabilities[0]
+    else:
+        weights = np.asarray(layout['foreground'], dtype=np.float32) * probabilities.max(axis=1)
+        image_probabilities = (probabilities * weights[:, np.newaxis]).sum(axis=0) / weights.sum()
+
+    predicted = int(np.argmax(image_probabilities))
+    heat = [[None] * layout['cols'] for _ in range(layout['rows'])]
+    for (row, col), tile in zip(layout['positions'], probabilities):
+        heat[row][col] = round(float(tile[predicted]) * 100, 2)
+
+    evaluated = len(layout['positions'])
+    grid = {
+        'rows': layout['rows'],
+        'cols': layout['cols'],
+        'tile_size': layout['tile_size'],
+        'stride': layout['stride'],
+        'evaluated': evaluated,
+        'skipped': layout['rows'] * layout['cols'] - evaluated,
+        'heat': heat
+    }
+    return image_probabilities, grid
@@ -0,0 +1,435 @@
+"""
+Rice Disease Detection - Shared Inference Engine
+Loads the trained model once and serves predictions through a pluggable
+runtime backend (traced Keras, TFLite, ONNX Runtime or the bytes-in graph)
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from prediction_cache import model_fingerprint
+
+# Batch sizes that get their own fixed-shape graph; other sizes are padded up
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8)
+
+# File extension of each backend's artifact, exported next to the .h5 model
+BACKEND_EXTENSIONS = {
+    'keras': '.h5',
+    'tflite': '.tflite',
+    'onnx': '.onnx',
+    'graph': '_graph'  # SavedModel directory
+}
+
+
+# Artifacts read into memory by a pre-forking parent (serve.py). Workers build
+# their runtime from these copy-on-write pages instead of re-reading the file.
+_preloaded_artifacts = {}
+
+
+def preload_model_artifact(model_path, backend):
+    """Read a backend's model artifact into memory before workers are forked"""
+    path = backend_model_path(model_path, backend)
+    with open(path, 'rb') as f:
+        _preloaded_artifacts[path] = f.read()
+    return len(_preloaded_artifacts[path])
+
+
+def backend_model_path(model_path, backend):
+    """Path of the exported artifact for a backend, e.g. models/rice_disease_model.onnx"""
+    if backend not in BACKEND_EXTENSIONS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Use one of: {', '.join(BACKEND_EXTENSIONS)}")
+    return os.path.splitext(model_path)[0] + BACKEND_EXTENSIONS[backend]
+
+
+def _configure_tf_threads(tf, num_threads):
+    """Size TensorFlow's thread pools; only possible before the runtime starts"""
+    if num_threads:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError as e:
+            print(f"⚠ Could not set TensorFlow thread pools: {e}")
+
+
+class KerasBackend:
+    """Keras model called directly inside tf.function, one graph per batch size"""
+
+    name = 'keras'
+
+    def __init__(self, model_path, img_size, batch_sizes, num_threads=None):
+        import tensorflow as tf
+        from tensorflow import keras
+
+        _configure_tf_threads(tf, num_threads)
+        self._tf = tf
+        self.model = keras.models.load_model(model_path, compile=False)
+
+        # The penultimate dense layer's activations double as a leaf embedding.
+        # It lies on the path to the output, so returning it costs nothing extra.
+        dense_layers = [layer for layer in self.model.layers if isinstance(layer, keras.layers.Dense)]
+        outputs = [self.model.output]
+        self.embedding_size = 0
+        if len(dense_layers) >= 2:
+            outputs.append(dense_layers[-2].output)
+            self.embedding_size = dense_layers[-2].units
+        network = keras.Model(self.model.inputs, outputs)
+
+        # Calling the model directly skips the data-adapter and callback
+        # setup that model.predict() repeats on every call
+        forward = tf.function(lambda x: network(x, training=False))
+        self._traced = {
+            size: forward.get_concrete_function(
+                tf.TensorSpec([size, img_size, img_size, 3], tf.float32)
+            )
+            for size in batch_sizes
+        }
+
+    def run(self, batch):
+        return self.run_with_embeddings(batch)[0]
+
+    def run_with_embeddings(self, batch):
+        """(probabilities, penultimate-layer embeddings) from one forward pass"""
+        outputs = self._traced[batch.shape[0]](self._tf.constant(batch))
+        probabilities = outputs[0].numpy()
+        if len(outputs) == 1:
+            return probabilities, np.zeros((len(probabilities), 0), dtype=np.float32)
+        return probabilities, outputs[1].numpy()
+
+
+class TFLiteBackend:
+    """TFLite interpreter per batch size; uses tflite_runtime when installed"""
+
+    name = 'tflite'
+
+    def __init__(self, model_path, img_size, batch_sizes, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        # A preloaded flatbuffer is used in place, so forked workers share its weights
+        content = _preloaded_artifacts.get(model_path)
+        source = {'model_content': content} if content is not None else {'model_path': model_path}
+
+        self._interpreters = {}
+        self.embedding_size = 0
+        for size in batch_sizes:
+            interpreter = Interpreter(num_threads=num_threads, **source)
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, [size, img_size, img_size, 3])
+            interpreter.allocate_tensors()
+            output_index, embedding_index = self._output_indices(interpreter)
+            if embedding_index is not None:
+                self.embedding_size = int(interpreter.get_tensor(embedding_index).shape[-1])
+            self._interpreters[size] = (interpreter, input_index, output_index, embedding_index, threading.Lock())
+
+    @staticmethod
+    def _output_indices(interpreter):
+        """
+        Tensor indices of the probabilities and embedding outputs, looked up by
+        their signature names since the converter may reorder outputs;
+        flatbuffers exported without an embedding output give (index, None)
+        """
+        outputs = interpreter.get_output_details()
+        if len(outputs) < 2:
+            return outputs[0]['index'], None
+        named = interpreter.get_signature_runner().get_output_details()
+        if 'embedding' not in named:
+            return outputs[0]['index'], None
+        return named['probabilities']['index'], named['embedding']['index']
+
+    def run(self, batch):
+        return self.run_with_embeddings(batch)[0]
+
+    def run_with_embeddings(self, batch):
+        """(probabilities, penultimate-layer embeddings) from one invocation"""
+        interpreter, input_index, output_index, embedding_index, lock = self._interpreters[batch.shape[0]]
+        # An interpreter owns its tensors, so concurrent calls must not interleave
+        with lock:
+            interpreter.set_tensor(input_index, batch)
+            interpreter.invoke()
+            probabilities = interpreter.get_tensor(output_index).copy()
+            if embedding_index is None:
+                return probabilities, np.zeros((len(probabilities), 0), dtype=np.float32)
+            return probabilities, interpreter.get_tensor(embedding_index).copy()
+
+
+class ONNXBackend:
+    """ONNX Runtime CPU session with a dynamic batch dimension"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, img_size, batch_sizes, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+
+        source = _preloaded_artifacts.get(model_path, model_path)
+        self._session = ort.InferenceSession(source, options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+
+        # Models exported with a leaf embedding have a second output named 'embedding' (see export_model.py)
+        outputs = {output.name: output for output in self._session.get_outputs()}
+        self._output_names = [next(iter(outputs))]
+        self.embedding_size = 0
+        if len(outputs) > 1 and 'embedding' in outputs:
+            self._output_names = [next(name for name in outputs if name != 'embedding'), 'embedding']
+            self.embedding_size = int(outputs['embedding'].shape[-1])
+
+    def run(self, batch):
+        return self._session.run(self._output_names[:1], {self._input_name: batch})[0]
+
+    def run_with_embeddings(self, batch):
+        """(probabilities, penultimate-layer embeddings) from one session run"""
+        outputs = self._session.run(self._output_names, {self._input_name: batch})
+        if len(outputs) == 1:
+            return outputs[0], np.zeros((len(outputs[0]), 0), dtype=np.float32)
+        return outputs[0], outputs[1]
+
+
+class GraphBackend:
+    """SavedModel with JPEG/PNG decoding, resizing and rescaling inside the graph"""
+
+    name = 'graph'
+
+    def __init__(self, model_path, img_size, batch_sizes, num_threads=None):
+        import tensorflow as tf
+
+        _configure_tf_threads(tf, num_threads)
+        self._tf = tf
+        self._module = tf.saved_model.load(model_path)
+        self._run_encoded = self._module.signatures['serving_default']
+        self._run_float = self._module.signatures['serve_float']
+
+        # Graphs exported with a leaf embedding return it next to the probabilities (see export_model.py)
+        embedding = self._run_float.structured_outputs.get('embedding')
+        self.embedding_size = int(embedding.shape[-1]) if embedding is not None else 0
+
+    def run(self, batch):
+        return self._run_float(images=self._tf.constant(batch))['probabilities'].numpy()
+
+    def run_with_embeddings(self, batch):
+        """(probabilities, penultimate-layer embeddings) from one forward pass"""
+        return self._split(self._run_float(images=self._tf.constant(batch)))
+
+    def run_encoded(self, encoded):
+        """Predict straight from a 1-D batch of encoded image bytes"""
+        return self._run_encoded(image_bytes=self._tf.constant(list(encoded)))['probabilities'].numpy()
+
+    def run_encoded_with_embeddings(self, encoded):
+        """(probabilities, embeddings) straight from a 1-D batch of encoded image bytes"""
+        return self._split(self._run_encoded(image_bytes=self._tf.constant(list(encoded))))
+
+    @staticmethod
+    def _split(outputs):
+        probabilities = outputs['probabilities'].numpy()
+        if 'embedding' not in outputs:
+            return probabilities, np.zeros((len(probabilities), 0), dtype=np.float32)
+        return probabilities, outputs['embedding'].numpy()
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'onnx': ONNXBackend,
+    'graph': GraphBackend
+}
+
+
+class InferenceEngine:
+    """Rice disease classifier shared by all Flask apps"""
+
+    def __init__(self, model_path, class_indices_path, img_size=224,
+                 batch_sizes=DEFAULT_BATCH_SIZES, backend='keras', num_threads=None, version=None):
+        """
+        Load the model with the selected runtime backend
+
+        Args:
+            model_path (str): Path to the trained Keras model (.h5)
+            class_indices_path (str): Path to class_indices.json written by train_model.py
+            img_size (int): Square input size the model was trained on
+            batch_sizes (tuple): Fixed batch sizes; larger inputs are chunked
+            backend (str): 'keras', 'tflite', 'onnx' or 'graph' (artifacts from export_model.py)
+            num_threads (int): Intra-op threads for the runtime; None uses its default
+            version (str): Model version recorded with predictions (see model_registry.py)
+        """
+        self.img_size = img_size
+        self.batch_sizes = tuple(sorted(set(batch_sizes)))
+        self.backend_name = backend
+        self.version = version
+        self.model_path = backend_model_path(model_path, backend)
+        # Fingerprint of the file as loaded; cache entries are written and
+        # looked up under it, so a request never mixes two models
+        self.fingerprint = model_fingerprint(self.model_path)
+
+        with open(class_indices_path, 'r') as f:
+            self.class_indices = json.load(f)
+
+        self.backend = BACKENDS[backend](self.model_path, img_size, self.batch_sizes, num_threads)
+
+    def warmup(self, passes=2):
+        """Run dummy batches through every fixed batch size so first requests are fast"""
+        start = time.perf_counter()
+        for size in self.batch_sizes:
+            dummy = np.zeros((size, self.img_size, self.img_size, 3), dtype=np.float32)
+            for _ in range(passes):
+                self.backend.run(dummy)
+        elapsed = time.perf_counter() - start
+        print(f"✓ Model warm-up complete ({self.backend_name}, {len(self.batch_sizes)} batch sizes, {elapsed:.2f}s)")
+        return elapsed
+
+    @property
+    def embedding_size(self):
+        """Width of the leaf embedding, or 0 when the backend cannot return one"""
+        return getattr(self.backend, 'embedding_size', 0)
+
+    def predict(self, batch):
+        """
+        Return class probabilities for an (N, H, W, 3) batch, or for a 1-D
+        object array of encoded images when the backend decodes in-graph
+        """
+        max_size = self.batch_sizes[-1]
+
+        if getattr(batch, 'dtype', None) == object:
+            outputs = [self.backend.run_encoded(batch[start:start + max_size])
+                       for start in range(0, batch.shape[0], max_size)]
+            return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+        return self._run_padded(batch, self.backend.run)
+
+    def predict_with_embeddings(self, batch):
+        """
+        (probabilities, embeddings) for a batch from the same forward pass
+
+        Backends without an embedding output (see export_model.py) return an
+        (N, 0) embedding array.
+        """
+        if self.embedding_size and getattr(batch, 'dtype', None) == object:
+            max_size = self.batch_sizes[-1]
+            outputs = [self.backend.run_encoded_with_embeddings(batch[start:start + max_size])
+                       for start in range(0, batch.shape[0], max_size)]
+            return tuple(np.concatenate(parts, axis=0) for parts in zip(*outputs))
+        if self.embedding_size:
+            return self._run_padded(batch, self.backend.run_with_embeddings)
+        probabilities = self.predict(batch)
+        return probabilities, np.zeros((len(probabilities), 0), dtype=np.float32)
+
+    def _run_padded(self, batch, run):
+        """Chunk a batch to the largest fixed size, pad each chunk up to a traced size and run it"""
+        max_size = self.batch_sizes[-1]
+        batch = np.asarray(batch, dtype=np.float32)
+        outputs = []
+
+        for start in range(0, batch.shape[0], max_size):
+            chunk = batch[start:start + max_size]
+            rows = chunk.shape[0]
+            size = next(s for s in self.batch_sizes if s >= rows)
+
+            if size != rows:
+                padding = np.zeros((size - rows,) + chunk.shape[1:], dtype=np.float32)
+                chunk = np.concatenate([chunk, padding], axis=0)
+
+            result = run(chunk)
+            if isinstance(result, tuple):
+                outputs.append(tuple(part[:rows] for part in result))
+            else:
+                outputs.append(result[:rows])
+
+        if len(outputs) == 1:
+            return outputs[0]
+        if isinstance(outputs[0], tuple):
+            return tuple(np.concatenate(parts, axis=0) for parts in zip(*outputs))
+        return np.concatenate(outputs, axis=0)
+
+    def top_k(self, probabilities, k=3):
+        """Return the k most likely classes for one row of probabilities"""
+        order = np.argsort(probabilities)[::-1][:k]
+        return [
+            {
+                'class': self.class_indices[str(int(idx))],
+                'probability': round(float(probabilities[idx]) * 100, 2)
+            }
+            for idx in order
+        ]
+
+    def predict_top_k(self, batch, k=3):
+        """Return the top-k classes for every image in a batch"""
+        return [self.top_k(row, k) for row in self.predict(batch)]
+
+
+class BackgroundModelLoader:
+    """Builds the InferenceEngine on a background thread and tracks readiness"""
+
+    def __init__(self, load_fn):
+        """
+        Args:
+            load_fn (callable): Returns a ready-to-serve InferenceEngine
+        """
+        self.load_fn = load_fn
+        self.engine = None
+        self.state = 'not_started'
+        self.error = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start loading; returns immediately so the server can accept connections"""
+        if self._thread is not None:
+            return
+        self.state = 'loading'
+        self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+        self._thread.start()
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the model is ready; returns False on timeout or load failure"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.is_ready()
+
+    def swap(self, engine):
+        """
+        Replace the serving engine with an already-loaded one
+
+        Requests read loader.engine once and use that engine (its version and
+        fingerprint included) throughout, so in-flight ones finish on the old
+        engine and the next ones get the new engine; nothing is dropped or mixed.
+        """
+        previous = self.engine
+        self.engine = engine
+        return previous
+
+    def get_status(self):
+        """Readiness details for the health endpoint"""
+        return {
+            'state': self.state,
+            'version': self.engine.version if self.engine is not None else None,
+            'ready': self.is_ready(),
+            'load_seconds': round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            'error': self.error
+        }
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            self.engine = self.load_fn()
+            self.state = 'ready'
+            self._ready.set()
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            print(f"✗ Model failed to load: {e}")
+        finally:
+            self.load_seconds = time.perf_counter() - start
+
+        if self.state == 'ready':
+            print(f"✓ Model ready in {self.load_seconds:.2f}s")
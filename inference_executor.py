@@ -0,0 +1,180 @@
+"""
+Rice Disease Detection - Bounded Inference Executor
+Runs decoding and inference on a fixed number of worker threads behind a
+bounded wait queue, shedding requests that cannot start within a deadline
+"""
+
+import os
+import math
+import queue
+import threading
+import time
+
+# Weight of the newest task in the moving averages of queue wait and service time
+SERVICE_TIME_SMOOTHING = 0.1
+MAX_RETRY_AFTER_SECONDS = 30
+
+
+class Overloaded(Exception):
+    """Raised when a task is shed; retry_after is a suggested back-off in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f'Inference is overloaded ({reason})')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Task:
+    """A call waiting for, or running on, an executor thread"""
+
+    __slots__ = ('fn', 'args', 'queued_at', 'lock', 'started', 'cancelled', 'done', 'result', 'error')
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.queued_at = time.perf_counter()
+        self.lock = threading.Lock()
+        self.started = threading.Event()
+        self.cancelled = False
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BoundedExecutor:
+    """Fixed-concurrency worker pool with a bounded queue and a start deadline"""
+
+    def __init__(self, workers=8, max_queue=32, queue_timeout_ms=2000, name='inference'):
+        """
+        Start the worker threads
+
+        Args:
+            workers (int): Tasks that run at once; the rest wait in the queue
+            max_queue (int): Waiting tasks before new ones are shed immediately
+            queue_timeout_ms (float): Longest a task may wait to start before it is shed
+            name (str): Thread name prefix
+        """
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.queue_timeout = max(0.0, float(queue_timeout_ms)) / 1000.0
+        self.name = name
+
+        self._start()
+        # Threads don't survive fork(); pre-forked workers need their own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        """Create the task queue and start the worker threads"""
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._stats_lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._shed = {'queue_full': 0, 'deadline': 0}
+        self._avg_service = None
+        self._avg_queue_wait = 0.0
+        self._threads = [
+            threading.Thread(target=self._run, name=f'{self.name}-executor-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def run(self, fn, *args, shed=True):
+        """
+        Call fn(*args) on a worker thread and return its result
+
+        With shed=True (request handlers) the call raises Overloaded instead
+        of waiting when the queue is full or the task cannot start within
+        queue_timeout_ms. Background callers pass shed=False to wait for a slot.
+        """
+        task = _Task(fn, args)
+
+        if not shed:
+            self._queue.put(task)
+        else:
+            try:
+                self._queue.put_nowait(task)
+            except queue.Full:
+                raise self._shed_task('queue_full')
+
+            if not task.started.wait(self.queue_timeout):
+                with task.lock:
+                    if not task.started.is_set():
+                        task.cancelled = True
+                if task.cancelled:
+                    raise self._shed_task('deadline')
+
+        task.done.wait()
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def check_capacity(self):
+        """Raise Overloaded if a new task would be shed right now, before committing to work"""
+        if self._queue.full():
+            raise self._shed_task('queue_full')
+
+    def retry_after(self):
+        """Seconds until the current queue has probably drained"""
+        service = self._avg_service or 1.0
+        backlog = self._queue.qsize() + self._active
+        return min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(service * backlog / self.workers)))
+
+    def get_stats(self):
+        """Concurrency, queue depth and shed counts for the health endpoint"""
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queue_timeout_ms': self.queue_timeout * 1000.0,
+                'queue_depth': self._queue.qsize(),
+                'active': self._active,
+                'completed': self._completed,
+                'failed': self._failed,
+                'shed': dict(self._shed, total=sum(self._shed.values())),
+                'avg_queue_wait_ms': round(self._avg_queue_wait * 1000, 2),
+                'avg_service_ms': round(self._avg_service * 1000, 2) if self._avg_service is not None else None
+            }
+
+    def shed_total(self):
+        with self._stats_lock:
+            return sum(self._shed.values())
+
+    def _shed_task(self, reason):
+        with self._stats_lock:
+            self._shed[reason] += 1
+        return Overloaded(reason, self.retry_after())
+
+    def _run(self):
+        """Worker loop: skip tasks whose caller gave up, run the rest"""
+        while True:
+            task = self._queue.get()
+
+            with task.lock:
+                if task.cancelled:
+                    continue
+                task.started.set()
+
+            started = time.perf_counter()
+            with self._stats_lock:
+                self._active += 1
+                self._avg_queue_wait += SERVICE_TIME_SMOOTHING * (started - task.queued_at - self._avg_queue_wait)
+
+            try:
+                task.result = task.fn(*task.args)
+            except Exception as e:
+                task.error = e
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._stats_lock:
+                    self._active -= 1
+                    if task.error is None:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+                    if self._avg_service is None:
+                        self._avg_service = elapsed
+                    else:
+                        self._avg_service += SERVICE_TIME_SMOOTHING * (elapsed - self._avg_service)
+                task.done.set()
@@ -0,0 +1,297 @@
+"""
+Rice Disease Detection - Prediction Job Queue
+Durable SQLite-backed job queue drained by a local worker pool, with
+visibility timeouts so jobs held by a crashed worker are retried; a live
+worker keeps extending the timeout of the jobs it is running
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Completed:
+    """Handler result with work to run once the job is recorded as done, and only then"""
+
+    __slots__ = ('result', 'on_commit')
+
+    def __init__(self, result, on_commit):
+        """
+        Args:
+            result: JSON-serialisable job result
+            on_commit (callable): Called with no arguments after this worker recorded the
+                result; skipped when the job was reclaimed by another worker meanwhile
+        """
+        self.result = result
+        self.on_commit = on_commit
+
+
+class JobQueue:
+    """Submit/poll job queue with a pool of worker threads"""
+
+    def __init__(self, db_path, handler, workers=2, visibility_timeout=60, max_attempts=3,
+                 poll_interval=0.25, retention_seconds=86400):
+        """
+        Open (or create) the queue database; call start() to run the workers
+
+        Args:
+            db_path (str): SQLite file holding the queue
+            handler (callable): handler(payload, data) -> JSON-serialisable result, or a Completed
+            workers (int): Worker threads draining the queue
+            visibility_timeout (float): Seconds a claimed job stays hidden before it can be retried;
+                extended every third of it while the handler runs
+            max_attempts (int): Attempts before a job is marked failed
+            poll_interval (float): Idle sleep between polls of an empty queue
+            retention_seconds (float): Finished jobs older than this are purged
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    data BLOB,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    visible_at REAL NOT NULL,
+                    claimed_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, visible_at)")
+            if 'claimed_at' not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                # Queue files from before claims were tracked
+                conn.execute("ALTER TABLE jobs ADD COLUMN claimed_at REAL")
+
+        self._changed = threading.Condition()
+        self._threads = []
+        self._held = {}  # job id -> claimed_at of the jobs this process is running
+        self._held_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (in each pre-forked worker, not the parent)"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived autocommit connection; sqlite3 connections can't be shared across threads"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, payload, data=None):
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, data, visible_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), data, now, now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        """Return a job's status, payload and result, or None if unknown"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, payload, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        return {
+            'job_id': row[0],
+            'status': row[1],
+            'payload': json.loads(row[2]),
+            'result': json.loads(row[3]) if row[3] else None,
+            'error': row[4],
+            'attempts': row[5],
+            'created_at': row[6],
+            'updated_at': row[7]
+        }
+
+    def wait_for_change(self, timeout):
+        """Block until any job finishes in this process, or the timeout passes"""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def get_stats(self):
+        """Job counts per state"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = {state: 0 for state in (QUEUED, RUNNING, DONE, FAILED)}
+        stats.update(dict(rows))
+        stats['workers'] = self.workers
+        return stats
+
+    def _claim(self):
+        """Atomically claim the oldest visible job; returns (id, claimed_at, payload, data, attempts) or None"""
+        while True:
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT id, payload, data, attempts FROM jobs "
+                    "WHERE status IN (?, ?) AND visible_at <= ? ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+
+                if not row:
+                    conn.execute("COMMIT")
+                    return None
+
+                job_id, payload, data, attempts = row
+                if attempts >= self.max_attempts:
+                    # The last worker holding it died or timed out; give up on it
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, data = NULL, error = ?, updated_at = ? WHERE id = ?",
+                        (FAILED, 'Worker did not finish the job', now, job_id)
+                    )
+                    conn.execute("COMMIT")
+                    self._notify()
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, visible_at = ?, claimed_at = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (RUNNING, now + self.visibility_timeout, now, now, job_id)
+                )
+                conn.execute("COMMIT")
+                return job_id, now, json.loads(payload), data, attempts + 1
+
+    def _finish(self, job_id, claimed_at, status, result=None, error=None, retry_at=None):
+        """
+        Record a job's outcome if this claim still holds the job; the image bytes
+        are dropped once it is final
+
+        Returns False when the job was reclaimed (its visibility timeout ran out)
+        or failed by another worker meanwhile; its outcome then is theirs to record.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, visible_at = ?, updated_at = ?, "
+                "data = CASE WHEN ? IN (?, ?) THEN NULL ELSE data END "
+                "WHERE id = ? AND status = ? AND claimed_at = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 retry_at if retry_at is not None else now, now, status, DONE, FAILED,
+                 job_id, RUNNING, claimed_at)
+            ).rowcount
+        if not updated:
+            print(f"⚠ Job {job_id} was taken over by another worker; dropping this attempt's outcome")
+            return False
+        self._notify()
+        return True
+
+    def _heartbeat(self):
+        """Push back the visibility timeout of the jobs this process is running, so slow ones aren't run twice"""
+        while True:
+            time.sleep(self.visibility_timeout / 3)
+            with self._held_lock:
+                held = list(self._held.items())
+            if not held:
+                continue
+
+            try:
+                with self._connect() as conn:
+                    for job_id, claimed_at in held:
+                        extended = conn.execute(
+                            "UPDATE jobs SET visible_at = ? WHERE id = ? AND status = ? AND claimed_at = ?",
+                            (time.time() + self.visibility_timeout, job_id, RUNNING, claimed_at)
+                        ).rowcount
+                        if not extended:
+                            print(f"⚠ Job {job_id} is no longer held by this worker")
+            except sqlite3.Error as e:
+                print(f"✗ Job queue heartbeat error: {e}")
+
+    def _purge(self):
+        """Delete finished jobs past the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _run(self):
+        """Worker loop: claim, run the handler, record the result or schedule a retry"""
+        last_purge = 0
+
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"✗ Job queue error: {e}")
+                time.sleep(self.poll_interval)
+                continue
+
+            if job is None:
+                if time.time() - last_purge > 3600:
+                    self._purge()
+                    last_purge = time.time()
+                time.sleep(self.poll_interval)
+                continue
+
+            job_id, claimed_at, payload, data, attempts = job
+            with self._held_lock:
+                self._held[job_id] = claimed_at
+            try:
+                result = self.handler(payload, data)
+            except Exception as e:
+                print(f"✗ Job {job_id} attempt {attempts} failed: {e}")
+                if attempts >= self.max_attempts:
+                    self._finish(job_id, claimed_at, FAILED, error=str(e))
+                else:
+                    # Exponential backoff before the job becomes visible again
+                    self._finish(job_id, claimed_at, QUEUED, error=str(e), retry_at=time.time() + 2 ** attempts)
+            else:
+                on_commit = None
+                if isinstance(result, Completed):
+                    result, on_commit = result.result, result.on_commit
+                if self._finish(job_id, claimed_at, DONE, result=result) and on_commit is not None:
+                    try:
+                        on_commit()
+                    except Exception as e:
+                        print(f"✗ Job {job_id} finished, but its follow-up failed: {e}")
+            finally:
+                with self._held_lock:
+                    self._held.pop(job_id, None)
@@ -0,0 +1,688 @@
+"""
+Rice Disease Detection - Load Test
+Drives app_auth.py end to end at a configurable concurrency with a
+deterministic stub model and an embedded SQLite database standing in for
+MySQL, and reports per-route latency percentiles and throughput as JSON
+
+Usage:
+    python load_test.py [--concurrency 16] [--duration 30] [--stub-latency-ms 20]
+    python load_test.py compare <baseline.json> <candidate.json>
+"""
+
+import os
+import io
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import http.client
+from datetime import datetime
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from inference_engine import InferenceEngine, DEFAULT_BATCH_SIZES
+
+# Configuration
+CLASS_INDICES_PATH = 'models/class_indices.json'
+RESULTS_DIR = 'results/load_test'
+PASSWORD = 'loadtest-password'
+FARMERS = 50
+RESEARCHERS = 10
+SHOPS = 40
+IMAGE_SIZE = (800, 600)
+FARM_LOCATION = (10.7905, 78.7047)  # Tiruchirappalli, inside the default 10 km shop radius
+
+# Weighted operations each virtual user picks from
+FARMER_MIX = [('predict', 4), ('shops', 2), ('products', 1), ('cart_get', 2), ('cart_add', 1), ('login', 1)]
+RESEARCHER_MIX = [('gene_analysis_get', 3), ('gene_analysis_post', 1), ('login', 1)]
+
+ROUTE_LABELS = {
+    'login': 'POST /login',
+    'predict': 'POST /api/predict',
+    'shops': 'GET /api/farmer/shops',
+    'products': 'GET /api/farmer/products',
+    'cart_get': 'GET /api/farmer/cart',
+    'cart_add': 'POST /api/farmer/cart',
+    'gene_analysis_get': 'GET /api/researcher/gene-analysis',
+    'gene_analysis_post': 'POST /api/researcher/gene-analysis'
+}
+
+# SQLite translation of the tables the driven routes touch (code.sql,
+# create_rice_analysis_table.sql, plus the live pesticide columns)
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    user_type TEXT NOT NULL,
+    whatsapp_number TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE farmers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE REFERENCES users(id),
+    full_name TEXT NOT NULL,
+    phone_number TEXT,
+    address TEXT,
+    city TEXT,
+    state TEXT,
+    latitude REAL,
+    longitude REAL,
+    farm_size REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE researchers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE REFERENCES users(id),
+    full_name TEXT NOT NULL,
+    organization TEXT,
+    department TEXT,
+    research_focus TEXT,
+    phone_number TEXT
+);
+CREATE TABLE diseases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    treatment TEXT
+);
+CREATE TABLE pesticides (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    price_per_unit REAL NOT NULL,
+    unit_type TEXT NOT NULL,
+    effectiveness_rating REAL,
+    application_method TEXT,
+    dosage_per_acre TEXT,
+    stock_quantity INTEGER DEFAULT 0
+);
+CREATE TABLE fertilizers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    type TEXT NOT NULL,
+    price_per_unit REAL NOT NULL,
+    unit_type TEXT NOT NULL,
+    stock_quantity INTEGER DEFAULT 0
+);
+CREATE TABLE disease_pesticide_mapping (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    disease_id INTEGER NOT NULL REFERENCES diseases(id),
+    pesticide_id INTEGER NOT NULL REFERENCES pesticides(id)
+);
+CREATE TABLE shops (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    shop_type TEXT NOT NULL DEFAULT 'both',
+    address TEXT NOT NULL,
+    city TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    email TEXT,
+    whatsapp_number TEXT,
+    phone_number TEXT,
+    opening_time TEXT,
+    closing_time TEXT,
+    rating REAL
+);
+CREATE TABLE prediction_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    farmer_id INTEGER NOT NULL REFERENCES farmers(id),
+    image_filename TEXT NOT NULL,
+    disease_detected TEXT,
+    disease_id INTEGER,
+    confidence_score REAL,
+    model_version TEXT,
+    embedding BLOB,
+    prediction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE carts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    farmer_id INTEGER NOT NULL UNIQUE REFERENCES farmers(id)
+);
+CREATE TABLE cart_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cart_id INTEGER NOT NULL REFERENCES carts(id),
+    product_type TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 1,
+    price_at_purchase REAL,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE rice_gene_expression (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rice_variety TEXT NOT NULL,
+    ros_level REAL NOT NULL,
+    osrmc_level REAL NOT NULL,
+    sub1a_level REAL NOT NULL,
+    cat_level REAL NOT NULL,
+    snca3_level REAL NOT NULL,
+    stress_condition TEXT NOT NULL,
+    researcher_id INTEGER REFERENCES users(id),
+    submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    notes TEXT
+);
+CREATE INDEX idx_variety ON rice_gene_expression (rice_variety);
+CREATE INDEX idx_stress ON rice_gene_expression (stress_condition);
+CREATE INDEX idx_date ON rice_gene_expression (submission_date);
+"""
+
+# MySQL-only syntax used by app_auth.py and its SQLite equivalent
+MYSQL_TO_SQLITE = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'LAST_INSERT_ID\(\)', re.IGNORECASE), 'last_insert_rowid()'),
+    (re.compile(r'NOW\(\)', re.IGNORECASE), "datetime('now', 'localtime')")
+]
+
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SQLiteDatabaseConnection:
+    """Drop-in for db_connect.DatabaseConnection backed by a local SQLite file"""
+
+    path = None  # set by create_database()
+
+    def __init__(self, *args, **kwargs):
+        self.connection = None
+        self.cursor = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.connect_seconds = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            self.connection = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                                              check_same_thread=False)
+            self.cursor = self.connection.cursor()
+            return True
+        except sqlite3.Error as e:
+            print(f"✗ Error while connecting to SQLite: {e}")
+            return False
+        finally:
+            self.connect_seconds += time.perf_counter() - start
+
+    def disconnect(self):
+        if self.connection:
+            self.cursor.close()
+            self.connection.close()
+            self.connection = None
+            self.cursor = None
+
+    def _run(self, run, failed, write=False):
+        """Connect on the first query, like DatabaseConnection, and count it"""
+        if self.cursor is None and not self.connect():
+            return failed
+        start = time.perf_counter()
+        try:
+            result = run()
+            if write:
+                self.connection.commit()
+            return result
+        except sqlite3.Error as e:
+            print(f"✗ Error running query: {e}")
+            if write:
+                self.connection.rollback()
+            return failed
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+    def execute_query(self, query, params=None):
+        return self._run(lambda: self.cursor.execute(_translate(query), params or ()) and True, False, write=True)
+
+    def execute_many(self, query, rows):
+        return self._run(lambda: self.cursor.executemany(_translate(query), rows) and True, False, write=True)
+
+    def fetch_query(self, query, params=None):
+        return self._run(lambda: self.cursor.execute(_translate(query), params or ()).fetchall(), None)
+
+    def fetch_one(self, query, params=None):
+        return self._run(lambda: self.cursor.execute(_translate(query), params or ()).fetchone(), None)
+
+
+def _translate(query):
+    for pattern, replacement in MYSQL_TO_SQLITE:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def create_database(path, class_indices, seed=0):
+    """Build the SQLite stand-in with users, shops, products and treatments"""
+    rng = random.Random(seed)
+    password_hash = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+
+    users = [(f'farmer{i}', 'farmer') for i in range(FARMERS)] + \
+            [(f'researcher{i}', 'researcher') for i in range(RESEARCHERS)]
+    for i, (username, user_type) in enumerate(users):
+        user_id = conn.execute(
+            "INSERT INTO users (username, email, password_hash, user_type, whatsapp_number) VALUES (?, ?, ?, ?, ?)",
+            (username, f'{username}@example.com', password_hash, user_type, f'+9190000{i:05d}')
+        ).lastrowid
+        if user_type == 'farmer':
+            conn.execute(
+                "INSERT INTO farmers (user_id, full_name, city, state, latitude, longitude, farm_size) "
+                "VALUES (?, ?, 'Tiruchirappalli', 'Tamil Nadu', ?, ?, ?)",
+                (user_id, f'Farmer {i}', FARM_LOCATION[0] + rng.uniform(-0.02, 0.02),
+                 FARM_LOCATION[1] + rng.uniform(-0.02, 0.02), round(rng.uniform(0.5, 5), 2))
+            )
+        else:
+            conn.execute("INSERT INTO researchers (user_id, full_name, organization) VALUES (?, ?, 'Rice Institute')",
+                         (user_id, f'Researcher {i}'))
+
+    for i in range(SHOPS):
+        conn.execute(
+            "INSERT INTO shops (name, shop_type, address, city, latitude, longitude, email, whatsapp_number, "
+            "phone_number, opening_time, closing_time, rating) "
+            "VALUES (?, 'both', ?, 'Tiruchirappalli', ?, ?, ?, ?, ?, '09:00:00', '19:00:00', ?)",
+            (f'Agro Shop {i}', f'{i} Market Road', FARM_LOCATION[0] + rng.uniform(-0.15, 0.15),
+             FARM_LOCATION[1] + rng.uniform(-0.15, 0.15), f'shop{i}@example.com', f'+9180000{i:05d}',
+             f'+9170000{i:05d}', round(rng.uniform(3, 5), 2))
+        )
+
+    for i in range(12):
+        conn.execute(
+            "INSERT INTO pesticides (name, description, price_per_unit, unit_type, effectiveness_rating, "
+            "application_method, dosage_per_acre) VALUES (?, 'Synthetic pesticide', ?, 'ml', ?, 'Foliar spray', ?)",
+            (f'Pesticide {i}', round(rng.uniform(100, 900), 2), round(rng.uniform(60, 95), 1), f'{i + 1}ml/liter')
+        )
+    for i in range(6):
+        conn.execute(
+            "INSERT INTO fertilizers (name, description, type, price_per_unit, unit_type) "
+            "VALUES (?, 'Synthetic fertilizer', 'mixed', ?, 'kg')",
+            (f'Fertilizer {i}', round(rng.uniform(200, 1500), 2))
+        )
+
+    # Named after the model's classes so recommendations come from the database
+    for disease in class_indices.values():
+        disease_id = conn.execute("INSERT INTO diseases (name, treatment) VALUES (?, 'Synthetic treatment')",
+                                  (disease,)).lastrowid
+        for pesticide_id in rng.sample(range(1, 13), 4):
+            conn.execute("INSERT INTO disease_pesticide_mapping (disease_id, pesticide_id) VALUES (?, ?)",
+                         (disease_id, pesticide_id))
+
+    conn.commit()
+    conn.close()
+    SQLiteDatabaseConnection.path = path
+
+
+class StubBackend:
+    """Deterministic stand-in for a model runtime: softmax of fixed weights on channel means"""
+
+    name = 'stub'
+
+    def __init__(self, num_classes, latency_ms=0):
+        self.weights = np.random.default_rng(0).normal(0, 8, (3, num_classes)).astype(np.float32)
+        self.latency_ms = latency_ms
+
+    def run(self, batch):
+        if self.latency_ms:
+            # Releases the GIL like a real runtime's forward pass
+            time.sleep(self.latency_ms / 1000)
+        logits = batch.mean(axis=(1, 2)) @ self.weights
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class StubEngine(InferenceEngine):
+    """InferenceEngine with the stub backend; batching, padding and top-k are the real code"""
+
+    def __init__(self, class_indices_path, img_size=224, batch_sizes=DEFAULT_BATCH_SIZES, latency_ms=0):
+        self.img_size = img_size
+        self.batch_sizes = tuple(sorted(set(batch_sizes)))
+        self.backend_name = StubBackend.name
+        self.version = 'stub'
+        self.model_path = None
+
+        with open(class_indices_path, 'r') as f:
+            self.class_indices = json.load(f)
+
+        self.backend = StubBackend(len(self.class_indices), latency_ms)
+
+
+def synthetic_leaf(rng, disease):
+    """JPEG of a rice leaf on soil with disease-coloured lesions"""
+    width, height = IMAGE_SIZE
+    image = Image.new('RGB', IMAGE_SIZE, (int(rng.integers(70, 110)), int(rng.integers(55, 80)), 40))
+    draw = ImageDraw.Draw(image)
+
+    # A long tapered blade running roughly corner to corner
+    leaf_green = (int(rng.integers(40, 90)), int(rng.integers(120, 180)), int(rng.integers(30, 70)))
+    y0, y1 = rng.integers(height // 4, 3 * height // 4, size=2)
+    draw.polygon([(0, y0 - 60), (width, y1 - 10), (width, y1 + 10), (0, y0 + 60)], fill=leaf_green)
+
+    lesion_colours = {
+        0: ((200, 190, 90), (150, 120, 40)),   # yellow streaks
+        1: ((130, 120, 100), (90, 60, 40)),    # grey diamond centres
+        2: ((110, 70, 30), (80, 50, 20)),      # brown spots
+        3: ((220, 180, 60), (200, 150, 40))    # orange-yellow discolouration
+    }
+    halo, core = lesion_colours[disease % len(lesion_colours)]
+    for _ in range(int(rng.integers(8, 30))):
+        x = int(rng.integers(0, width))
+        y = int(y0 + (y1 - y0) * x / width + rng.integers(-40, 40))
+        rx, ry = int(rng.integers(6, 25)), int(rng.integers(3, 10))
+        draw.ellipse([x - rx - 3, y - ry - 3, x + rx + 3, y + ry + 3], fill=halo)
+        draw.ellipse([x - rx, y - ry, x + rx, y + ry], fill=core)
+
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def multipart_body(field, filename, data, content_type='image/jpeg'):
+    boundary = f'loadtest{random.getrandbits(64):016x}'
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class VirtualUser:
+    """One logged-in client with its own session cookie and keep-alive connection"""
+
+    def __init__(self, host, port, username, user_type, images, rng):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.user_type = user_type
+        self.images = images
+        self.rng = rng
+        self.cookie = None
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        mix = FARMER_MIX if user_type == 'farmer' else RESEARCHER_MIX
+        self.operations = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Server closed the keep-alive connection; retry once on a fresh one
+            self.conn.close()
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response
+
+    def login(self):
+        body = urlencode({'username': self.username, 'password': PASSWORD, 'user_type': self.user_type})
+        response = self.request('POST', '/login', body,
+                                {'Content-Type': 'application/x-www-form-urlencoded'})
+        # Success redirects to the dashboard; failure re-renders the form with 200
+        return response.status == 302, response.status
+
+    def run_operation(self, name):
+        """Run one operation; returns (succeeded, HTTP status)"""
+        if name == 'login':
+            return self.login()
+
+        if name == 'predict':
+            disease, data = self.images[int(self.rng.integers(len(self.images)))]
+            body, content_type = multipart_body('image', f'leaf_{disease}.jpg', data)
+            response = self.request('POST', '/api/predict', body, {'Content-Type': content_type})
+        elif name == 'shops':
+            response = self.request('GET', '/api/farmer/shops')
+        elif name == 'products':
+            response = self.request('GET', '/api/farmer/products')
+        elif name == 'cart_get':
+            response = self.request('GET', '/api/farmer/cart')
+        elif name == 'cart_add':
+            product_type = 'pesticide' if self.rng.random() < 0.7 else 'fertilizer'
+            product_id = int(self.rng.integers(1, 13 if product_type == 'pesticide' else 7))
+            body = json.dumps({'product_id': product_id, 'product_type': product_type, 'quantity': 1})
+            response = self.request('POST', '/api/farmer/cart', body, {'Content-Type': 'application/json'})
+        elif name == 'gene_analysis_get':
+            response = self.request('GET', '/api/researcher/gene-analysis?limit=50')
+        elif name == 'gene_analysis_post':
+            levels = {gene: round(float(self.rng.uniform(0, 10)), 6)
+                      for gene in ('ros_level', 'osrmc_level', 'sub1a_level', 'cat_level', 'snca3_level')}
+            body = json.dumps(dict(levels, rice_variety=f'Variety {int(self.rng.integers(10))}',
+                                   stress_condition=['drought', 'submergence', 'salinity'][int(self.rng.integers(3))],
+                                   notes='load test'))
+            response = self.request('POST', '/api/researcher/gene-analysis', body,
+                                    {'Content-Type': 'application/json'})
+        else:
+            raise ValueError(f"Unknown operation '{name}'")
+
+        return 200 <= response.status < 300, response.status
+
+    def next_operation(self):
+        return self.rng.choice(self.operations, p=np.array(self.weights) / sum(self.weights))
+
+
+def start_app(workdir, stub_latency_ms):
+    """Import app_auth inside workdir with the stub model and database, and serve it on a free port"""
+    from werkzeug.serving import make_server
+
+    # serve.py-style startup: the model is loaded explicitly below
+    os.environ['MODEL_BACKGROUND_LOAD'] = '0'
+    os.chdir(workdir)
+    import app_auth
+
+    app_auth.DatabaseConnection = SQLiteDatabaseConnection
+    app_auth.model_loader.load_fn = lambda: StubEngine(CLASS_INDICES_PATH, app_auth.IMG_SIZE,
+                                                       latency_ms=stub_latency_ms)
+    app_auth.model_loader.start()
+    if not app_auth.model_loader.wait(60):
+        raise RuntimeError(f"Stub model failed to load: {app_auth.model_loader.error}")
+
+    server = make_server('127.0.0.1', 0, app_auth.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return app_auth, server
+
+
+def run_user(user, deadline, measure_from):
+    """Worker loop for one virtual user; returns [(operation, latency_ms, ok, status)]"""
+    samples = []
+    operation = 'login'
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            ok, status = user.run_operation(operation)
+        except Exception:
+            ok, status = False, None
+        if start >= measure_from:
+            samples.append((operation, (time.perf_counter() - start) * 1000, ok, status))
+        operation = user.next_operation()
+    user.conn.close()
+    return samples
+
+
+def latency_summary(samples, elapsed):
+    """Request count, errors, throughput and latency percentiles for a list of samples"""
+    latencies = np.array([sample[1] for sample in samples]) if samples else np.zeros(1)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok, status in samples if not ok and status != 429),
+        'shed': sum(1 for sample in samples if sample[3] == 429),
+        'rps': round(len(samples) / elapsed, 2),
+        'mean_ms': round(float(latencies.mean()), 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_load_test(args):
+    repo_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='rice-load-test-')
+    os.makedirs(os.path.join(workdir, 'models'))
+    shutil.copy2(CLASS_INDICES_PATH, os.path.join(workdir, CLASS_INDICES_PATH))
+    with open(CLASS_INDICES_PATH, 'r') as f:
+        class_indices = json.load(f)
+
+    rng = np.random.default_rng(args.seed)
+    create_database(os.path.join(workdir, 'load_test.db'), class_indices, args.seed)
+    images = [(i % len(class_indices), synthetic_leaf(rng, i % len(class_indices))) for i in range(args.images)]
+    print(f"✓ Generated {len(images)} synthetic leaf images "
+          f"(mean {np.mean([len(data) for _, data in images]) / 1024:.0f} KB)")
+
+    # The app and the dev server log every request; keep them out of the report
+    app_log = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    if not args.verbose:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    try:
+        with app_log:
+            app_auth, server = start_app(workdir, args.stub_latency_ms)
+        host, port = server.server_address[:2]
+        print(f"✓ app_auth.py serving on http://{host}:{port} (stub model, SQLite database)")
+
+        researchers = int(round(args.concurrency * args.researcher_share))
+        users = []
+        for i in range(args.concurrency):
+            user_type = 'researcher' if i < researchers else 'farmer'
+            username = f'researcher{i % RESEARCHERS}' if user_type == 'researcher' else f'farmer{i % FARMERS}'
+            users.append(VirtualUser(host, port, username, user_type, images,
+                                     np.random.default_rng(args.seed + i + 1)))
+
+        print(f"Running {args.concurrency} users ({researchers} researchers) for {args.duration}s "
+              f"after {args.warmup}s warm-up...")
+        start = time.perf_counter()
+        measure_from = start + args.warmup
+        deadline = measure_from + args.duration
+        with app_log, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            per_user = list(pool.map(lambda user: run_user(user, deadline, measure_from), users))
+        elapsed = time.perf_counter() - measure_from
+
+        server.shutdown()
+        app_auth.upload_writer.flush()
+        app_auth.history_writer.close()
+        batching = app_auth.batcher.get_stats()
+    finally:
+        os.chdir(repo_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    samples = [sample for user_samples in per_user for sample in user_samples]
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'concurrency': args.concurrency,
+            'duration_seconds': args.duration,
+            'warmup_seconds': args.warmup,
+            'researcher_share': args.researcher_share,
+            'stub_latency_ms': args.stub_latency_ms,
+            'images': args.images,
+            'seed': args.seed,
+            'batch_max_size': app_auth.BATCH_MAX_SIZE,
+            'batch_max_wait_ms': app_auth.BATCH_MAX_WAIT_MS
+        },
+        'elapsed_seconds': round(elapsed, 2),
+        'overall': latency_summary(samples, elapsed),
+        'routes': {
+            ROUTE_LABELS[operation]: latency_summary([s for s in samples if s[0] == operation], elapsed)
+            for operation in ROUTE_LABELS
+            if any(s[0] == operation for s in samples)
+        },
+        'batching': {key: batching[key] for key in ('batches', 'images', 'avg_batch_size', 'batch_size_histogram')}
+    }
+
+
+def print_report(report):
+    print(f"\n{'Route':<36} {'Requests':>9} {'Errors':>7} {'Shed':>6} {'RPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print("-" * 97)
+    rows = list(report['routes'].items()) + [('TOTAL', report['overall'])]
+    for label, r in rows:
+        print(f"{label:<36} {r['requests']:>9} {r['errors']:>7} {r.get('shed', 0):>6} {r['rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+    print(f"\nAverage micro-batch size: {report['batching']['avg_batch_size']}")
+
+
+def compare_reports(baseline_path, candidate_path):
+    """Print per-route throughput and latency changes between two saved runs"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    with open(candidate_path, 'r') as f:
+        candidate = json.load(f)
+
+    print(f"Baseline {baseline['commit']} -> candidate {candidate['commit']}")
+    if baseline['config'] != candidate['config']:
+        print("⚠ The runs used different configurations; deltas may not be comparable")
+
+    print(f"\n{'Route':<36} {'RPS':>16} {'p50 ms':>16} {'p99 ms':>16}")
+    print("-" * 86)
+    routes = [(label, baseline['routes'].get(label), candidate['routes'].get(label)) for label in candidate['routes']]
+    routes.append(('TOTAL', baseline['overall'], candidate['overall']))
+    for label, before, after in routes:
+        if before is None:
+            continue
+        cells = []
+        for key in ('rps', 'p50_ms', 'p99_ms'):
+            change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0
+            cells.append(f"{after[key]:>8.1f} ({change:+5.1f}%)")
+        print(f"{label:<36} " + ' '.join(cells))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Load test app_auth.py with a stub model and SQLite database')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('LOAD_TEST_CONCURRENCY', 16)),
+                        help='Simultaneous virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before the measurement')
+    parser.add_argument('--researcher-share', type=float, default=0.25, help='Fraction of users that are researchers')
+    parser.add_argument('--stub-latency-ms', type=float, default=20,
+                        help='Simulated forward-pass time per batch; 0 measures the app alone')
+    parser.add_argument('--images', type=int, default=32, help='Distinct synthetic uploads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help=f'Report path (default {RESULTS_DIR}/<timestamp>_<commit>.json)')
+    parser.add_argument('--verbose', action='store_true', help="Show the app's own log output")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'compare':
+        compare_reports(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    args = parse_args(sys.argv[1:])
+
+    print("=" * 50)
+    print("Load Test")
+    print("=" * 50)
+
+    report = run_load_test(args)
+    print_report(report)
+
+    output_path = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print(f"\n✓ Results saved to {output_path}")
+    print(f"  Compare runs with: python load_test.py compare <baseline.json> {output_path}")
@@ -0,0 +1,391 @@
+"""
+Rice Disease Detection - Metrics
+Lightweight Prometheus text-format histograms, counters and gauges for
+per-stage and per-route latency, cheap enough to leave on in production;
+pre-forked workers can share a directory so /metrics covers all of them
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from flask import Response, g, request
+
+# Latency buckets in seconds, 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative histogram per label combination"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        """Record one observation; label values follow labelnames order"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), then sum
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """Observe the duration of a with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def samples(self):
+        """Per-bucket counts and sum by label values"""
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    @staticmethod
+    def merge(values, other):
+        return [a + b for a, b in zip(values, other)]
+
+    def collect(self, series=None):
+        """Exposition lines for this process, or for series merged from several"""
+        if series is None:
+            series = self.samples()
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labelvalues, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value that goes up and down, or is read from a callback at scrape time"""
+
+    type = 'gauge'
+    # How a gauge reported by several workers is combined: 'sum', 'min' or 'max'
+    MERGE_MODES = {'sum': lambda a, b: a + b, 'min': min, 'max': max}
+
+    def __init__(self, name, documentation, labelnames=(), fn=None, multiprocess_mode='sum'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.multiprocess_mode = multiprocess_mode
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def samples(self):
+        """Current value by label values"""
+        if self.fn is not None:
+            value = self.fn()
+            return {} if value is None else {(): value}
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def merge(self, value, other):
+        return self.MERGE_MODES[self.multiprocess_mode](value, other)
+
+    def collect(self, values=None):
+        """Exposition lines for this process, or for values merged from several"""
+        if values is None:
+            values = self.samples()
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labelvalues, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Gauge):
+    """Value that only goes up (or a callback returning one); a restart starts it again from zero"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        super().__init__(name, documentation, labelnames, fn)
+
+    def dec(self, *labelvalues, amount=1):
+        raise ValueError('Counters only go up')
+
+    def set(self, value, *labelvalues):
+        raise ValueError('Counters only go up')
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        self.directory = None
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=(), fn=None, multiprocess_mode='sum'):
+        return self._register(Gauge(name, documentation, labelnames, fn, multiprocess_mode))
+
+    def counter(self, name, documentation, labelnames=(), fn=None):
+        return self._register(Counter(name, documentation, labelnames, fn))
+
+    def enable_multiprocess(self, directory):
+        """
+        Render the metrics of every process sharing directory, e.g. the
+        pre-forked workers of serve.py, instead of this process's alone
+
+        Each process keeps a JSON snapshot of its own metrics in the directory
+        (written on every scrape and by write_snapshot()). Histograms and
+        counters are summed over every snapshot, including those of workers
+        that have exited; gauges only over workers that are still running.
+        Call this in the parent before forking: the children start from zero.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        os.register_at_fork(after_in_child=self._reset_values)
+
+    def write_snapshot(self):
+        """Publish this process's metrics to the shared directory"""
+        if self.directory is None:
+            return
+        self._write_json(self._snapshot_path(os.getpid()), {
+            'pid': os.getpid(),
+            'metrics': {metric.name: [[list(labels), value] for labels, value in metric.samples().items()]
+                        for metric in self._metrics}
+        })
+
+    def retire(self):
+        """
+        Fold this process's histograms and counters into the directory's
+        archive and drop its snapshot, so recycled workers keep their counts
+        without leaving a file each behind
+        """
+        if self.directory is None:
+            return
+        import fcntl  # POSIX only, like the pre-forking server that uses it
+
+        archive_path = os.path.join(self.directory, 'archive.json')
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = self._read_snapshot(archive_path) or {}
+            own = {metric.name: metric.samples() for metric in self._metrics if metric.type != 'gauge'}
+            for metric in self._metrics:
+                if metric.type != 'gauge':
+                    self._merge_into(merged.setdefault(metric.name, {}), metric, own[metric.name])
+            self._write_json(archive_path, {'metrics': {
+                name: [[list(labels), value] for labels, value in series.items()] for name, series in merged.items()
+            }})
+        try:
+            os.remove(self._snapshot_path(os.getpid()))
+        except OSError:
+            pass
+        # Its counts are in the archive now; a later scrape must not publish them again
+        self.directory = None
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        merged = self._collect_directory() if self.directory is not None else {}
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect(merged.get(metric.name, {})) if self.directory is not None
+                         else metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def _collect_directory(self):
+        """Samples merged across every process snapshot in the directory"""
+        self.write_snapshot()
+        merged = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            pid = filename[:-len('.json')]
+            live = pid.isdigit() and _process_alive(int(pid))
+            snapshot = self._read_snapshot(os.path.join(self.directory, filename))
+            if snapshot is None:
+                continue
+            for metric in self._metrics:
+                if metric.name in snapshot and (live or metric.type != 'gauge'):
+                    self._merge_into(merged.setdefault(metric.name, {}), metric, snapshot[metric.name])
+        return merged
+
+    @staticmethod
+    def _merge_into(merged, metric, series):
+        for labels, value in series.items():
+            merged[labels] = value if labels not in merged else metric.merge(merged[labels], value)
+
+    @staticmethod
+    def _read_snapshot(path):
+        """{metric name: {label values: value}} from a snapshot file, None if it is missing or unreadable"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {name: {tuple(labels): value for labels, value in series}
+                for name, series in data.get('metrics', {}).items()}
+
+    @staticmethod
+    def _write_json(path, data):
+        # Readers never see a half-written file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def _reset_values(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Shared by the app modules; one registry per process, merged across workers
+# when enable_multiprocess() is on
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'rice_stage_duration_seconds', 'Time spent in each stage of the prediction path', ('stage',)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'rice_http_request_duration_seconds', 'HTTP request duration by route', ('method', 'route', 'status')
+)
+IN_FLIGHT = REGISTRY.gauge(
+    'rice_http_requests_in_flight', 'Requests currently being handled', ('route',)
+)
+# Upper bounds of the queries-per-request buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+DB_QUERIES = REGISTRY.histogram(
+    'rice_db_queries_per_request', 'Database queries run by each request', ('route',), QUERY_COUNT_BUCKETS
+)
+DB_SECONDS = REGISTRY.histogram(
+    'rice_db_query_seconds_per_request', 'Time each request spent running database queries', ('route',)
+)
+
+
+def stage_timer(stage):
+    """with stage_timer('decode'): ... records the block under rice_stage_duration_seconds"""
+    return STAGE_SECONDS.time(stage)
+
+
+def instrument_app(app):
+    """Time every request by route and expose everything at GET /metrics"""
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = route_label()
+        IN_FLIGHT.inc(g.metrics_route)
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                                    g.metrics_route, str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            IN_FLIGHT.dec(route)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def register_serving_gauges(model_loader, upload_writer, batcher=None, executor=None, db_pool=None):
+    """Scrape-time gauges for model readiness, the background queues and the database pool"""
+    # Across workers: ready only when every worker is, and the slowest load
+    REGISTRY.gauge('rice_model_ready', 'Whether the model is loaded and serving',
+                   fn=lambda: int(model_loader.is_ready()), multiprocess_mode='min')
+    REGISTRY.gauge('rice_model_load_seconds', 'Time taken to load and warm up the model',
+                   fn=lambda: model_loader.load_seconds, multiprocess_mode='max')
+    REGISTRY.gauge('rice_upload_writes_pending', 'Uploads waiting to be written to disk',
+                   fn=upload_writer.pending)
+    if batcher is not None:
+        REGISTRY.gauge('rice_batch_queue_depth', 'Requests waiting for a batched forward pass',
+                       fn=lambda: batcher.get_stats()['queue_depth'])
+    if executor is not None:
+        REGISTRY.gauge('rice_inference_queue_depth', 'Requests waiting for an inference worker',
+                       fn=lambda: executor.get_stats()['queue_depth'])
+        REGISTRY.counter('rice_inference_requests_shed_total', 'Requests rejected with 429',
+                         fn=executor.shed_total)
+    if db_pool is not None:
+        REGISTRY.gauge('rice_db_connections_in_use', 'Pooled database connections checked out',
+                       fn=lambda: db_pool.get_stats()['in_use'])
+        REGISTRY.gauge('rice_db_pool_waiters', 'Requests waiting for a free database connection',
+                       fn=lambda: db_pool.get_stats()['waiters'])
@@ -0,0 +1,159 @@
+"""
+Rice Disease Detection - Model Cascade
+A small, fast classifier answers first; images it is unsure about fall
+through to the full CNN. The confidence threshold is calibrated on the
+validation split by calibrate_cascade.py.
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from prediction_cache import model_fingerprint
+
+# Configuration
+FAST_MODEL_PATH = 'models/rice_disease_fast_model.h5'
+CASCADE_CONFIG_PATH = 'models/cascade.json'
+# Largest validation accuracy loss the calibrated threshold may cost
+MAX_ACCURACY_DROP = 0.005
+
+
+def cascade_outcome(fast_probs, full_probs, labels, threshold):
+    """
+    Accuracy of a threshold on labelled data
+
+    Args:
+        fast_probs (np.ndarray): (N, classes) fast-model output
+        full_probs (np.ndarray): (N, classes) full-model output
+        labels (np.ndarray): (N,) true class indices
+        threshold (float): Top-1 fast-model probability that skips the full model
+
+    Returns:
+        dict: Fraction served by the fast path and fast/full/cascade accuracy
+    """
+    confident = fast_probs.max(axis=1) >= threshold
+    fast_pred = fast_probs.argmax(axis=1)
+    full_pred = full_probs.argmax(axis=1)
+    cascade_pred = np.where(confident, fast_pred, full_pred)
+    return {
+        'threshold': round(float(threshold), 4),
+        'fast_path_fraction': round(float(confident.mean()), 4),
+        'accuracy_fast': round(float(np.mean(fast_pred == labels)), 4),
+        'accuracy_full': round(float(np.mean(full_pred == labels)), 4),
+        'accuracy_cascade': round(float(np.mean(cascade_pred == labels)), 4)
+    }
+
+
+def calibrate_threshold(fast_probs, full_probs, labels, max_accuracy_drop=MAX_ACCURACY_DROP):
+    """
+    Lowest threshold whose cascade accuracy is within max_accuracy_drop of the full model
+
+    Every distinct fast-model confidence is a candidate, so the result sends as
+    much traffic down the fast path as the accuracy budget allows.
+    """
+    fast_confidence = fast_probs.max(axis=1)
+    fast_correct = fast_probs.argmax(axis=1) == labels
+    full_correct = full_probs.argmax(axis=1) == labels
+    # Just above 1.0 means "never trust the fast model"
+    candidates = np.unique(np.append(fast_confidence, np.nextafter(1.0, 2.0)))
+
+    threshold = candidates[-1]
+    for candidate in candidates:
+        cascade_accuracy = np.mean(np.where(fast_confidence >= candidate, fast_correct, full_correct))
+        if cascade_accuracy >= full_correct.mean() - max_accuracy_drop:
+            threshold = candidate
+            break
+
+    return float(threshold), cascade_outcome(fast_probs, full_probs, labels, threshold)
+
+
+class ModelCascade:
+    """Fast engine gated on its own confidence, in front of a full-model predict function"""
+
+    def __init__(self, fast_engine, threshold):
+        """
+        Args:
+            fast_engine (InferenceEngine): The small classifier
+            threshold (float): Top-1 probability at or above which its answer is used
+        """
+        self.engine = fast_engine
+        self.threshold = float(threshold)
+        # Cascade answers are cached apart from full-model ones and from other calibrations
+        self.cache_tag = f"cascade{model_fingerprint(fast_engine.model_path)}-{self.threshold:.4f}"
+
+        self._lock = threading.Lock()
+        self.fast_served = 0
+        self.full_served = 0
+        self._fast_seconds = 0.0
+        self._full_seconds = 0.0
+
+    @classmethod
+    def load(cls, config_path, build_engine):
+        """
+        Build a cascade from the calibrate_cascade.py config
+
+        Args:
+            config_path (str): Path to cascade.json
+            build_engine (callable): Model path -> warmed-up InferenceEngine
+        """
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        if not os.path.exists(config['fast_model']):
+            raise FileNotFoundError(f"Fast model not found: {config['fast_model']}. Run train_fast_model.py")
+        cascade = cls(build_engine(config['fast_model']), config['threshold'])
+        print(f"✓ Model cascade enabled (threshold {cascade.threshold:.4f}, "
+              f"{config.get('validation', {}).get('fast_path_fraction', 0):.0%} fast path on validation)")
+        return cascade
+
+    def predict(self, batch, full_predict):
+        """
+        Class probabilities for a batch; only the rows the fast model is unsure
+        about are passed to full_predict, as one smaller batch
+
+        When full_predict returns (probabilities, embeddings) so does this; rows
+        answered by the fast model get NaN embeddings, as it has none to offer.
+        """
+        start = time.perf_counter()
+        probabilities = self.engine.predict(batch)
+        fast_seconds = time.perf_counter() - start
+
+        unsure = np.flatnonzero(probabilities.max(axis=1) < self.threshold)
+        full_seconds = 0.0
+        embeddings = None
+        if unsure.size:
+            start = time.perf_counter()
+            output = full_predict(batch[unsure])
+            full_seconds = time.perf_counter() - start
+            if isinstance(output, tuple):
+                output, full_embeddings = output
+                embeddings = np.full((len(probabilities), full_embeddings.shape[1]), np.nan, dtype=np.float32)
+                embeddings[unsure] = full_embeddings
+            probabilities[unsure] = output
+
+        with self._lock:
+            self.fast_served += len(probabilities) - unsure.size
+            self.full_served += unsure.size
+            self._fast_seconds += fast_seconds
+            self._full_seconds += full_seconds
+        if embeddings is not None:
+            return probabilities, embeddings
+        return probabilities
+
+    def get_stats(self):
+        """Fast-path share and per-image latency split for the health endpoint"""
+        with self._lock:
+            images = self.fast_served + self.full_served
+            fast_ms = self._fast_seconds * 1000 / images if images else 0.0
+            full_ms = self._full_seconds * 1000 / self.full_served if self.full_served else None
+            fraction = self.fast_served / images if images else 0.0
+            return {
+                'threshold': self.threshold,
+                'fast_served': self.fast_served,
+                'full_served': self.full_served,
+                'fast_path_fraction': round(fraction, 4),
+                'avg_fast_ms': round(fast_ms, 2),
+                'avg_full_ms': round(full_ms, 2) if full_ms is not None else None,
+                # Versus sending every image to the full model
+                'avg_saved_ms': round(fraction * full_ms - fast_ms, 2) if full_ms is not None else None
+            }
@@ -0,0 +1,364 @@
+"""
+Rice Disease Detection - Model Registry
+Versioned model artifacts with metadata, a live-version pointer that servers
+hot-swap to, and shadow scoring of a candidate model on sampled traffic
+
+Usage:
+    python model_registry.py register [--accuracy 0.95] [--notes "..."]
+    python model_registry.py list
+    python model_registry.py promote <version>
+    python model_registry.py shadow <version> [sample_rate]
+    python model_registry.py shadow off
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import shutil
+import threading
+from collections import deque
+from datetime import datetime
+import numpy as np
+from inference_engine import BACKEND_EXTENSIONS, backend_model_path
+
+# Configuration
+REGISTRY_DIR = 'models/registry'
+MODEL_PATH = 'models/rice_disease_model.h5'
+CLASS_INDICES_PATH = 'models/class_indices.json'
+METRICS_PATH = 'results/final_metrics.json'
+IMG_SIZE = 224
+
+
+def _write_json_atomic(path, data):
+    """Write JSON through a temp file so readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """Directory of versioned models: <root>/<version>/{model, class_indices.json, metadata.json}"""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def register(self, model_path, class_indices_path, img_size=IMG_SIZE, accuracy=None, notes=None, version=None):
+        """
+        Copy a trained model (and any exported backend artifacts next to it) into a new version
+
+        Returns:
+            str: The new version name
+        """
+        version = version or datetime.now().strftime('v%Y%m%d-%H%M%S')
+        final_dir = os.path.join(self.root, version)
+        if os.path.exists(final_dir):
+            raise ValueError(f"Model version '{version}' already exists")
+
+        with open(class_indices_path, 'r') as f:
+            class_indices = json.load(f)
+
+        # Build the version in a temp dir and rename it, so it appears complete or not at all
+        tmp_dir = os.path.join(self.root, f".{version}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        artifacts = []
+        model_name = os.path.basename(model_path)
+        for backend in BACKEND_EXTENSIONS:
+            source = backend_model_path(model_path, backend)
+            target = backend_model_path(os.path.join(tmp_dir, model_name), backend)
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+            elif os.path.isfile(source):
+                shutil.copy2(source, target)
+            else:
+                continue
+            artifacts.append(backend)
+
+        shutil.copy2(class_indices_path, os.path.join(tmp_dir, 'class_indices.json'))
+        _write_json_atomic(os.path.join(tmp_dir, 'metadata.json'), {
+            'version': version,
+            'model_file': model_name,
+            'backends': artifacts,
+            'img_size': img_size,
+            'class_indices': class_indices,
+            'accuracy': accuracy,
+            'notes': notes,
+            'created_at': datetime.now().isoformat()
+        })
+
+        os.replace(tmp_dir, final_dir)
+        return version
+
+    def versions(self):
+        """Metadata of every registered version, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        found = [self.metadata(name) for name in os.listdir(self.root) if not name.startswith('.')]
+        return sorted((m for m in found if m), key=lambda m: m['created_at'])
+
+    def metadata(self, version):
+        """Metadata of one version, or None if it is not registered"""
+        try:
+            with open(os.path.join(self.root, version, 'metadata.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def model_path(self, version):
+        """Path of a version's Keras model; other backends resolve via backend_model_path()"""
+        return os.path.join(self.root, version, self._require(version)['model_file'])
+
+    def class_indices_path(self, version):
+        return os.path.join(self.root, version, 'class_indices.json')
+
+    def live_version(self):
+        """Version servers should be running, or None to serve models/ as trained"""
+        try:
+            with open(os.path.join(self.root, 'LIVE'), 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def pointer_mtime(self, name):
+        """Modification time (ns) of the LIVE or SHADOW pointer, None when it doesn't exist"""
+        try:
+            return os.stat(os.path.join(self.root, name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def promote(self, version):
+        """Make a version live; running servers swap to it on their next registry check"""
+        self._require(version)
+        self._write_pointer('LIVE', version)
+
+    def shadow_config(self):
+        """{'version', 'sample_rate'} of the shadow candidate, or None"""
+        try:
+            with open(os.path.join(self.root, 'SHADOW'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set_shadow(self, version, sample_rate=0.1):
+        """Score a sampled fraction of live traffic with a candidate version"""
+        self._require(version)
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be in (0, 1]')
+        os.makedirs(self.root, exist_ok=True)
+        _write_json_atomic(os.path.join(self.root, 'SHADOW'), {'version': version, 'sample_rate': sample_rate})
+
+    def clear_shadow(self):
+        try:
+            os.remove(os.path.join(self.root, 'SHADOW'))
+        except FileNotFoundError:
+            pass
+
+    def _require(self, version):
+        metadata = self.metadata(version)
+        if metadata is None:
+            raise ValueError(f"Unknown model version '{version}'")
+        return metadata
+
+    def _write_pointer(self, name, value):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".{name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(value)
+        os.replace(tmp_path, os.path.join(self.root, name))
+
+
+class BuildBackoff:
+    """
+    Remembers the registry versions whose engine failed to build, so a watcher
+    polling the registry retries them after a growing delay instead of on
+    every poll; rewriting the pointer (e.g. promoting again) retries at once
+    """
+
+    def __init__(self, initial_seconds=60, max_seconds=3600):
+        self.initial_seconds = initial_seconds
+        self.max_seconds = max_seconds
+        self._failures = {}  # 'live' / 'shadow' -> failure record
+        self._lock = threading.Lock()
+
+    def should_build(self, key, version, pointer_mtime):
+        """False while a failed build of this version, from this pointer write, waits for its retry"""
+        with self._lock:
+            failure = self._failures.get(key)
+            if failure is None or (failure['version'], failure['pointer_mtime']) != (version, pointer_mtime):
+                return True
+            return time.monotonic() >= failure['retry_at']
+
+    def failed(self, key, version, pointer_mtime, error):
+        """Record a failed build; returns the seconds until it is retried"""
+        with self._lock:
+            failure = self._failures.get(key)
+            same = failure is not None and (failure['version'], failure['pointer_mtime']) == (version, pointer_mtime)
+            attempts = failure['attempts'] + 1 if same else 1
+            delay = min(self.initial_seconds * 2 ** (attempts - 1), self.max_seconds)
+            self._failures[key] = {'version': version, 'pointer_mtime': pointer_mtime, 'attempts': attempts,
+                                   'error': str(error), 'retry_at': time.monotonic() + delay}
+            return delay
+
+    def succeeded(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {key: {'version': failure['version'], 'attempts': failure['attempts'], 'error': failure['error'],
+                          'retry_in': round(max(failure['retry_at'] - now, 0), 1)}
+                    for key, failure in self._failures.items()}
+
+
+class ShadowEvaluator:
+    """Scores sampled production inputs with a candidate engine off the response path"""
+
+    def __init__(self, engine, sample_rate=0.1, max_pending=64, latency_window=1000):
+        """
+        Start the shadow worker thread
+
+        Args:
+            engine (InferenceEngine): Candidate model; its version is engine.version
+            sample_rate (float): Fraction of predictions that are shadowed
+            max_pending (int): Queued samples before new ones are dropped
+            latency_window (int): Recent latencies kept for percentiles
+        """
+        self.engine = engine
+        self.version = engine.version
+        self.sample_rate = sample_rate
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._candidate_ms = deque(maxlen=latency_window)
+        self._production_ms = deque(maxlen=latency_window)
+        self.sampled = 0
+        self.dropped = 0
+        self.compared = 0
+        self.agreements = 0
+        self.errors = 0
+        self._abs_diff_total = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='shadow-evaluator', daemon=True)
+        self._thread.start()
+
+    def submit(self, inputs, production_probabilities, production_ms):
+        """Maybe queue one production prediction for comparison; never blocks"""
+        if random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((inputs, np.atleast_2d(production_probabilities), production_ms))
+            with self._lock:
+                self.sampled += 1
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stop(self):
+        """Stop the worker once the queued samples are scored"""
+        self._queue.put(None)
+
+    def get_stats(self):
+        """Agreement and latency of the candidate against production"""
+        with self._lock:
+            return {
+                'version': self.version,
+                'sample_rate': self.sample_rate,
+                'sampled': self.sampled,
+                'dropped': self.dropped,
+                'compared': self.compared,
+                'errors': self.errors,
+                'top1_agreement': round(self.agreements / self.compared, 4) if self.compared else None,
+                'mean_abs_diff': round(self._abs_diff_total / self.compared, 6) if self.compared else None,
+                'candidate_latency_ms': _percentiles(self._candidate_ms),
+                'production_latency_ms': _percentiles(self._production_ms)
+            }
+
+    def _run(self):
+        """Worker loop: run the candidate on each sample and compare with production"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            inputs, production, production_ms = item
+            try:
+                start = time.perf_counter()
+                candidate = self.engine.predict(inputs)
+                candidate_ms = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                print(f"✗ Shadow model {self.version} failed: {e}")
+                with self._lock:
+                    self.errors += 1
+                continue
+
+            with self._lock:
+                self.compared += len(production)
+                self.agreements += int(np.sum(np.argmax(candidate, axis=1) == np.argmax(production, axis=1)))
+                self._abs_diff_total += float(np.sum(np.mean(np.abs(candidate - production), axis=1)))
+                self._candidate_ms.append(candidate_ms)
+                self._production_ms.append(production_ms)
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    values = np.array(samples)
+    return {'p50': round(float(np.percentile(values, 50)), 2), 'p95': round(float(np.percentile(values, 95)), 2)}
+
+
+def _option(args, name, default=None):
+    """Value following --name in args, or default"""
+    if name in args and args.index(name) + 1 < len(args):
+        return args[args.index(name) + 1]
+    return default
+
+
+if __name__ == '__main__':
+    registry = ModelRegistry()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    args = sys.argv[2:]
+
+    if command == 'register':
+        accuracy = _option(args, '--accuracy')
+        if accuracy is None and os.path.exists(METRICS_PATH):
+            # Default to the validation accuracy train_model.py recorded
+            with open(METRICS_PATH, 'r') as f:
+                accuracy = json.load(f).get('val_accuracy')
+        version = registry.register(MODEL_PATH, CLASS_INDICES_PATH,
+                                    accuracy=float(accuracy) if accuracy is not None else None,
+                                    notes=_option(args, '--notes'))
+        print(f"✓ Registered {MODEL_PATH} as {version}")
+        print(f"  Promote it with: python model_registry.py promote {version}")
+
+    elif command == 'list':
+        live = registry.live_version()
+        shadow = registry.shadow_config() or {}
+        for metadata in registry.versions():
+            marks = ['live'] if metadata['version'] == live else []
+            if metadata['version'] == shadow.get('version'):
+                marks.append(f"shadow {shadow['sample_rate']:.0%}")
+            accuracy = f"{metadata['accuracy'] * 100:.2f}%" if metadata.get('accuracy') is not None else '-'
+            print(f"{metadata['version']:<20} {accuracy:>8}  {', '.join(metadata['backends']):<24} {' '.join(marks)}")
+
+    elif command == 'promote' and args:
+        registry.promote(args[0])
+        print(f"✓ {args[0]} is now live")
+
+    elif command == 'shadow' and args:
+        if args[0] == 'off':
+            registry.clear_shadow()
+            print("✓ Shadow scoring stopped")
+        else:
+            sample_rate = float(args[1]) if len(args) > 1 else 0.1
+            registry.set_shadow(args[0], sample_rate)
+            print(f"✓ Shadowing {sample_rate:.0%} of traffic with {args[0]}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
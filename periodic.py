@@ -0,0 +1,40 @@
+"""
+Rice Disease Detection - Periodic Tasks
+Runs a function every few seconds on a background thread
+"""
+
+import threading
+
+
+class PeriodicTask:
+    """Background thread that calls fn() every interval seconds"""
+
+    def __init__(self, fn, interval, name='periodic-task'):
+        """
+        Args:
+            fn (callable): Called with no arguments; exceptions are logged, not raised
+            interval (float): Seconds between calls
+            name (str): Thread name
+        """
+        self.fn = fn
+        self.interval = interval
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the thread (in each pre-forked worker, not the parent)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.fn()
+            except Exception as e:
+                print(f"✗ {self.name} failed: {e}")
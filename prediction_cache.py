@@ -0,0 +1,279 @@
+"""
+Rice Disease Detection - Prediction Cache
+Content-addressed cache of model outputs keyed by image hash and model version
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Disk writes between checks of the on-disk tier's size; the first write after start-up checks too
+PRUNE_EVERY = 500
+
+
+def model_file(model_path):
+    """File whose changes mark a new model; SavedModel directories use their graph file"""
+    if os.path.isdir(model_path):
+        return os.path.join(model_path, 'saved_model.pb')
+    return model_path
+
+
+def model_fingerprint(model_path):
+    """Short version string that changes whenever the model file changes"""
+    stat = os.stat(model_file(model_path))
+    raw = f"{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class PredictionCache:
+    """In-memory LRU backed by an on-disk tier that survives restarts"""
+
+    def __init__(self, model_path, cache_dir='cache/predictions', max_entries=10000, max_disk_entries=100000):
+        """
+        Initialize the cache for the current model file
+
+        Args:
+            model_path (str): Model file whose changes invalidate the cache
+            cache_dir (str): Root directory of the on-disk tier
+            max_entries (int): Entries kept in memory before LRU eviction
+            max_disk_entries (int): Entries kept on disk; the oldest are deleted beyond it
+        """
+        self.model_path = model_path
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._model_stat = None
+        self.model_version = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.invalidations = 0
+        self._disk_writes = 0
+        self._pruning = False
+
+        self._check_model_version()
+
+    @staticmethod
+    def key_for(image_bytes):
+        """Hash the uploaded bytes"""
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def get(self, key, version=None):
+        """
+        Return cached probabilities for an image hash, or None on a miss
+
+        A request passes the fingerprint of the engine it runs on as version;
+        while the cache follows a different model file, that is a miss.
+        """
+        entry = self.get_entry(key, version)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key, version=None):
+        """(probabilities, embedding) for an image hash, or None on a miss; embedding is None when it wasn't stored"""
+        self._check_model_version()
+        if self.model_version is None:
+            return None
+        if version is not None and version != self.model_version:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                return self._entries[key]
+
+        entry = self._read_disk(key)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._store_memory(key, entry)
+            return entry
+
+    def put(self, key, probabilities, version=None, embedding=None):
+        """
+        Store the model output for an image hash in both tiers, unless it came
+        from another model's engine
+
+        The leaf embedding is kept alongside, so a cache hit can still log it;
+        empty or NaN embeddings (backends without one, cascade answers) are not.
+        """
+        if self.model_version is None or (version is not None and version != self.model_version):
+            return
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            if not embedding.size or not np.isfinite(embedding).all():
+                embedding = None
+
+        entry = (probabilities, embedding)
+        with self._lock:
+            self._store_memory(key, entry)
+        self._write_disk(key, entry)
+        self._maybe_prune()
+
+    def clear(self):
+        """Drop every cached prediction for the current model"""
+        with self._lock:
+            self._entries.clear()
+            if self.model_version is not None:
+                shutil.rmtree(self._version_dir(), ignore_errors=True)
+
+    def prune_disk(self):
+        """Delete the oldest on-disk entries beyond max_disk_entries; returns how many were deleted"""
+        version = self.model_version
+        if version is None:
+            return 0
+
+        # Every worker writes to the same directory, so count what is there rather than what this one wrote
+        entries = []
+        try:
+            shards = [shard.path for shard in os.scandir(os.path.join(self.cache_dir, version)) if shard.is_dir()]
+        except OSError:
+            return 0
+        for shard in shards:
+            try:
+                for entry in os.scandir(shard):
+                    if entry.name.endswith('.json'):
+                        entries.append((entry.stat().st_mtime_ns, entry.path))
+            except OSError:
+                continue  # deleted by another worker meanwhile
+
+        excess = len(entries) - self.max_disk_entries
+        if excess <= 0:
+            return 0
+        entries.sort()
+        deleted = 0
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+                deleted += 1
+            except OSError:
+                pass
+        with self._lock:
+            self.disk_evictions += deleted
+        return deleted
+
+    def set_model_path(self, model_path):
+        """Follow a hot-swapped model; entries of the previous model are invalidated"""
+        self.model_path = model_path
+        self._check_model_version()
+
+    def get_stats(self):
+        """Hit/miss counters for the health endpoint"""
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            hits = self.hits_memory + self.hits_disk
+            return {
+                'model_version': self.model_version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits_memory': self.hits_memory,
+                'hits_disk': self.hits_disk,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'max_disk_entries': self.max_disk_entries,
+                'disk_evictions': self.disk_evictions,
+                'invalidations': self.invalidations
+            }
+
+    def _check_model_version(self):
+        """Invalidate everything when the model file has been replaced"""
+        try:
+            stat = os.stat(model_file(self.model_path))
+        except OSError:
+            return
+
+        model_stat = (stat.st_size, stat.st_mtime_ns)
+        if model_stat == self._model_stat:
+            return
+
+        with self._lock:
+            if model_stat == self._model_stat:
+                return
+
+            previous_version = self.model_version
+            self._model_stat = model_stat
+            self.model_version = model_fingerprint(self.model_path)
+            self._entries.clear()
+
+            if previous_version is not None:
+                self.invalidations += 1
+                shutil.rmtree(os.path.join(self.cache_dir, previous_version), ignore_errors=True)
+                print(f"✓ Prediction cache invalidated (model {previous_version} -> {self.model_version})")
+
+    def _store_memory(self, key, entry):
+        """Insert into the LRU, evicting the least recently used entries (lock held)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _maybe_prune(self):
+        """Start a background prune of the disk tier every PRUNE_EVERY writes, unless one is running"""
+        with self._lock:
+            self._disk_writes += 1
+            if self._pruning or (self._disk_writes - 1) % PRUNE_EVERY:
+                return
+            self._pruning = True
+        threading.Thread(target=self._prune_in_background, name='prediction-cache-prune', daemon=True).start()
+
+    def _prune_in_background(self):
+        try:
+            deleted = self.prune_disk()
+            if deleted:
+                print(f"✓ Prediction cache pruned {deleted} disk entries (max {self.max_disk_entries})")
+        except Exception as e:
+            print(f"✗ Error pruning prediction cache: {e}")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def _version_dir(self):
+        return os.path.join(self.cache_dir, self.model_version)
+
+    def _disk_path(self, key):
+        return os.path.join(self._version_dir(), key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Entries without an embedding are a bare list of probabilities
+        if isinstance(data, list):
+            return np.asarray(data, dtype=np.float32), None
+        embedding = data.get('embedding')
+        return (np.asarray(data['probabilities'], dtype=np.float32),
+                np.asarray(embedding, dtype=np.float32) if embedding is not None else None)
+
+    def _write_disk(self, key, entry):
+        probabilities, embedding = entry
+        data = [float(p) for p in probabilities]
+        if embedding is not None:
+            data = {'probabilities': data, 'embedding': [float(e) for e in embedding]}
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"✗ Error writing prediction cache entry: {e}")
@@ -0,0 +1,174 @@
+"""
+Rice Disease Detection - Prediction Service
+Upload checks, decoding, caching, test-time augmentation, tiling and the
+model cascade around one InferenceEngine, shared by app.py, app_simple.py
+and app_auth.py
+"""
+
+import time
+import numpy as np
+from flask import jsonify
+from image_preprocessing import (decode_image, decode_tta_views, decode_tiles, aggregate_tiles, encoded_batch,
+                                 inspect_image)
+from metrics import stage_timer, STAGE_SECONDS
+
+
+def server_busy(error):
+    """429 response when inference is saturated, so clients back off instead of piling up"""
+    return jsonify({'error': 'Server is busy, please retry shortly', 'retry_after': error.retry_after}), 429, \
+        {'Retry-After': str(error.retry_after)}
+
+
+class PredictionService:
+    """Serving helpers bound to one app's model loader, prediction cache and inference executor"""
+
+    def __init__(self, model_loader, prediction_cache, inference_executor, predict_batch, backend='keras',
+                 img_size=224, get_cascade=None, on_inference=None, max_upload_bytes=None, max_image_side=None,
+                 max_image_pixels=None, tta_views=8, tta_auto_threshold=0, tile_max=12, retry_after_seconds=5):
+        """
+        Args:
+            model_loader (BackgroundModelLoader): Holds the serving engine
+            prediction_cache (PredictionCache): Probabilities by upload hash
+            inference_executor (BoundedExecutor): Runs decoding and inference
+            predict_batch (callable): (batch, engine) -> probabilities or (probabilities, embeddings)
+                from that engine, usually through a MicroBatcher
+            backend (str): INFERENCE_BACKEND; 'graph' takes encoded bytes instead of arrays
+            img_size (int): Model input size
+            get_cascade (callable): Returns the app's ModelCascade, or None when it is off
+            on_inference (callable): on_inference(img_array, probabilities, inference_ms) after
+                each plain prediction, e.g. to feed a shadow model
+            max_upload_bytes, max_image_side, max_image_pixels: Upload limits for check_image()
+            tta_views (int): Augmented views averaged by test-time augmentation
+            tta_auto_threshold (float): Top-1 confidence % below which TTA runs automatically
+            tile_max (int): Tiles scored per image in tiled mode
+            retry_after_seconds (int): Retry-After sent while the model is loading
+        """
+        self.model_loader = model_loader
+        self.prediction_cache = prediction_cache
+        self.inference_executor = inference_executor
+        self.predict_batch = predict_batch
+        self.backend = backend
+        self.img_size = img_size
+        self.get_cascade = get_cascade or (lambda: None)
+        self.on_inference = on_inference
+        self.max_upload_bytes = max_upload_bytes
+        self.max_image_side = max_image_side
+        self.max_image_pixels = max_image_pixels
+        self.tta_views = tta_views
+        self.tta_auto_threshold = tta_auto_threshold
+        self.tile_max = tile_max
+        self.retry_after_seconds = retry_after_seconds
+
+    def model_unavailable(self):
+        """503 response while the model is still loading (or failed to load)"""
+        status = self.model_loader.get_status()
+        if status['state'] == 'failed':
+            return jsonify({'error': 'Model failed to load', 'model': status}), 503
+        return jsonify({'error': 'Model is still loading, please retry shortly', 'model': status}), 503, \
+            {'Retry-After': str(self.retry_after_seconds)}
+
+    def check_image(self, image_bytes):
+        """Reject unreadable or oversized uploads from the image header, before any decoding"""
+        # The 'graph' backend decodes the full frame, so no draft-mode discount applies
+        inspect_image(image_bytes, None if self.backend == 'graph' else self.img_size,
+                      max_bytes=self.max_upload_bytes, max_side=self.max_image_side,
+                      max_pixels=self.max_image_pixels)
+
+    def preprocess_image(self, image_bytes):
+        """Preprocess uploaded image bytes for model prediction"""
+        if self.backend == 'graph':
+            # The exported graph decodes, resizes and rescales the raw bytes itself
+            return encoded_batch(image_bytes)
+        return decode_image(image_bytes, self.img_size, self.max_image_pixels)
+
+    def predict_arrays(self, batch, engine):
+        """
+        (probabilities, embeddings) for a decoded batch from engine, through the
+        model cascade when it is enabled
+
+        Embeddings are (N, 0) when the backend has none and NaN for rows the
+        cascade's fast model answered.
+        """
+        cascade = self.get_cascade()
+        if cascade is None:
+            output = self.predict_batch(batch, engine)
+        else:
+            output = cascade.predict(batch, lambda rows: self.predict_batch(rows, engine))
+        if isinstance(output, tuple):
+            return output
+        return output, np.zeros((len(output), 0), dtype=np.float32)
+
+    def plain_cache_key(self, cache_key):
+        """Cache key of a plain prediction; cascade answers are kept apart from full-model ones"""
+        cascade = self.get_cascade()
+        return cache_key if cascade is None else f"{cache_key}-{cascade.cache_tag}"
+
+    def infer(self, image_bytes, engine):
+        """Decode and classify one upload (runs on an inference executor thread); returns (probabilities, embedding)"""
+        with stage_timer('decode'):
+            img_array = self.preprocess_image(image_bytes)
+        start = time.perf_counter()
+        probabilities, embeddings = self.predict_arrays(img_array, engine)
+        inference_seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(inference_seconds, 'inference')
+
+        if self.on_inference is not None:
+            self.on_inference(img_array, probabilities[0], inference_seconds * 1000)
+        return probabilities[0], embeddings[0]
+
+    def infer_tta(self, image_bytes, engine):
+        """Average the model output over tta_views augmented views of an upload"""
+        # Every view goes through the model in a single batch; it is a full
+        # batch already, so it skips the micro-batcher
+        with stage_timer('tta'):
+            views = decode_tta_views(image_bytes, self.img_size, self.tta_views, self.max_image_pixels)
+            return engine.predict(views).mean(axis=0)
+
+    def infer_tiles(self, image_bytes, engine):
+        """Image-level probabilities and heat grid from the plant-covered tiles of an upload"""
+        # All tiles go through the model as one batch; it is a full batch
+        # already, so it skips the micro-batcher
+        with stage_timer('tiles'):
+            tiles, layout = decode_tiles(image_bytes, self.img_size, max_tiles=self.tile_max,
+                                         max_pixels=self.max_image_pixels)
+            return aggregate_tiles(engine.predict(tiles), layout)
+
+    def predict_probabilities(self, image_bytes, engine, tta=False, shed=True):
+        """
+        Model output of engine for an upload, the number of views it averages
+        and its leaf embedding (None when the backend or the cascade had none)
+
+        Callers read model_loader.engine once per request and pass it here, so
+        a hot swap mid-request can't mix the old model's output with the new
+        one's cache entries or version.
+
+        Test-time augmentation runs when requested, or automatically when the
+        plain prediction's top-1 confidence is below tta_auto_threshold. With
+        shed=True, raises Overloaded when the inference executor is saturated;
+        queued jobs pass shed=False and wait for a worker instead.
+        """
+        # Repeated uploads of the same photo skip preprocessing and inference
+        cache_key = self.prediction_cache.key_for(image_bytes)
+        embedding = None
+
+        if not tta:
+            plain_key = self.plain_cache_key(cache_key)
+            with stage_timer('cache_lookup'):
+                entry = self.prediction_cache.get_entry(plain_key, engine.fingerprint)
+            if entry is None:
+                probabilities, embedding = self.inference_executor.run(self.infer, image_bytes, engine, shed=shed)
+                self.prediction_cache.put(plain_key, probabilities, engine.fingerprint, embedding)
+            else:
+                probabilities, embedding = entry
+
+            if float(np.max(probabilities)) * 100 >= self.tta_auto_threshold:
+                return probabilities, 1, embedding
+
+        tta_cache_key = f"{cache_key}-tta{self.tta_views}"
+        with stage_timer('cache_lookup'):
+            probabilities = self.prediction_cache.get(tta_cache_key, engine.fingerprint)
+        if probabilities is None:
+            probabilities = self.inference_executor.run(self.infer_tta, image_bytes, engine, shed=shed)
+            self.prediction_cache.put(tta_cache_key, probabilities, engine.fingerprint)
+
+        return probabilities, self.tta_views, embedding
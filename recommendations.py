@@ -0,0 +1,197 @@
+"""
+Rice Disease Detection - Treatment Recommendation Index
+Disease -> treatment and pesticide recommendations, built in memory from
+the diseases, pesticides and disease_pesticide_mapping tables so the
+prediction path makes no read queries for them
+"""
+
+import os
+import json
+import time
+import threading
+
+# Pesticides recommended per disease, most effective first
+MAX_PESTICIDES = 5
+# A build that could not read the database is retried this soon
+RETRY_SECONDS = 30
+
+DISEASES_QUERY = "SELECT id, name, treatment FROM diseases"
+
+PESTICIDES_QUERY = """
+    SELECT m.disease_id, p.id, p.name, p.description, p.price_per_unit, p.unit_type,
+           p.effectiveness_rating, p.application_method, p.dosage_per_acre
+    FROM disease_pesticide_mapping m
+    JOIN pesticides p ON p.id = m.pesticide_id
+    ORDER BY m.disease_id, p.effectiveness_rating DESC
+"""
+
+
+class Recommendation:
+    """Treatment for one disease, with its response fields serialized once"""
+
+    __slots__ = ('disease_id', 'fields', 'fragment')
+
+    def __init__(self, disease_id, treatment='', application_method='', frequency='', pesticides=()):
+        self.disease_id = disease_id
+        # Shared by every response for this disease; treat as read-only
+        self.fields = {
+            'treatment': treatment,
+            'application_method': application_method,
+            'frequency': frequency,
+            'recommended_pesticides': list(pesticides)
+        }
+        # The same fields as JSON object members, for splicing into a serialized response
+        self.fragment = json.dumps(self.fields)[1:-1]
+
+    def render(self, response):
+        """JSON text of a response dict with these fields appended"""
+        body = json.dumps(response)
+        return f"{body[:-1]}, {self.fragment}}}" if len(body) > 2 else f"{{{self.fragment}}}"
+
+
+EMPTY_RECOMMENDATION = Recommendation(None)
+
+
+def fallback_recommendation(disease_id, fallback):
+    """Recommendation from a treatment_database entry, for diseases with no pesticides in MySQL"""
+    application_method = fallback.get('application_method', '')
+    pesticides = [{
+        'id': index,
+        'name': pest['name'],
+        'description': pest['details'],
+        'price': 0,  # Price not available in fallback
+        'unit': 'liter/kg',
+        'effectiveness': 85,  # Default effectiveness
+        'application_method': application_method,
+        'dosage_per_acre': pest['dosage']
+    } for index, pest in enumerate(fallback.get('pesticides', []), 1)]
+    return Recommendation(disease_id, fallback.get('description', ''), application_method,
+                          fallback.get('frequency', ''), pesticides)
+
+
+class RecommendationIndex:
+    """Per-process recommendation lookup, rebuilt on a timer or when an admin asks for it"""
+
+    def __init__(self, get_db, disease_names, fallbacks, refresh_seconds=300, trigger_path=None):
+        """
+        Args:
+            get_db (callable): Returns a DatabaseConnection-like handle; it is disconnected after use
+            disease_names (iterable): Class names from class_indices.json, the index keys
+            fallbacks (dict): Disease name -> hardcoded treatment data (treatment_database)
+            refresh_seconds (float): Age after which check() rebuilds the index
+            trigger_path (str): File whose mtime change makes check() rebuild at once,
+                so a refresh requested in one worker reaches all of them
+        """
+        self.get_db = get_db
+        self.disease_names = tuple(disease_names)
+        self.fallbacks = fallbacks
+        self.refresh_seconds = refresh_seconds
+        self.trigger_path = trigger_path
+
+        self._lock = threading.Lock()
+        self._entries = None
+        self._trigger_mtime = self._read_trigger()
+        self.loaded_at = None
+        self.refreshes = 0
+        self.from_database = 0
+        self.last_error = None
+
+    def get(self, disease_name):
+        """Recommendation for a class name; the index is built on first use"""
+        entries = self._entries
+        if entries is None:
+            entries = self.refresh(only_if_empty=True)
+        return entries.get(disease_name, EMPTY_RECOMMENDATION)
+
+    def refresh(self, only_if_empty=False):
+        """Rebuild from MySQL, falling back to the hardcoded data for diseases it lacks"""
+        with self._lock:
+            if only_if_empty and self._entries is not None:
+                return self._entries
+            entries = self._build()
+            if self.last_error is None or self._entries is None:
+                self._entries = entries
+                self.refreshes += 1
+            # A failed rebuild keeps the previous index; check() retries it after RETRY_SECONDS
+            self.loaded_at = time.time()
+            return self._entries
+
+    def check(self):
+        """Rebuild when the index is stale or a refresh was triggered (called by a PeriodicTask)"""
+        trigger_mtime = self._read_trigger()
+        triggered = trigger_mtime != self._trigger_mtime
+        max_age = RETRY_SECONDS if self.last_error else self.refresh_seconds
+        stale = self.loaded_at is None or time.time() - self.loaded_at >= max_age
+        if triggered or stale:
+            self._trigger_mtime = trigger_mtime
+            self.refresh()
+
+    def trigger(self):
+        """Rebuild now, and have every other worker rebuild on its next check()"""
+        if self.trigger_path:
+            os.makedirs(os.path.dirname(self.trigger_path) or '.', exist_ok=True)
+            with open(self.trigger_path, 'w') as f:
+                f.write(str(time.time()))
+            self._trigger_mtime = self._read_trigger()
+        return self.refresh()
+
+    def get_stats(self):
+        """Index age and source for the health endpoint"""
+        entries = self._entries or {}
+        return {
+            'diseases': len(entries),
+            'from_database': self.from_database,
+            'loaded_at': self.loaded_at,
+            'age_seconds': round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            'refreshes': self.refreshes,
+            'last_error': self.last_error
+        }
+
+    def _build(self):
+        diseases, pesticide_rows = {}, []
+        db = self.get_db()
+        try:
+            diseases = {row[1]: (row[0], row[2]) for row in db.fetch_query(DISEASES_QUERY) or []}
+            pesticide_rows = db.fetch_query(PESTICIDES_QUERY) or []
+            self.last_error = None if diseases else 'No diseases in the database'
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"✗ Error loading treatment recommendations: {e}")
+        finally:
+            db.disconnect()
+
+        pesticides = {}
+        for row in pesticide_rows:
+            listed = pesticides.setdefault(row[0], [])
+            if len(listed) < MAX_PESTICIDES and all(pest['id'] != row[1] for pest in listed):
+                listed.append({
+                    'id': row[1],
+                    'name': row[2],
+                    'description': row[3],
+                    'price': float(row[4]),
+                    'unit': row[5],
+                    'effectiveness': float(row[6]) if row[6] else 0,
+                    'application_method': row[7],
+                    'dosage_per_acre': row[8]
+                })
+
+        entries = {}
+        from_database = 0
+        for name in self.disease_names:
+            disease_id, treatment = diseases.get(name, (None, None))
+            if pesticides.get(disease_id):
+                entries[name] = Recommendation(disease_id, treatment or '', pesticides=pesticides[disease_id])
+                from_database += 1
+            elif name in self.fallbacks:
+                entries[name] = fallback_recommendation(disease_id, self.fallbacks[name])
+            else:
+                entries[name] = Recommendation(disease_id, treatment or '')
+        self.from_database = from_database
+        print(f"✓ Treatment recommendations loaded ({from_database}/{len(entries)} diseases from the database)")
+        return entries
+
+    def _read_trigger(self):
+        try:
+            return os.stat(self.trigger_path).st_mtime_ns if self.trigger_path else None
+        except OSError:
+            return None
@@ -0,0 +1,177 @@
+"""
+Rice Stress Detector - Production Server
+Pre-forking gunicorn server: the parent imports the app and reads the model
+artifact once, then forks workers that share those pages copy-on-write
+
+TensorFlow and ONNX Runtime thread pools do not survive fork(), so each
+worker builds its runtime session after forking, from the preloaded bytes.
+The tflite interpreter (the default here) uses that buffer in place, so the
+weights themselves stay shared between workers. ONNX Runtime copies them
+into each worker; keras and graph load TensorFlow and the whole model in
+each worker, so they are refused with more than one worker.
+
+Usage (Linux/macOS):
+    python serve.py
+    SERVE_WORKERS=4 INFERENCE_BACKEND=onnx python serve.py
+    SERVE_WORKERS=1 INFERENCE_BACKEND=keras python serve.py
+"""
+
+import os
+import sys
+import time
+import importlib
+
+START_TIME = time.perf_counter()
+
+# Configuration
+APP_MODULE = os.getenv('SERVE_APP', 'app_auth')
+BIND = os.getenv('SERVE_BIND', '0.0.0.0:5000')
+CPU_COUNT = os.cpu_count() or 1
+WORKERS = int(os.getenv('SERVE_WORKERS', max(1, CPU_COUNT // 2)))
+THREADS_PER_WORKER = int(os.getenv('SERVE_THREADS', 4))
+MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', 5000))
+MAX_REQUESTS_JITTER = int(os.getenv('SERVE_MAX_REQUESTS_JITTER', 500))
+GRACEFUL_TIMEOUT = int(os.getenv('SERVE_GRACEFUL_TIMEOUT', 30))
+TIMEOUT = int(os.getenv('SERVE_TIMEOUT', 120))
+# Workers publish their metrics here so /metrics on any of them covers all of them
+METRICS_DIR = os.getenv('SERVE_METRICS_DIR', 'cache/metrics')
+METRICS_SYNC_SECONDS = float(os.getenv('SERVE_METRICS_SYNC_SECONDS', 5))
+
+# Split the cores between workers so their inference thread pools don't
+# oversubscribe the machine; must be set before TensorFlow/BLAS initialize
+INFERENCE_THREADS = max(1, CPU_COUNT // WORKERS)
+os.environ.setdefault('INFERENCE_THREADS', str(INFERENCE_THREADS))
+os.environ.setdefault('OMP_NUM_THREADS', os.environ['INFERENCE_THREADS'])
+os.environ.setdefault('TF_NUM_INTRAOP_THREADS', os.environ['INFERENCE_THREADS'])
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
+# Workers load the model themselves after the fork, before accepting requests
+os.environ['MODEL_BACKGROUND_LOAD'] = '0'
+# The only backend whose weights the workers share; must be set before the app is imported
+os.environ.setdefault('INFERENCE_BACKEND', 'tflite')
+# Backends that load TensorFlow and a full copy of the model in every worker
+PER_WORKER_BACKENDS = ('keras', 'graph')
+
+from gunicorn.app.base import BaseApplication
+from inference_engine import preload_model_artifact
+from metrics import REGISTRY
+from periodic import PeriodicTask
+
+
+def memory_usage_mb():
+    """RSS and PSS of this process in MB (PSS splits shared pages between workers)"""
+    usage = {}
+    for path, fields in (('/proc/self/status', ('VmRSS',)), ('/proc/self/smaps_rollup', ('Pss',))):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key = line.split(':')[0]
+                    if key in fields:
+                        usage[key] = round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+    return {'rss_mb': usage.get('VmRSS'), 'pss_mb': usage.get('Pss')}
+
+
+class RiceServer(BaseApplication):
+    """gunicorn application that preloads the Flask app in the parent process"""
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self.module = None
+        self.metrics_snapshots = PeriodicTask(REGISTRY.write_snapshot, METRICS_SYNC_SECONDS, name='metrics-snapshot')
+        super().__init__()
+
+    def load_config(self):
+        settings = {
+            'bind': BIND,
+            'workers': WORKERS,
+            'worker_class': 'gthread',
+            'threads': THREADS_PER_WORKER,
+            'preload_app': True,
+            'max_requests': MAX_REQUESTS,
+            'max_requests_jitter': MAX_REQUESTS_JITTER,
+            'graceful_timeout': GRACEFUL_TIMEOUT,
+            'timeout': TIMEOUT,
+            'when_ready': self.when_ready,
+            'post_worker_init': self.post_worker_init,
+            'worker_exit': self.worker_exit
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        """Import the app and read the model artifact once, in the parent"""
+        self.module = importlib.import_module(self.module_name)
+        self.reset_metrics_dir()
+        backend = self.module.INFERENCE_BACKEND
+
+        if backend in PER_WORKER_BACKENDS:
+            if WORKERS > 1:
+                sys.exit(f"✗ The {backend} backend loads TensorFlow and the model in every worker "
+                         f"({WORKERS} copies). Export the model and use INFERENCE_BACKEND=tflite, "
+                         f"or run with SERVE_WORKERS=1.")
+            print(f"⚠ {backend} backend: the model is not preloaded; the worker loads it after the fork")
+        else:
+            size = preload_model_artifact(self.module.SERVING_MODEL_PATH, backend)
+            print(f"✓ Preloaded {self.module.SERVING_MODEL_PATH} ({size / 1e6:.1f} MB) in parent process")
+            if backend != 'tflite' and WORKERS > 1:
+                print(f"⚠ {backend} backend copies the weights into each of the {WORKERS} workers; "
+                      f"only tflite shares them")
+
+        return self.module.app
+
+    def reset_metrics_dir(self):
+        """Aggregate metrics across workers, starting from zero like a single process would"""
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        for filename in os.listdir(METRICS_DIR):
+            os.remove(os.path.join(METRICS_DIR, filename))
+        REGISTRY.enable_multiprocess(METRICS_DIR)
+
+    def when_ready(self, server):
+        startup = time.perf_counter() - START_TIME
+        memory = memory_usage_mb()
+        print(f"✓ Parent ready in {startup:.2f}s, RSS {memory['rss_mb']} MB; "
+              f"starting {WORKERS} workers x {THREADS_PER_WORKER} threads, "
+              f"{os.environ['INFERENCE_THREADS']} inference threads each")
+
+    def post_worker_init(self, worker):
+        """Build the inference runtime (and its background workers) in the worker before it accepts requests"""
+        loader = self.module.model_loader
+        loader.start()
+        loader.wait()
+        memory = memory_usage_mb()
+        mark = '✓' if loader.is_ready() else '✗'
+        print(f"{mark} Worker {worker.pid}: model {loader.state} in {loader.load_seconds:.2f}s, "
+              f"RSS {memory['rss_mb']} MB, PSS {memory['pss_mb']} MB")
+
+        # Async prediction workers, the registry watcher, the similar-case index
+        # sync, the recommendation refresher and the prediction log flusher run
+        # in every worker
+        for name in ('prediction_jobs', 'registry_watcher', 'embedding_sync', 'recommendation_refresher',
+                     'history_writer'):
+            task = getattr(self.module, name, None)
+            if task is not None:
+                task.start()
+        self.metrics_snapshots.start()
+
+    def worker_exit(self, server, worker):
+        """Finish pending upload writes and prediction logging, and archive its metrics, before a worker exits"""
+        writer = getattr(self.module, 'upload_writer', None)
+        if writer is not None:
+            writer.flush()
+        history = getattr(self.module, 'history_writer', None)
+        if history is not None:
+            history.close()
+        REGISTRY.retire()
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("Rice Stress Detector - Production Server")
+    print("=" * 60)
+    print(f"App: {APP_MODULE}  Bind: {BIND}  Workers: {WORKERS}")
+    print(f"Worker recycling after {MAX_REQUESTS} (+{MAX_REQUESTS_JITTER}) requests")
+    print("=" * 60 + "\n")
+
+    sys.exit(RiceServer(APP_MODULE).run())
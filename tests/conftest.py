@@ -0,0 +1,11 @@
+"""
+Shared test setup: the modules under test live at the repository root
+
+These tests cover the serving helpers that need neither TensorFlow nor MySQL;
+run them with `python -m pytest`.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
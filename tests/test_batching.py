@@ -0,0 +1,133 @@
+"""Tests for the dynamic micro-batcher"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+def images(*values):
+    """(N, 2, 2, 1) batch whose rows are filled with the given values"""
+    return np.stack([np.full((2, 2, 1), value, dtype=np.float32) for value in values])
+
+
+def predict_in_threads(batcher, batches):
+    """Call batcher.predict from one thread per batch at once; returns the results in order"""
+    results = [None] * len(batches)
+    ready = threading.Barrier(len(batches))
+
+    def call(index):
+        ready.wait()
+        results[index] = batcher.predict(batches[index], timeout=5)
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_share_a_forward_pass():
+    calls = []
+
+    def predict_fn(batch):
+        calls.append(len(batch))
+        return batch[:, 0, 0, :] * 10
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=200)
+    try:
+        results = predict_in_threads(batcher, [images(i) for i in range(4)])
+    finally:
+        batcher.shutdown()
+
+    # Each caller gets its own row back, however the requests were grouped
+    assert [float(result[0, 0]) for result in results] == [0.0, 10.0, 20.0, 30.0]
+    assert sum(calls) == 4
+    assert len(calls) < 4
+    stats = batcher.get_stats()
+    assert stats['images'] == 4
+    assert stats['batches'] == len(calls)
+
+
+def test_batches_never_exceed_max_batch_size():
+    calls = []
+
+    def predict_fn(batch):
+        calls.append(len(batch))
+        return batch[:, 0, 0, :]
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=2, max_wait_ms=100)
+    try:
+        predict_in_threads(batcher, [images(i) for i in range(6)])
+    finally:
+        batcher.shutdown()
+
+    assert sum(calls) == 6
+    assert max(calls) <= 2
+
+
+def test_tuple_outputs_are_split_per_caller():
+    def predict_fn(batch):
+        return batch[:, 0, 0, :], batch[:, 0, 0, :] * -1
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=100)
+    try:
+        first, second = predict_in_threads(batcher, [images(1, 2), images(3)])
+    finally:
+        batcher.shutdown()
+
+    assert first[0].ravel().tolist() == [1.0, 2.0]
+    assert first[1].ravel().tolist() == [-1.0, -2.0]
+    assert second[0].ravel().tolist() == [3.0]
+    assert second[1].ravel().tolist() == [-3.0]
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    def predict_fn(batch):
+        raise RuntimeError('model exploded')
+
+    batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=50)
+    try:
+        with pytest.raises(RuntimeError, match='model exploded'):
+            batcher.predict(images(1), timeout=5)
+        # The worker survives a failed batch
+        batcher.predict_fn = lambda batch: batch[:, 0, 0, :]
+        assert batcher.predict(images(7), timeout=5).ravel().tolist() == [7.0]
+    finally:
+        batcher.shutdown()
+
+
+def test_requests_pinned_to_different_engines_never_share_a_forward_pass():
+    calls = []
+
+    def engine(scale):
+        def predict_fn(batch):
+            calls.append((scale, len(batch)))
+            return batch[:, 0, 0, :] * scale
+        return predict_fn
+
+    old, new = engine(10), engine(100)
+    batcher = MicroBatcher(old, max_batch_size=8, max_wait_ms=200)
+    try:
+        results = [None] * 4
+        ready = threading.Barrier(4)
+
+        def call(index):
+            ready.wait()
+            results[index] = batcher.predict(images(1), timeout=5, predict_fn=new if index % 2 else None)
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        batcher.shutdown()
+
+    # Every request is answered by the engine it asked for
+    assert [float(result[0, 0]) for result in results] == [10.0, 100.0, 10.0, 100.0]
+    assert sum(rows for scale, rows in calls if scale == 10) == 2
+    assert sum(rows for scale, rows in calls if scale == 100) == 2
@@ -0,0 +1,150 @@
+"""Tests for the catalog cache: single-flight loads, TTLs and invalidation"""
+
+import threading
+
+import pytest
+
+import catalog_cache
+from catalog_cache import CatalogCache
+
+
+class BlockingLoader:
+    """Loader that blocks until released, counting its calls"""
+
+    def __init__(self, values=None):
+        self.values = values or ['first', 'second', 'third']
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        value = self.values[self.calls - 1]
+        self.started.set()
+        assert self.release.wait(5)
+        return value
+
+
+def run_in_thread(fn, results, index):
+    def target():
+        try:
+            results[index] = fn()
+        except Exception as e:
+            results[index] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def test_concurrent_misses_run_one_load():
+    cache = CatalogCache()
+    loader = BlockingLoader()
+    cache.register('products', loader, ttl=60)
+
+    results = [None] * 5
+    threads = [run_in_thread(lambda: cache.get('products'), results, 0)]
+    assert loader.started.wait(5)
+    threads += [run_in_thread(lambda: cache.get('products'), results, i) for i in range(1, 5)]
+    # Let the waiters reach the pending load before it completes
+    while cache.get_stats()['coalesced'] < 4:
+        threading.Event().wait(0.01)
+    loader.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['first'] * 5
+    assert loader.calls == 1
+    stats = cache.get_stats()
+    assert (stats['misses'], stats['coalesced']) == (1, 4)
+    assert cache.get('products') == 'first'
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_invalidation_during_a_load_is_not_overwritten_by_it():
+    cache = CatalogCache()
+    loader = BlockingLoader()
+    cache.register('research_labs', loader, ttl=60)
+
+    results = [None]
+    thread = run_in_thread(lambda: cache.get('research_labs'), results, 0)
+    assert loader.started.wait(5)
+    # The rows changed while the query was running: its result is already stale
+    cache.invalidate('research_labs')
+    loader.release.set()
+    thread.join()
+
+    assert results == ['first']  # the request that ran the load still gets its answer
+    assert cache.get_stats()['entries'] == {}
+    assert cache.get('research_labs') == 'second'
+    assert loader.calls == 2
+
+
+def test_load_errors_reach_every_waiter_and_are_not_cached():
+    cache = CatalogCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def failing_load():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+            raise ConnectionError('MySQL is down')
+        return ['rows']
+
+    cache.register('products', failing_load, ttl=60)
+    results = [None, None]
+    threads = [run_in_thread(lambda: cache.get('products'), results, 0)]
+    assert started.wait(5)
+    threads.append(run_in_thread(lambda: cache.get('products'), results, 1))
+    while cache.get_stats()['coalesced'] < 1:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert cache.get('products') == ['rows']
+    assert len(calls) == 2
+
+
+def test_entries_expire_after_their_ttl():
+    cache = CatalogCache()
+    values = iter([1, 2])
+    cache.register('products', lambda: next(values), ttl=0)
+
+    assert cache.get('products') == 1
+    assert cache.get('products') == 2
+
+
+def test_etag_follows_the_value():
+    cache = CatalogCache()
+    values = iter([{'a': 1}, {'a': 1}, {'a': 2}])
+    cache.register('products', lambda: next(values), ttl=60)
+
+    first = cache.entry('products').etag
+    cache.invalidate()
+    assert cache.entry('products').etag == first
+    cache.invalidate()
+    assert cache.entry('products').etag != first
+
+
+def test_invalidation_reaches_other_workers_through_the_trigger_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_cache, 'TRIGGER_CHECK_SECONDS', 0)
+    trigger = str(tmp_path / 'catalog.refresh')
+    here, other = CatalogCache(trigger), CatalogCache(trigger)
+    for cache, values in ((here, iter(['a1', 'a2'])), (other, iter(['b1', 'b2']))):
+        cache.register('products', lambda values=values: next(values), ttl=60)
+
+    assert (here.get('products'), other.get('products')) == ('a1', 'b1')
+    here.invalidate('products')
+    assert other.get('products') == 'b2'
+    assert here.get('products') == 'a2'
+
+
+def test_unregistered_keys_raise_every_time():
+    cache = CatalogCache()
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            cache.get('nope')
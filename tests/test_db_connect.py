@@ -0,0 +1,127 @@
+"""Tests for the MySQL connection pool: bounded checkout, reuse and recycling"""
+
+import threading
+import time
+
+import pytest
+
+import db_connect
+from db_connect import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.connected = True
+        self.rollbacks = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Connections mysql.connector.connect() opened, in order"""
+    connections = []
+
+    def connect(**settings):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(db_connect.mysql.connector, 'connect', connect)
+    return connections
+
+
+def test_returned_connections_are_reused(opened):
+    pool = ConnectionPool(max_size=2, checkout_timeout=1)
+    first = pool.checkout()
+    pool.checkin(first)
+
+    assert pool.checkout() is first
+    assert first.rollbacks == 1  # the next borrower gets a fresh read snapshot
+    assert len(opened) == 1
+    assert pool.get_stats()['in_use'] == 1
+
+
+def test_checkout_waits_for_a_connection_and_then_times_out(opened):
+    pool = ConnectionPool(max_size=1, checkout_timeout=0.1)
+    held = pool.checkout()
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+    assert time.monotonic() - started >= 0.1
+    assert pool.get_stats()['timeouts'] == 1
+
+    # A connection returned while another thread waits is handed to it
+    pool.checkout_timeout = 5
+    threading.Timer(0.05, pool.checkin, args=(held,)).start()
+    assert pool.checkout() is held
+    assert len(opened) == 1
+
+
+def test_connections_past_their_lifetime_are_replaced(opened):
+    pool = ConnectionPool(max_size=1, checkout_timeout=1, max_lifetime=0.05)
+    first = pool.checkout()
+    pool.checkin(first)
+    time.sleep(0.1)
+
+    second = pool.checkout()
+    assert second is not first
+    assert first.closed
+    stats = pool.get_stats()
+    assert (stats['opened'], stats['discarded'], stats['open']) == (2, 1, 1)
+
+
+def test_idle_connections_that_dropped_are_replaced(opened):
+    pool = ConnectionPool(max_size=1, checkout_timeout=1, ping_after=0)
+    first = pool.checkout()
+    pool.checkin(first)
+    first.connected = False
+
+    assert pool.checkout() is not first
+    assert pool.get_stats()['discarded'] == 1
+
+
+def test_a_failed_connect_gives_its_slot_back(monkeypatch):
+    def refuse(**settings):
+        raise db_connect.Error('Connection refused')
+
+    monkeypatch.setattr(db_connect.mysql.connector, 'connect', refuse)
+    pool = ConnectionPool(max_size=1, checkout_timeout=0.1)
+    for _ in range(2):
+        with pytest.raises(db_connect.Error, match='refused'):
+            pool.checkout()
+    assert pool.get_stats()['open'] == 0
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.row
+
+
+def test_has_column_asks_information_schema_and_tells_an_outage_apart():
+    db = db_connect.DatabaseConnection(database='rice')
+    db.cursor = FakeCursor((1,))
+    assert db.has_column('prediction_history', 'embedding') is True
+    assert db.cursor.executed[0][1] == ('rice', 'prediction_history', 'embedding')
+
+    db.cursor = FakeCursor((0,))
+    assert db.has_column('prediction_history', 'embedding') is False
+
+    unreachable = db_connect.DatabaseConnection(database='rice')
+    unreachable._connect_failed = True
+    assert unreachable.has_column('prediction_history', 'embedding') is None
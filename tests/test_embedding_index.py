@@ -0,0 +1,96 @@
+"""Tests for the leaf embedding index: exact search, IVF training and re-synced rows"""
+
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex, encode_embedding, decode_embedding
+
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_exact_search_ranks_by_cosine_similarity():
+    index = EmbeddingIndex()
+    index.add([10, 20, 30], np.array([[1, 0], [0.8, 0.6], [0, 1]], dtype=np.float32))
+
+    results = index.search([2, 0], k=2)
+    assert [row_id for row_id, _ in results] == [10, 20]
+    assert results[0][1] == pytest.approx(1.0, abs=1e-3)
+    assert [row_id for row_id, _ in index.search([1, 0], k=2, exclude_id=10)] == [20, 30]
+    assert index.get_stats()['mode'] == 'exact'
+
+
+def test_an_empty_index_finds_nothing():
+    assert EmbeddingIndex().search([1, 0], k=5) == []
+
+
+def test_re_read_rows_are_not_added_twice():
+    index = EmbeddingIndex()
+    vectors = random_vectors(6)
+
+    assert index.add([1, 2, 4], vectors[:3]) == 3
+    # A sync re-reading its lookback window also returns a row that committed late (3)
+    assert index.add([2, 3, 4, 5], vectors[2:6]) == 2
+    assert len(index) == 5
+    assert index.max_id == 5
+    assert index.add([1, 2], vectors[:2]) == 0
+
+
+def test_embedding_size_must_match():
+    index = EmbeddingIndex()
+    index.add([1], random_vectors(1, dim=8))
+    with pytest.raises(ValueError):
+        index.add([2], random_vectors(1, dim=4))
+
+
+def test_ivf_index_is_trained_past_brute_force_max_and_retrained_as_it_doubles():
+    index = EmbeddingIndex(brute_force_max=200, nprobe=8)
+    vectors = random_vectors(1000)
+
+    index.add(range(1, 201), vectors[:200])
+    assert index.get_stats()['mode'] == 'exact'
+
+    index.add(range(201, 301), vectors[200:300])
+    assert index.get_stats()['mode'] == 'ivf'
+    assert index._trained_size == 300
+
+    # Rows added between trainings are assigned to the current lists
+    index.add(range(301, 501), vectors[300:500])
+    assert index._trained_size == 300
+    assert sum(len(rows) for rows in index._lists) == 500
+
+    index.add(range(501, 601), vectors[500:600])
+    assert index._trained_size == 600
+    assert sum(len(rows) for rows in index._lists) == 600
+
+    # Every stored vector is found as its own nearest neighbour
+    for row in (0, 250, 450, 599):
+        assert index.search(vectors[row], k=1)[0][0] == row + 1
+
+
+def test_a_small_index_trains_no_more_lists_than_vectors():
+    index = EmbeddingIndex(brute_force_max=10)
+    vectors = random_vectors(30)
+    index.add(range(1, 31), vectors)
+
+    assert index.get_stats()['mode'] == 'ivf'
+    assert len(index._lists) <= 30
+    assert index.search(vectors[5], k=1)[0][0] == 6
+
+
+def test_reset_drops_everything_for_a_new_model():
+    index = EmbeddingIndex(brute_force_max=100)
+    index.add(range(1, 131), random_vectors(130))
+    assert index.get_stats()['mode'] == 'ivf'
+    index.reset('v2')
+
+    stats = index.get_stats()
+    assert (stats['vectors'], stats['mode'], stats['model_version']) == (0, 'exact', 'v2')
+    assert index.max_id == 0
+
+
+def test_stored_embeddings_round_trip_normalised():
+    blob = encode_embedding([3.0, 4.0])
+    assert decode_embedding(blob).astype(np.float32) == pytest.approx([0.6, 0.8], abs=1e-3)
+    assert encode_embedding([0.0, 0.0]) is None
@@ -0,0 +1,112 @@
+"""Tests for decoding uploads: header checks against the decode limits, and tiling"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_preprocessing import ImageRejected, inspect_image, decode_image, decode_tiles, aggregate_tiles
+
+
+def encode(width, height, format='PNG', color=(40, 160, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def half_leaf(width, height):
+    """PNG whose left half is leaf green and right half grey soil"""
+    img = Image.new('RGB', (width, height), (120, 110, 100))
+    img.paste((40, 160, 40), (0, 0, width // 2, height))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_an_image_within_the_limits_decodes_to_a_model_array():
+    data = encode(300, 200, 'JPEG')
+    assert inspect_image(data).size == (300, 200)
+
+    img_array = decode_image(data, img_size=32)
+    assert img_array.shape == (1, 32, 32, 3)
+    assert img_array.dtype == np.float32
+    assert 0.0 <= img_array.min() and img_array.max() <= 1.0
+
+
+def test_uploads_over_the_byte_limit_are_refused_before_opening():
+    with pytest.raises(ImageRejected) as rejected:
+        inspect_image(b'\xff' * 2048, max_bytes=1024)
+    assert rejected.value.status == 413
+
+
+def test_unreadable_data_is_a_bad_request():
+    with pytest.raises(ImageRejected) as rejected:
+        inspect_image(b'not an image')
+    assert rejected.value.status == 400
+
+
+def test_the_side_limit_is_checked_from_the_header():
+    with pytest.raises(ImageRejected, match='400x50, max 300 pixels per side') as rejected:
+        inspect_image(encode(400, 50), max_side=300)
+    assert rejected.value.status == 413
+
+
+def test_the_pixel_limit_applies_to_what_the_decoder_produces():
+    png = encode(1000, 1000)
+    with pytest.raises(ImageRejected, match=r'1000x1000 \(1\.0 megapixels\), max 0\.5 megapixels') as rejected:
+        inspect_image(png, img_size=100, max_pixels=500_000)
+    assert rejected.value.status == 413
+
+    # A JPEG scaled down in draft mode is only charged for its decoded pixels
+    jpeg = encode(1000, 1000, 'JPEG')
+    assert inspect_image(jpeg, img_size=100, max_pixels=500_000).size == (125, 125)
+    with pytest.raises(ImageRejected, match=r'1000x1000 and decodes at 125x125 \(0\.0 megapixels\)'):
+        inspect_image(jpeg, img_size=100, max_pixels=10_000)
+    # ... unless the full frame will be decoded
+    with pytest.raises(ImageRejected):
+        inspect_image(jpeg, img_size=None, max_pixels=500_000)
+    with pytest.raises(ImageRejected):
+        decode_image(png, img_size=100, max_pixels=500_000)
+
+
+def test_tiles_that_are_mostly_background_are_skipped():
+    # Scaled to 104x52: 2 rows x 4 columns of 32 px tiles, 24 px apart
+    tiles, layout = decode_tiles(half_leaf(208, 104), img_size=32)
+
+    assert (layout['rows'], layout['cols'], layout['stride']) == (2, 4, 24)
+    assert sorted(layout['positions']) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert tiles.shape == (4, 32, 32, 3)
+    assert layout['foreground'] == sorted(layout['foreground'], reverse=True)
+
+
+def test_max_tiles_keeps_the_most_plant_covered_tiles():
+    tiles, layout = decode_tiles(half_leaf(208, 104), img_size=32, max_tiles=2)
+    assert sorted(layout['positions']) == [(0, 0), (1, 0)]
+    assert layout['foreground'] == [1.0, 1.0]
+    assert len(tiles) == 2
+
+
+def test_an_image_without_plant_tissue_is_scored_whole():
+    tiles, layout = decode_tiles(encode(208, 104, color=(120, 110, 100)), img_size=32)
+    assert tiles.shape == (1, 32, 32, 3)
+    assert layout['positions'] == []
+
+
+def test_tiles_are_weighted_by_coverage_and_confidence():
+    layout = {'rows': 1, 'cols': 3, 'tile_size': 32, 'stride': 24,
+              'positions': [(0, 0), (0, 1)], 'foreground': [1.0, 0.5]}
+    probabilities, grid = aggregate_tiles([[0.9, 0.1], [0.2, 0.8]], layout)
+
+    # Weights 1.0 * 0.9 and 0.5 * 0.8
+    assert probabilities == pytest.approx([(0.81 + 0.08) / 1.3, (0.09 + 0.32) / 1.3])
+    assert grid['heat'] == [[90.0, 20.0, None]]
+    assert (grid['evaluated'], grid['skipped']) == (2, 1)
+
+
+def test_a_whole_frame_view_is_passed_through():
+    layout = {'rows': 2, 'cols': 2, 'tile_size': 32, 'stride': 24, 'positions': [], 'foreground': []}
+    probabilities, grid = aggregate_tiles([[0.3, 0.7]], layout)
+    assert probabilities == pytest.approx([0.3, 0.7])
+    assert grid['heat'] == [[None, None], [None, None]]
+    assert grid['skipped'] == 4
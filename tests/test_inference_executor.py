@@ -0,0 +1,105 @@
+"""Tests for the bounded inference executor: queue limits, start deadlines and Retry-After"""
+
+import threading
+import time
+
+import pytest
+
+from inference_executor import BoundedExecutor, Overloaded, MAX_RETRY_AFTER_SECONDS
+
+
+def occupy(executor, count):
+    """Start count tasks that hold their worker until the returned event is set"""
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def hold():
+        started.release()
+        release.wait(5)
+
+    threads = [threading.Thread(target=executor.run, args=(hold,), kwargs={'shed': False}) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for _ in range(min(count, executor.workers)):
+        assert started.acquire(timeout=5)
+    return release, threads
+
+
+def wait_for_queue_depth(executor, depth):
+    deadline = time.monotonic() + 5
+    while executor.get_stats()['queue_depth'] < depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_results_and_errors_come_back_to_the_caller():
+    executor = BoundedExecutor(workers=2, max_queue=4)
+    assert executor.run(lambda a, b: a + b, 2, 3) == 5
+
+    def fail():
+        raise ValueError('bad image')
+
+    with pytest.raises(ValueError, match='bad image'):
+        executor.run(fail)
+    stats = executor.get_stats()
+    assert (stats['completed'], stats['failed'], stats['shed']['total']) == (1, 1, 0)
+
+
+def test_a_full_queue_sheds_new_tasks_at_once():
+    executor = BoundedExecutor(workers=1, max_queue=1, queue_timeout_ms=5000)
+    release, threads = occupy(executor, 2)  # one running, one waiting
+    wait_for_queue_depth(executor, 1)
+
+    started = time.monotonic()
+    with pytest.raises(Overloaded) as shed:
+        executor.run(lambda: None)
+    assert time.monotonic() - started < 1  # not held for queue_timeout_ms
+    assert shed.value.reason == 'queue_full'
+    with pytest.raises(Overloaded):
+        executor.check_capacity()
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert executor.get_stats()['shed'] == {'queue_full': 2, 'deadline': 0, 'total': 2}
+    executor.check_capacity()
+
+
+def test_a_task_that_cannot_start_before_the_deadline_is_shed_and_skipped():
+    executor = BoundedExecutor(workers=1, max_queue=4, queue_timeout_ms=50)
+    release, threads = occupy(executor, 1)
+    ran = []
+
+    with pytest.raises(Overloaded) as shed:
+        executor.run(ran.append, 'late')
+    assert shed.value.reason == 'deadline'
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    # The worker drops the abandoned task instead of running it for nobody
+    assert executor.run(lambda: 'next') == 'next'
+    assert ran == []
+    assert executor.shed_total() == 1
+
+
+def test_background_callers_wait_for_a_slot_instead_of_being_shed():
+    executor = BoundedExecutor(workers=1, max_queue=1, queue_timeout_ms=10)
+    release, threads = occupy(executor, 1)
+    threading.Timer(0.1, release.set).start()
+
+    assert executor.run(lambda: 'done', shed=False) == 'done'
+    for thread in threads:
+        thread.join()
+    assert executor.shed_total() == 0
+
+
+def test_retry_after_follows_the_backlog_and_service_time():
+    executor = BoundedExecutor(workers=2, max_queue=8)
+    assert executor.retry_after() == 1
+
+    executor._avg_service = 4.0
+    executor._active = 2
+    assert executor.retry_after() == 4  # 2 running tasks of ~4 s over 2 workers
+    executor._avg_service = 100.0
+    assert executor.retry_after() == MAX_RETRY_AFTER_SECONDS
@@ -0,0 +1,128 @@
+"""Tests for the SQLite job queue: claims, visibility timeouts and heartbeats"""
+
+import time
+
+import pytest
+
+from job_queue import JobQueue, Completed, QUEUED, RUNNING, DONE, FAILED
+
+
+def wait_for_status(queue, job_id, statuses, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        queue.wait_for_change(0.05)
+    raise AssertionError(f"Job {job_id} is still {queue.get(job_id)['status']}")
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(handler=lambda payload, data: None, **options):
+        options.setdefault('poll_interval', 0.02)
+        return JobQueue(str(tmp_path / 'jobs.db'), handler, **options)
+    return make
+
+
+def test_submitted_jobs_run_and_keep_their_result(make_queue):
+    queue = make_queue(lambda payload, data: {'sum': payload['a'] + len(data)}, workers=1)
+    job_id = queue.submit({'a': 1}, b'abc')
+    assert queue.get(job_id)['status'] == QUEUED
+
+    queue.start()
+    job = wait_for_status(queue, job_id, (DONE,))
+    assert job['result'] == {'sum': 4}
+    assert job['attempts'] == 1
+    assert queue.get('unknown') is None
+
+
+def test_a_job_whose_worker_went_quiet_is_claimed_again(make_queue):
+    queue = make_queue(visibility_timeout=0.2)
+    job_id = queue.submit({'n': 1})
+
+    first = queue._claim()
+    assert first[0] == job_id
+    assert queue._claim() is None  # hidden while the first claim is fresh
+
+    time.sleep(0.3)
+    second = queue._claim()
+    assert second[0] == job_id
+    assert second[-1] == 2  # attempts
+
+    # The first worker finishing late must not overwrite the second one's outcome
+    assert not queue._finish(job_id, first[1], DONE, result='stale')
+    assert queue.get(job_id)['status'] == RUNNING
+    assert queue._finish(job_id, second[1], DONE, result='fresh')
+    assert queue.get(job_id)['result'] == 'fresh'
+
+
+def test_jobs_that_outlive_max_attempts_fail(make_queue):
+    queue = make_queue(visibility_timeout=0.05, max_attempts=2)
+    job_id = queue.submit({})
+
+    for _ in range(2):
+        assert queue._claim() is not None
+        time.sleep(0.1)
+    assert queue._claim() is None
+
+    job = queue.get(job_id)
+    assert job['status'] == FAILED
+    assert job['error'] == 'Worker did not finish the job'
+
+
+def test_the_heartbeat_keeps_a_slow_job_claimed(make_queue):
+    committed = []
+
+    def slow_handler(payload, data):
+        time.sleep(0.8)
+        return Completed({'n': payload['n']}, lambda: committed.append(payload['n']))
+
+    queue = make_queue(slow_handler, workers=2, visibility_timeout=0.3)
+    job_id = queue.submit({'n': 7})
+    queue.start()
+
+    job = wait_for_status(queue, job_id, (DONE, FAILED))
+    # Without the heartbeat the second worker would have picked it up after 0.3 s
+    assert job['attempts'] == 1
+    assert job['result'] == {'n': 7}
+    assert committed == [7]
+
+
+def test_a_worker_whose_job_was_taken_over_records_nothing(make_queue):
+    committed = []
+
+    def handler(payload, data):
+        # Another worker claims the job while this one is still running it
+        with queue._connect() as conn:
+            conn.execute("UPDATE jobs SET claimed_at = claimed_at + 1")
+        return Completed('late', lambda: committed.append('late'))
+
+    queue = make_queue(handler, workers=1)
+    job_id = queue.submit({})
+    queue.start()
+
+    deadline = time.monotonic() + 5
+    while queue.get(job_id)['attempts'] == 0 or queue._held:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    job = queue.get(job_id)
+    assert (job['status'], job['result']) == (RUNNING, None)
+    assert committed == []
+
+
+def test_a_job_fails_once_its_attempts_are_used_up(make_queue):
+    attempts = []
+
+    def flaky_handler(payload, data):
+        attempts.append(1)
+        raise ValueError('bad image')
+
+    queue = make_queue(flaky_handler, workers=1, max_attempts=1)
+    job_id = queue.submit({})
+    queue.start()
+
+    job = wait_for_status(queue, job_id, (FAILED,))
+    assert job['error'] == 'bad image'
+    assert attempts == [1]
+    assert queue.get_stats()[FAILED] == 1
@@ -0,0 +1,102 @@
+"""Tests for merging the metric snapshots of pre-forked workers"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def worker_registry(directory):
+    """A registry with the same metrics as every other worker's"""
+    registry = MetricsRegistry()
+    registry.stage = registry.histogram('stage_seconds', 'Stage time', ['stage'], buckets=(0.1, 1.0))
+    registry.in_flight = registry.gauge('in_flight', 'Requests in flight')
+    registry.oldest = registry.gauge('oldest_seconds', 'Oldest queued job', multiprocess_mode='max')
+    registry.shed = registry.counter('shed_total', 'Requests shed')
+    registry.enable_multiprocess(str(directory))
+    return registry
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def as_exited_worker(registry, directory):
+    """Publish registry's snapshot under the pid of a process that has exited"""
+    registry.write_snapshot()
+    os.replace(directory / f'{os.getpid()}.json', directory / f'{exited_pid()}.json')
+
+
+def sample(text, line_start):
+    matches = [line for line in text.splitlines() if line.startswith(line_start + ' ')]
+    assert len(matches) == 1, line_start
+    return float(matches[0].rsplit(' ', 1)[1])
+
+
+def test_histograms_and_counters_are_summed_over_every_worker(tmp_path):
+    other = worker_registry(tmp_path)
+    other.stage.observe(0.05, 'decode')
+    other.stage.observe(0.5, 'decode')
+    other.shed.inc(amount=3)
+    as_exited_worker(other, tmp_path)
+
+    registry = worker_registry(tmp_path)
+    registry.stage.observe(2.0, 'decode')
+    registry.shed.inc()
+    text = registry.render()
+
+    assert sample(text, 'stage_seconds_bucket{stage="decode",le="0.1"}') == 1
+    assert sample(text, 'stage_seconds_bucket{stage="decode",le="1.0"}') == 2
+    assert sample(text, 'stage_seconds_count{stage="decode"}') == 3
+    assert sample(text, 'stage_seconds_sum{stage="decode"}') == pytest.approx(2.55)
+    assert sample(text, 'shed_total') == 4
+
+
+def test_gauges_only_count_workers_that_are_still_running(tmp_path):
+    other = worker_registry(tmp_path)
+    other.in_flight.set(5)
+    as_exited_worker(other, tmp_path)
+
+    registry = worker_registry(tmp_path)
+    registry.in_flight.set(2)
+    registry.oldest.set(7.5)
+    # A second live worker (this test process's parent stands in for it)
+    live = worker_registry(tmp_path)
+    live.in_flight.set(1)
+    live.oldest.set(3.0)
+    live.write_snapshot()
+    os.replace(tmp_path / f'{os.getpid()}.json', tmp_path / f'{os.getppid()}.json')
+
+    text = registry.render()
+    assert sample(text, 'in_flight') == 3
+    assert sample(text, 'oldest_seconds') == 7.5
+
+
+def test_a_retired_worker_leaves_its_counts_in_the_archive(tmp_path):
+    retiring = worker_registry(tmp_path)
+    retiring.stage.observe(0.05, 'infer')
+    retiring.shed.inc(amount=2)
+    retiring.in_flight.set(4)
+    retiring.write_snapshot()
+    retiring.retire()
+    assert sorted(os.listdir(tmp_path)) == ['archive.json', 'archive.lock']
+
+    registry = worker_registry(tmp_path)
+    text = registry.render()
+    assert sample(text, 'stage_seconds_count{stage="infer"}') == 1
+    assert sample(text, 'shed_total') == 2
+    assert not [line for line in text.splitlines() if line.startswith('in_flight ')]
+
+
+def test_a_single_process_renders_its_own_values():
+    registry = MetricsRegistry()
+    shed = registry.counter('shed_total', 'Requests shed')
+    shed.inc(amount=2)
+    with pytest.raises(ValueError):
+        shed.dec()
+    assert sample(registry.render(), 'shed_total') == 2
@@ -0,0 +1,113 @@
+"""Tests for shadow scoring of a candidate model and backing off failed model loads"""
+
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import model_registry
+from model_registry import ShadowEvaluator, BuildBackoff
+
+
+class FakeEngine:
+    def __init__(self, output, version='v2', error=None):
+        self.output = np.asarray(output, dtype=np.float32)
+        self.version = version
+        self.error = error
+        self.calls = 0
+
+    def predict(self, inputs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.output
+
+
+def wait_for(evaluator, key, value):
+    deadline = time.monotonic() + 5
+    while evaluator.get_stats()[key] < value:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_the_candidate_is_compared_with_production():
+    evaluator = ShadowEvaluator(FakeEngine([[0.8, 0.2]]), sample_rate=1.0)
+    evaluator.submit(np.zeros((1, 2, 2, 3)), [0.6, 0.4], 12.0)
+    evaluator.submit(np.zeros((1, 2, 2, 3)), [0.1, 0.9], 20.0)
+    wait_for(evaluator, 'compared', 2)
+    evaluator.stop()
+
+    stats = evaluator.get_stats()
+    assert stats['version'] == 'v2'
+    assert (stats['sampled'], stats['compared'], stats['errors']) == (2, 2, 0)
+    assert stats['top1_agreement'] == 0.5
+    assert stats['mean_abs_diff'] == pytest.approx((0.2 + 0.7) / 2)
+    assert stats['production_latency_ms']['p50'] == 16.0
+
+
+def test_unsampled_predictions_are_not_scored():
+    engine = FakeEngine([[1.0, 0.0]])
+    evaluator = ShadowEvaluator(engine, sample_rate=0.0)
+    for _ in range(20):
+        evaluator.submit(np.zeros((1, 2, 2, 3)), [1.0, 0.0], 5.0)
+    evaluator.stop()
+    evaluator._thread.join(5)
+
+    assert engine.calls == 0
+    assert evaluator.get_stats()['sampled'] == 0
+
+
+def test_samples_beyond_max_pending_are_dropped_without_blocking():
+    evaluator = ShadowEvaluator(FakeEngine([[1.0, 0.0]]), sample_rate=1.0, max_pending=1)
+    evaluator.stop()  # park the worker so the queue fills
+    evaluator._thread.join(5)
+    for _ in range(3):
+        evaluator.submit(np.zeros((1, 2, 2, 3)), [1.0, 0.0], 5.0)
+
+    stats = evaluator.get_stats()
+    assert (stats['sampled'], stats['dropped']) == (1, 2)
+
+
+def test_candidate_failures_are_counted():
+    evaluator = ShadowEvaluator(FakeEngine([[1.0]], error=RuntimeError('bad weights')), sample_rate=1.0)
+    evaluator.submit(np.zeros((1, 2, 2, 3)), [1.0], 5.0)
+    wait_for(evaluator, 'errors', 1)
+    evaluator.stop()
+    assert evaluator.get_stats()['compared'] == 0
+
+
+def test_a_failed_version_is_retried_after_a_doubling_delay(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_registry, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    backoff = BuildBackoff(initial_seconds=60, max_seconds=150)
+
+    assert backoff.should_build('live', 'v3', 111)
+    assert backoff.failed('live', 'v3', 111, OSError('missing weights')) == 60
+    assert not backoff.should_build('live', 'v3', 111)
+    now[0] += 60
+    assert backoff.should_build('live', 'v3', 111)
+
+    assert backoff.failed('live', 'v3', 111, OSError('missing weights')) == 120
+    assert backoff.failed('live', 'v3', 111, OSError('missing weights')) == 150  # capped
+    assert backoff.get_stats() == {'live': {'version': 'v3', 'attempts': 3, 'error': 'missing weights',
+                                            'retry_in': 150.0}}
+
+
+def test_rewriting_the_pointer_retries_at_once():
+    backoff = BuildBackoff(initial_seconds=60)
+    backoff.failed('live', 'v3', 111, OSError('missing weights'))
+
+    assert backoff.should_build('live', 'v3', 222)  # promoted again
+    assert backoff.should_build('live', 'v4', 111)
+    assert backoff.should_build('shadow', 'v3', 111)
+    # A new pointer write starts the delay over
+    assert backoff.failed('live', 'v3', 222, OSError('missing weights')) == 60
+
+
+def test_a_successful_build_clears_the_failure():
+    backoff = BuildBackoff()
+    backoff.failed('shadow', 'v3', 111, OSError('missing weights'))
+    backoff.succeeded('shadow')
+    assert backoff.should_build('shadow', 'v3', 111)
+    assert backoff.get_stats() == {}
@@ -0,0 +1,139 @@
+"""Tests for the two-tier prediction cache"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from prediction_cache import PredictionCache
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / 'model.tflite'
+    path.write_bytes(b'weights-v1')
+    return str(path)
+
+
+def test_memory_hits_then_disk_hits_after_a_restart(tmp_path, model_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = PredictionCache(model_path, cache_dir)
+    key = PredictionCache.key_for(b'leaf photo')
+
+    assert cache.get(key) is None
+    cache.put(key, [0.1, 0.9])
+    assert cache.get(key) == pytest.approx([0.1, 0.9])
+
+    restarted = PredictionCache(model_path, cache_dir)
+    assert restarted.model_version == cache.model_version
+    assert restarted.get(key) == pytest.approx([0.1, 0.9])
+    assert restarted.get(key).dtype == np.float32
+
+    stats = cache.get_stats()
+    assert (stats['misses'], stats['hits_memory']) == (1, 1)
+    assert restarted.get_stats()['hits_disk'] == 1
+    assert restarted.get_stats()['hits_memory'] == 1
+
+
+def test_least_recently_used_entries_are_evicted_from_memory(tmp_path, model_path):
+    cache = PredictionCache(model_path, str(tmp_path / 'cache'), max_entries=2)
+    cache.put('a' * 64, [1.0])
+    cache.put('b' * 64, [2.0])
+    cache.get('a' * 64)
+    cache.put('c' * 64, [3.0])
+
+    assert set(cache._entries) == {'a' * 64, 'c' * 64}
+    assert cache.get_stats()['evictions'] == 1
+    # Evicted entries are still on disk
+    assert cache.get('b' * 64) == pytest.approx([2.0])
+
+
+def test_a_new_model_file_invalidates_both_tiers(tmp_path, model_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = PredictionCache(model_path, cache_dir)
+    cache.put('a' * 64, [1.0])
+    old_version = cache.model_version
+
+    with open(model_path, 'wb') as f:
+        f.write(b'retrained weights')
+    assert cache.get('a' * 64) is None
+    assert cache.model_version != old_version
+    assert cache.get_stats()['invalidations'] == 1
+    assert not os.path.exists(os.path.join(cache_dir, old_version))
+
+
+def test_following_a_hot_swapped_model(tmp_path, model_path):
+    cache = PredictionCache(model_path, str(tmp_path / 'cache'))
+    cache.put('a' * 64, [1.0])
+
+    candidate = tmp_path / 'candidate.tflite'
+    candidate.write_bytes(b'weights-v2')
+    cache.set_model_path(str(candidate))
+    assert cache.get('a' * 64) is None
+
+
+def test_nothing_is_cached_without_a_model_file(tmp_path):
+    cache = PredictionCache(str(tmp_path / 'missing.tflite'), str(tmp_path / 'cache'))
+    cache.put('a' * 64, [1.0])
+    assert cache.model_version is None
+    assert cache.get('a' * 64) is None
+
+
+def write_entries(cache, count):
+    """Put count entries whose disk files are one second apart, oldest first; returns their keys"""
+    keys = [f'{i:02d}' * 32 for i in range(count)]
+    for i, key in enumerate(keys):
+        cache.put(key, [float(i)])
+        os.utime(cache._disk_path(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    return keys
+
+
+def test_the_oldest_disk_entries_are_deleted_beyond_max_disk_entries(tmp_path, model_path):
+    cache = PredictionCache(model_path, str(tmp_path / 'cache'), max_disk_entries=3)
+    keys = write_entries(cache, 5)
+
+    assert cache.prune_disk() == 2
+    assert [os.path.exists(cache._disk_path(key)) for key in keys] == [False, False, True, True, True]
+    assert cache.get_stats()['disk_evictions'] == 2
+    assert cache.prune_disk() == 0
+
+
+def test_the_first_write_after_a_restart_prunes_in_the_background(tmp_path, model_path):
+    cache_dir = str(tmp_path / 'cache')
+    keys = write_entries(PredictionCache(model_path, cache_dir, max_disk_entries=100), 5)
+
+    restarted = PredictionCache(model_path, cache_dir, max_disk_entries=2)
+    restarted.put('ff' * 32, [1.0])
+    deadline = time.monotonic() + 5
+    while restarted.get_stats()['disk_evictions'] < 4:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert [os.path.exists(restarted._disk_path(key)) for key in keys] == [False] * 4 + [True]
+    assert os.path.exists(restarted._disk_path('ff' * 32))
+
+
+def test_requests_pinned_to_another_model_neither_read_nor_write(tmp_path, model_path):
+    cache = PredictionCache(model_path, str(tmp_path / 'cache'))
+    current = cache.model_version
+    cache.put('a' * 64, [1.0], current)
+
+    # e.g. a request still running on the engine a hot swap just replaced
+    assert cache.get('a' * 64, 'old-engine') is None
+    cache.put('b' * 64, [2.0], 'old-engine')
+    assert cache.get('b' * 64) is None
+    assert cache.get('a' * 64, current) == pytest.approx([1.0])
+
+
+def test_embeddings_are_kept_with_the_prediction(tmp_path, model_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = PredictionCache(model_path, cache_dir)
+    cache.put('a' * 64, [0.1, 0.9], embedding=[3.0, 4.0])
+    cache.put('b' * 64, [0.5, 0.5], embedding=[float('nan'), 1.0])  # a cascade answer
+
+    restarted = PredictionCache(model_path, cache_dir)
+    probabilities, embedding = restarted.get_entry('a' * 64)
+    assert probabilities == pytest.approx([0.1, 0.9])
+    assert embedding == pytest.approx([3.0, 4.0])
+    assert restarted.get_entry('b' * 64)[1] is None
+    assert cache.get_entry('a' * 64)[1] == pytest.approx([3.0, 4.0])
@@ -0,0 +1,114 @@
+"""Tests for the treatment recommendation index: database rows, fallbacks and rendering"""
+
+import json
+
+from recommendations import RecommendationIndex, Recommendation, DISEASES_QUERY, MAX_PESTICIDES
+
+FALLBACKS = {
+    'Blast': {
+        'description': 'Fungal disease',
+        'application_method': 'Spray',
+        'frequency': 'Every 10 days',
+        'pesticides': [{'name': 'Tricyclazole', 'details': 'Systemic fungicide', 'dosage': '120 g'}]
+    }
+}
+
+
+class FakeDatabase:
+    """fetch_query() answers from canned diseases and pesticide rows, or raises"""
+
+    def __init__(self, diseases=(), pesticides=(), error=None):
+        self.diseases = list(diseases)
+        self.pesticides = list(pesticides)
+        self.error = error
+        self.queries = 0
+        self.disconnects = 0
+
+    def fetch_query(self, query):
+        self.queries += 1
+        if self.error:
+            raise self.error
+        return self.diseases if query == DISEASES_QUERY else self.pesticides
+
+    def disconnect(self):
+        self.disconnects += 1
+
+
+def pesticide(disease_id, pesticide_id, effectiveness=90):
+    return (disease_id, pesticide_id, f'P{pesticide_id}', 'desc', '12.50', 'liter', effectiveness, 'Spray', '1 l')
+
+
+def test_database_recommendations_are_built_once_and_reused():
+    db = FakeDatabase([(1, 'Brown_Spot', 'Remove debris')], [pesticide(1, 7), pesticide(1, 8, None)])
+    index = RecommendationIndex(lambda: db, ['Brown_Spot'], FALLBACKS)
+
+    recommendation = index.get('Brown_Spot')
+    assert recommendation.fields['treatment'] == 'Remove debris'
+    assert [pest['name'] for pest in recommendation.fields['recommended_pesticides']] == ['P7', 'P8']
+    assert recommendation.fields['recommended_pesticides'][0]['price'] == 12.5
+    assert recommendation.fields['recommended_pesticides'][1]['effectiveness'] == 0
+
+    assert index.get('Brown_Spot') is recommendation
+    assert (db.queries, db.disconnects) == (2, 1)
+    assert index.get_stats()['from_database'] == 1
+
+
+def test_diseases_without_pesticides_fall_back_to_the_hardcoded_data():
+    db = FakeDatabase([(1, 'Blast', 'From MySQL'), (2, 'Tungro', 'Control leafhoppers')])
+    index = RecommendationIndex(lambda: db, ['Blast', 'Tungro'], FALLBACKS)
+
+    blast = index.get('Blast').fields
+    assert blast['treatment'] == 'Fungal disease'
+    assert blast['recommended_pesticides'][0]['name'] == 'Tricyclazole'
+    assert blast['recommended_pesticides'][0]['dosage_per_acre'] == '120 g'
+    assert index.get('Tungro').fields == {'treatment': 'Control leafhoppers', 'application_method': '',
+                                          'frequency': '', 'recommended_pesticides': []}
+    assert index.get('Unknown').fields['recommended_pesticides'] == []
+
+
+def test_at_most_max_pesticides_are_kept_per_disease():
+    rows = [pesticide(1, pesticide_id) for pesticide_id in range(MAX_PESTICIDES + 2)]
+    db = FakeDatabase([(1, 'Brown_Spot', '')], rows + rows[:1])
+    index = RecommendationIndex(lambda: db, ['Brown_Spot'], {})
+    assert len(index.get('Brown_Spot').fields['recommended_pesticides']) == MAX_PESTICIDES
+
+
+def test_a_failed_rebuild_keeps_the_previous_index():
+    db = FakeDatabase([(1, 'Brown_Spot', 'Remove debris')], [pesticide(1, 7)])
+    index = RecommendationIndex(lambda: db, ['Brown_Spot'], FALLBACKS)
+    recommendation = index.get('Brown_Spot')
+
+    db.error = RuntimeError('MySQL went away')
+    index.refresh()
+    assert index.get('Brown_Spot') is recommendation
+    assert index.get_stats()['last_error'] == 'MySQL went away'
+
+
+def test_the_first_build_falls_back_when_mysql_is_down():
+    db = FakeDatabase(error=RuntimeError('MySQL went away'))
+    index = RecommendationIndex(lambda: db, ['Blast'], FALLBACKS)
+    assert index.get('Blast').fields['treatment'] == 'Fungal disease'
+    assert db.disconnects == 1
+
+
+def test_a_trigger_file_change_rebuilds_on_the_next_check(tmp_path):
+    db = FakeDatabase([(1, 'Brown_Spot', 'Old')], [pesticide(1, 7)])
+    trigger_path = str(tmp_path / 'refresh')
+    worker = RecommendationIndex(lambda: db, ['Brown_Spot'], {}, trigger_path=trigger_path)
+    other = RecommendationIndex(lambda: db, ['Brown_Spot'], {}, trigger_path=trigger_path)
+    worker.get('Brown_Spot')
+    worker.check()
+    assert worker.refreshes == 1
+
+    db.diseases = [(1, 'Brown_Spot', 'New')]
+    other.trigger()
+    worker.check()
+    assert worker.get('Brown_Spot').fields['treatment'] == 'New'
+
+
+def test_rendered_responses_match_serializing_the_merged_dict():
+    recommendation = Recommendation(3, 'Drain the field', 'Spray', 'Weekly', [{'name': 'P1', 'price': 1.5}])
+    response = {'disease': 'Blast', 'confidence': 97.5}
+
+    assert json.loads(recommendation.render(response)) == {**response, **recommendation.fields}
+    assert json.loads(recommendation.render({})) == recommendation.fields
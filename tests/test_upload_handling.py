@@ -0,0 +1,62 @@
+"""Tests for reading batch uploads out of a zip archive"""
+
+import io
+import zipfile
+
+import pytest
+
+from upload_handling import read_archive
+
+
+def archive(*members, compression=zipfile.ZIP_STORED):
+    """Zip of (name, bytes) members"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as zf:
+        for name, content in members:
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+def is_image(filename):
+    return filename.lower().endswith(('.jpg', '.png'))
+
+
+def read(data, max_members=10, max_member_bytes=1000, max_total_bytes=5000):
+    return read_archive(data, is_image, max_members, max_member_bytes, max_total_bytes)
+
+
+def test_accepted_members_are_read_by_base_name():
+    data = archive(('field/a.jpg', b'a' * 10), ('notes.txt', b'skip'), ('field/b.png', b'b' * 20))
+    assert read(data) == [('a.jpg', b'a' * 10), ('b.png', b'b' * 20)]
+
+
+def test_one_member_past_the_limit_marks_the_archive_too_large():
+    data = archive(*[(f'{i}.jpg', b'x') for i in range(5)])
+    assert read(data, max_members=3) == [('0.jpg', b'x'), ('1.jpg', b'x'), ('2.jpg', b'x'), ('3.jpg', b'')]
+
+
+def test_a_member_over_its_size_limit_is_refused():
+    with pytest.raises(ValueError, match='too large: big.jpg'):
+        read(archive(('big.jpg', b'x' * 1001)))
+
+
+def test_the_uncompressed_total_is_capped_before_decompressing():
+    data = archive(*[(f'{i}.jpg', b'x' * 900) for i in range(6)])
+    with pytest.raises(ValueError, match='too large uncompressed'):
+        read(data)
+
+
+def test_members_compressed_far_beyond_an_image_are_refused():
+    bomb = archive(('bomb.png', b'\x00' * 100_000), compression=zipfile.ZIP_DEFLATED)
+    with pytest.raises(ValueError, match='compressed too far'):
+        read(bomb, max_member_bytes=10 ** 6, max_total_bytes=10 ** 6)
+
+
+def test_a_header_that_understates_the_size_does_not_get_past_the_limits():
+    data = bytearray(archive(('a.jpg', b'x' * 100)))
+    # Shrink the sizes in both headers; the stored data still holds 100 bytes
+    for header, offset in ((b'PK\x03\x04', 22), (b'PK\x01\x02', 24)):
+        position = data.index(header) + offset
+        data[position:position + 4] = (10).to_bytes(4, 'little')
+    with pytest.raises(zipfile.BadZipFile):
+        read(bytes(data), max_member_bytes=50)
@@ -0,0 +1,199 @@
+"""Tests for the write-behind buffer: batching, spilling to SQLite and draining back"""
+
+import sqlite3
+import time
+
+import pytest
+
+from write_behind import WriteBehindBuffer
+
+
+class FakeDatabase:
+    """
+    Stand-in for MySQL behind DatabaseConnection handles: rows land in
+    .rows, and the database can be taken down or made to refuse rows
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.batches = []
+        self.reachable = True
+        self.refuse = set()  # first values of rows an INSERT fails on
+
+    def handle(self):
+        return FakeHandle(self)
+
+
+class FakeHandle:
+    def __init__(self, database):
+        self.database = database
+        self.connection = object() if database.reachable else None
+
+    def execute_many(self, query, rows):
+        if self.connection is None:
+            return False
+        if any(row[0] in self.database.refuse for row in rows):
+            return False
+        self.database.rows.extend(rows)
+        self.database.batches.append(len(rows))
+        return True
+
+    def disconnect(self):
+        self.connection = None
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def make_buffer(tmp_path, database):
+    buffers = []
+
+    def make(start=True, **options):
+        options.setdefault('flush_ms', 20)
+        options.setdefault('drain_seconds', 3600)  # tests drain explicitly
+        buffer = WriteBehindBuffer('INSERT', database.handle, str(tmp_path / 'spill.db'), **options)
+        buffers.append(buffer)
+        if start:
+            buffer.start()
+            # The flusher drains the spill file once at start-up; let it finish so it doesn't race the test
+            deadline = time.monotonic() + 5
+            while buffer._next_drain <= time.monotonic() and time.monotonic() < deadline:
+                time.sleep(0.005)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.close(timeout=1)
+
+
+def spill_rows(buffer, table='spill'):
+    conn = sqlite3.connect(buffer.spill_path)
+    try:
+        return conn.execute(f"SELECT row, attempts FROM {table} ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_rows_are_written_in_multi_row_batches(make_buffer, database):
+    buffer = make_buffer(max_rows=10, flush_ms=10000)
+    buffer.add_many([(i, 'x') for i in range(25)])
+    assert buffer.flush(timeout=5)
+
+    assert database.rows == [(i, 'x') for i in range(25)]
+    assert database.batches == [10, 10, 5]
+    stats = buffer.get_stats()
+    assert (stats['written'], stats['flushes'], stats['pending']) == (25, 3, 0)
+
+
+def test_buffered_rows_are_written_after_flush_ms(make_buffer, database):
+    buffer = make_buffer(max_rows=100, flush_ms=20)
+    buffer.add((1, 'a'))
+    deadline = time.monotonic() + 5
+    while not database.rows and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert database.rows == [(1, 'a')]
+
+
+def test_rows_are_spilled_while_mysql_is_down_and_drained_when_it_is_back(make_buffer, database):
+    buffer = make_buffer(max_rows=10)
+    database.reachable = False
+    buffer.add_many([(1, b'\x00\x01'), (2, None)])
+    assert buffer.flush(timeout=5)
+
+    assert database.rows == []
+    assert len(spill_rows(buffer)) == 2
+    stats = buffer.get_stats()
+    assert (stats['spilled'], stats['failed_flushes'], stats['last_error']) == (2, 1, 'Database unreachable')
+
+    # Retries while MySQL is still down don't count against the rows
+    buffer._drain()
+    assert [attempts for _, attempts in spill_rows(buffer)] == [0, 0]
+
+    database.reachable = True
+    buffer._drain()
+    assert database.rows == [(1, b'\x00\x01'), (2, None)]  # bytes survive the round trip
+    assert spill_rows(buffer) == []
+    assert buffer.get_stats()['drained'] == 2
+
+
+def test_rows_beyond_max_pending_go_straight_to_the_spill_file(make_buffer, database):
+    buffer = make_buffer(max_rows=100, flush_ms=10000, max_pending=3)
+    buffer.add_many([(i,) for i in range(5)])
+
+    assert buffer.pending() == 3
+    assert buffer.flush(timeout=5)
+    assert database.rows == [(0,), (1,), (2,)]
+    # The buffered rows' journal entries are gone; the overflow waits for the drain
+    assert [row for row, _ in spill_rows(buffer)] == ['[3]', '[4]']
+
+
+def test_a_refused_row_does_not_hold_back_the_rest(make_buffer, database):
+    buffer = make_buffer(start=False, max_rows=10, max_attempts=2, drain_seconds=0.1)
+    buffer._spill([('bad',), ('ok1',), ('ok2',)])
+    database.refuse = {'bad'}
+
+    buffer._drain()
+    assert database.rows == [('ok1',), ('ok2',)]
+    # A refused row waits for the next drain rather than being retried in this one
+    assert spill_rows(buffer) == [('["bad"]', 1)]
+    buffer._drain()
+    assert spill_rows(buffer) == [('["bad"]', 1)]
+
+    # Refused max_attempts times: moved aside instead of retried forever
+    time.sleep(0.15)
+    buffer._drain()
+    assert spill_rows(buffer) == []
+    assert spill_rows(buffer, 'dead_letter') == [('["bad"]', 2)]
+    stats = buffer.get_stats()
+    assert (stats['dead_lettered'], stats['dead_letter_rows']) == (1, 1)
+
+
+def test_claimed_rows_are_hidden_from_other_workers(make_buffer):
+    buffer = make_buffer(start=False, max_rows=2, visibility_timeout=60)
+    buffer._spill([(1,), (2,), (3,)])
+
+    first = buffer._claim()
+    second = buffer._claim()
+    assert [row_id for row_id, _, _ in first] == [1, 2]
+    assert [row_id for row_id, _, _ in second] == [3]
+    assert buffer._claim() == []
+
+
+def test_close_spills_what_mysql_does_not_take(make_buffer, database):
+    buffer = make_buffer(max_rows=100, flush_ms=10000)
+    database.reachable = False
+    buffer.add((1,))
+    buffer.close(timeout=5)
+
+    assert buffer.pending() == 0
+    assert spill_rows(buffer) == [('[1]', 0)]
+
+
+def test_rows_are_journaled_when_added_and_cleared_once_written(make_buffer, database):
+    buffer = make_buffer(max_rows=100, flush_ms=10000)
+    buffer.add_many([(1, b'\x00'), (2, None)])
+
+    # Journaled before add_many returns, hidden from the drain while this buffer holds them
+    assert [row for row, _ in spill_rows(buffer)] == ['[1, {"$bytes": "AA=="}]', '[2, null]']
+    assert buffer._claim() == []
+
+    assert buffer.flush(timeout=5)
+    assert database.rows == [(1, b'\x00'), (2, None)]
+    assert spill_rows(buffer) == []
+
+
+def test_a_restarted_worker_replays_rows_that_were_never_flushed(make_buffer, database):
+    crashed = make_buffer(start=False, max_rows=100, visibility_timeout=0.05)
+    crashed._thread = object()  # its flusher never runs, as after a SIGKILL
+    crashed.add_many([(1,), (2,)])
+    crashed._thread = None  # nothing left to flush at exit
+    assert database.rows == []
+
+    time.sleep(0.1)
+    restarted = make_buffer(start=False)
+    restarted._drain()
+    assert database.rows == [(1,), (2,)]
+    assert spill_rows(restarted) == []
@@ -0,0 +1,171 @@
+"""
+Rice Disease Detection - Fast Cascade Model Training
+Trains a small separable-convolution classifier on the same dataset and
+validation split as train_model.py, for the first stage of the model cascade
+"""
+
+import os
+import json
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
+from model_cascade import FAST_MODEL_PATH
+
+# Configuration
+IMG_SIZE = 224
+BATCH_SIZE = 32
+EPOCHS = 40
+LEARNING_RATE = 0.002
+DATA_DIR = "Rice Leaf Disease Images"
+MODEL_DIR = "models"
+RESULTS_DIR = "results"
+CLASS_INDICES_PATH = os.path.join(MODEL_DIR, 'class_indices.json')
+
+os.makedirs(MODEL_DIR, exist_ok=True)
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+gpus = tf.config.list_physical_devices('GPU')
+if gpus:
+    try:
+        tf.config.set_visible_devices(gpus[0], 'GPU')
+        tf.config.experimental.set_memory_growth(gpus[0], True)
+        print(f"✓ Using GPU: {gpus[0]}")
+    except RuntimeError as e:
+        print(f"GPU Configuration Error: {e}")
+else:
+    print("⚠ No GPU found, using CPU")
+
+print("\n" + "=" * 50)
+print("Data Loading and Preprocessing")
+print("=" * 50)
+
+# Same augmentation and validation_split as train_model.py, so both models
+# are validated on the same held-out images
+train_datagen = ImageDataGenerator(
+    rescale=1./255,
+    rotation_range=20,
+    width_shift_range=0.2,
+    height_shift_range=0.2,
+    shear_range=0.2,
+    zoom_range=0.2,
+    horizontal_flip=True,
+    vertical_flip=True,
+    fill_mode='nearest',
+    validation_split=0.2
+)
+
+train_generator = train_datagen.flow_from_directory(
+    DATA_DIR,
+    target_size=(IMG_SIZE, IMG_SIZE),
+    batch_size=BATCH_SIZE,
+    class_mode='categorical',
+    subset='training',
+    shuffle=True
+)
+
+val_generator = train_datagen.flow_from_directory(
+    DATA_DIR,
+    target_size=(IMG_SIZE, IMG_SIZE),
+    batch_size=BATCH_SIZE,
+    class_mode='categorical',
+    subset='validation',
+    shuffle=False
+)
+
+num_classes = len(train_generator.class_indices)
+
+# The cascade mixes both models' outputs, so their class order must agree
+class_indices = {str(v): k for k, v in train_generator.class_indices.items()}
+if os.path.exists(CLASS_INDICES_PATH):
+    with open(CLASS_INDICES_PATH, 'r') as f:
+        if json.load(f) != class_indices:
+            raise SystemExit(f"✗ Dataset classes differ from {CLASS_INDICES_PATH}; retrain the full model first")
+
+print(f"✓ Found {train_generator.samples} training images")
+print(f"✓ Found {val_generator.samples} validation images")
+
+
+def build_fast_cnn(input_shape=(224, 224, 3), num_classes=4):
+    """
+    Small classifier for the cascade's first stage
+
+    A strided stem and depthwise-separable blocks keep it to a few percent of
+    the full CNN's multiply-adds, with the same 224x224 input so both models
+    share one decoded image.
+    """
+    model = keras.Sequential([
+        layers.Input(shape=input_shape),
+
+        layers.Conv2D(16, (3, 3), strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+
+        layers.SeparableConv2D(32, (3, 3), strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+
+        layers.SeparableConv2D(64, (3, 3), strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+
+        layers.SeparableConv2D(128, (3, 3), strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ])
+
+    return model
+
+
+print("\n" + "=" * 50)
+print("Building Fast CNN Model")
+print("=" * 50)
+
+model = build_fast_cnn(input_shape=(IMG_SIZE, IMG_SIZE, 3), num_classes=num_classes)
+model.compile(
+    optimizer=keras.optimizers.Adam(learning_rate=LEARNING_RATE),
+    loss='categorical_crossentropy',
+    metrics=['accuracy']
+)
+model.summary()
+
+callbacks = [
+    ModelCheckpoint(FAST_MODEL_PATH, monitor='val_accuracy', save_best_only=True, mode='max', verbose=1),
+    EarlyStopping(monitor='val_loss', patience=8, restore_best_weights=True, verbose=1),
+    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=4, min_lr=1e-6, verbose=1)
+]
+
+print("\n" + "=" * 50)
+print("Training Model")
+print("=" * 50)
+
+history = model.fit(
+    train_generator,
+    validation_data=val_generator,
+    epochs=EPOCHS,
+    callbacks=callbacks,
+    verbose=1
+)
+
+model.save(FAST_MODEL_PATH)
+
+val_loss, val_accuracy = model.evaluate(val_generator)
+
+history_dict = {
+    'accuracy': [float(x) for x in history.history['accuracy']],
+    'val_accuracy': [float(x) for x in history.history['val_accuracy']],
+    'loss': [float(x) for x in history.history['loss']],
+    'val_loss': [float(x) for x in history.history['val_loss']],
+    'final_val_accuracy': float(val_accuracy),
+    'total_params': int(model.count_params())
+}
+with open(os.path.join(RESULTS_DIR, 'fast_model_history.json'), 'w') as f:
+    json.dump(history_dict, f, indent=4)
+
+print("\n" + "=" * 50)
+print("Training Complete!")
+print("=" * 50)
+print(f"\n✓ Fast model saved to: {FAST_MODEL_PATH} ({model.count_params():,} parameters)")
+print(f"✓ Validation accuracy: {val_accuracy*100:.2f}%")
+print("\nRun calibrate_cascade.py to pick the confidence threshold")
@@ -0,0 +1,136 @@
+"""
+Rice Disease Detection - Upload Handling
+Keeps uploads in memory for inference and persists them off the response path
+"""
+
+import io
+import os
+import queue
+import zipfile
+import threading
+from flask import Request, current_app
+
+# JPEG/PNG barely compress; a member far smaller in the archive than out of it is a zip bomb
+MAX_ARCHIVE_COMPRESSION_RATIO = 100
+
+
+def upload_limit(max_bytes):
+    """
+    Route decorator overriding the app's MAX_CONTENT_LENGTH for one endpoint
+
+    Apply it directly below @app.route so the registered view carries the limit.
+    """
+    def decorator(view):
+        view.max_content_length = max_bytes
+        return view
+    return decorator
+
+
+def read_archive(data, accept, max_members, max_member_bytes, max_total_bytes,
+                 max_ratio=MAX_ARCHIVE_COMPRESSION_RATIO):
+    """
+    (filename, bytes) pairs of the accepted members of a zip archive
+
+    Every member's size is checked against the limits from the archive's
+    headers before it is decompressed. Past max_members, one extra
+    (name, b'') pair is returned so the caller can reject the batch.
+
+    Args:
+        data (bytes): The uploaded archive
+        accept (callable): accept(filename) -> whether a member is read at all
+        max_members (int): Members read before the archive counts as too large
+        max_member_bytes (int): Largest uncompressed member
+        max_total_bytes (int): Largest total of the uncompressed members read
+        max_ratio (float): Largest uncompressed / compressed size of a member
+
+    Raises:
+        zipfile.BadZipFile: The data is not a zip archive, or a member doesn't match its header
+        ValueError: A member or the archive is over a limit
+    """
+    members = []
+    total_bytes = 0
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not accept(info.filename):
+                continue
+            if len(members) >= max_members:
+                members.append((info.filename, b''))
+                break
+            if info.file_size > max_member_bytes:
+                raise ValueError(f"Archive member too large: {info.filename}")
+            if info.file_size > max_ratio * max(info.compress_size, 1):
+                raise ValueError(f"Archive member is compressed too far to be an image: {info.filename}")
+            total_bytes += info.file_size
+            if total_bytes > max_total_bytes:
+                raise ValueError(f"Archive is too large uncompressed (max {max_total_bytes / 1048576:.0f} MB)")
+            # zipfile stops at the header's size and rejects a member that holds more (CRC mismatch)
+            members.append((os.path.basename(info.filename), zf.read(info)))
+    return members
+
+
+class InMemoryUploadRequest(Request):
+    """
+    Flask request that buffers uploaded files in memory instead of temp files
+
+    The body limit is enforced while the request streams in: a larger
+    Content-Length, or a chunked body that runs past the limit, is answered
+    with 413 before the rest of it is read into memory.
+    """
+
+    @property
+    def max_content_length(self):
+        view = current_app.view_functions.get(self.endpoint) if self.url_rule else None
+        limit = getattr(view, 'max_content_length', None)
+        return limit if limit is not None else current_app.config.get('MAX_CONTENT_LENGTH')
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
+class UploadWriter:
+    """Background thread that writes uploaded images to the upload folder"""
+
+    def __init__(self, upload_folder, max_pending=256):
+        """
+        Start the writer thread
+
+        Args:
+            upload_folder (str): Directory where uploads are persisted
+            max_pending (int): Uploads buffered before save() blocks the caller
+        """
+        self.upload_folder = upload_folder
+        self.max_pending = max_pending
+        self._start()
+        # Threads don't survive fork(); pre-forked workers need their own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        """Create the upload queue and start the writer thread"""
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._thread = threading.Thread(target=self._run, name='upload-writer', daemon=True)
+        self._thread.start()
+
+    def save(self, filename, data):
+        """Queue image bytes to be written as upload_folder/filename"""
+        self._queue.put((filename, data))
+
+    def flush(self):
+        """Block until every queued upload has been written"""
+        self._queue.join()
+
+    def pending(self):
+        """Number of uploads waiting to be written"""
+        return self._queue.qsize()
+
+    def _run(self):
+        """Worker loop: write queued uploads one by one"""
+        while True:
+            filename, data = self._queue.get()
+            try:
+                file_path = os.path.join(self.upload_folder, filename)
+                with open(file_path, 'wb') as f:
+                    f.write(data)
+            except OSError as e:
+                print(f"✗ Error saving upload {filename}: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,416 @@
+"""
+Rice Disease Detection - Write-Behind Buffer
+Collects rows for one INSERT and writes them off the request path in
+multi-row batches, spilling them to a local SQLite file when MySQL can't
+take them so they are retried rather than lost
+
+Each row is journaled to the spill file, hidden from the drain, as it is
+added and deleted once its INSERT commits. A process killed without a clean
+exit (SIGKILL, OOM, a worker timeout) leaves its unflushed rows there, and
+they are retried once visibility_timeout has passed. Delivery is at least
+once: a kill between the commit and the delete writes those rows twice.
+"""
+
+import os
+import json
+import time
+import atexit
+import base64
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+def _encode_row(row):
+    """JSON text of a row; bytes values (embeddings) are base64-encoded"""
+    return json.dumps([
+        {'$bytes': base64.b64encode(value).decode('ascii')} if isinstance(value, (bytes, bytearray)) else value
+        for value in row
+    ])
+
+
+def _placeholders(values):
+    return ','.join('?' * len(values))
+
+
+def _decode_row(text):
+    return tuple(base64.b64decode(value['$bytes']) if isinstance(value, dict) else value
+                 for value in json.loads(text))
+
+
+class WriteBehindBuffer:
+    """Buffers rows for one INSERT and writes them with executemany every max_rows rows or flush_ms"""
+
+    def __init__(self, query, get_db, spill_path, max_rows=50, flush_ms=200, max_pending=5000,
+                 drain_seconds=5, visibility_timeout=60, max_attempts=10):
+        """
+        Create the spill file; the flusher thread starts with start() or the first add()
+
+        Args:
+            query (str): INSERT with one placeholder per row value
+            get_db (callable): Returns a DatabaseConnection-like handle; it is disconnected after each write
+            spill_path (str): SQLite file holding rows that could not be written yet
+            max_rows (int): Rows per executemany; a full batch is written at once
+            flush_ms (float): Longest a buffered row waits before it is written
+            max_pending (int): Rows held in memory; further rows go straight to the spill file
+            drain_seconds (float): How often spilled rows are retried
+            visibility_timeout (float): Seconds spilled rows claimed by one worker, or journaled
+                rows it holds in memory, stay hidden from the others
+            max_attempts (int): Times MySQL may refuse a spilled row before it moves to the
+                dead_letter table of the spill file; rows that can't reach MySQL don't count
+        """
+        self.query = query
+        self.get_db = get_db
+        self.spill_path = spill_path
+        self.max_rows = max_rows
+        self.flush_seconds = flush_ms / 1000.0
+        self.max_pending = max_pending
+        self.drain_seconds = drain_seconds
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS spill (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    row TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    visible_at REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            # Rows MySQL kept refusing, kept for inspection instead of being retried forever
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_letter (
+                    id INTEGER PRIMARY KEY,
+                    row TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    failed_at REAL NOT NULL
+                )
+            """)
+
+        self._reset()
+        # Threads don't survive fork(); each pre-forked worker buffers and flushes its own rows
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._rows = []
+        self._first_at = 0.0  # when the oldest buffered row was added
+        self._added = 0  # rows buffered in memory, ever
+        self._journaling = 0  # rows being journaled, counted against max_pending already
+        self._done = 0  # of those, rows written or spilled
+        self._flush_requested = False
+        self._thread = None
+        self.written = 0
+        self.spilled = 0
+        self.drained = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_error = None
+        self._reached = False  # whether the last _execute() got as far as MySQL
+
+    def start(self):
+        """Start the flusher thread, which also retries rows spilled by earlier runs"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._next_drain = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived autocommit connection; sqlite3 connections can't be shared across threads"""
+        conn = sqlite3.connect(self.spill_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, row):
+        """Queue one row; it is journaled locally before this returns, the INSERT runs on the flusher thread"""
+        self.add_many([row])
+
+    def add_many(self, rows):
+        """Queue rows in order; those that don't fit under max_pending are spilled instead"""
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return
+        if self._thread is None:
+            self.start()
+
+        with self._cond:
+            room = max(self.max_pending - len(self._rows) - self._journaling, 0)
+            accepted, overflow = rows[:room], rows[room:]
+            self._journaling += len(accepted)
+
+        if overflow:
+            # MySQL is not keeping up; hold the rest on disk rather than in memory
+            self._spill(overflow)
+        if not accepted:
+            return
+
+        journal_ids = self._journal(accepted)
+        with self._cond:
+            self._journaling -= len(accepted)
+            first = not self._rows
+            if first:
+                self._first_at = time.monotonic()
+            self._rows.extend(zip(journal_ids, accepted))
+            self._added += len(accepted)
+            # An idle flusher sleeps until the next drain; the first row sets a flush_ms deadline
+            if first or len(self._rows) >= self.max_rows:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Write every row buffered so far now; returns False if that took longer than timeout"""
+        with self._cond:
+            target = self._added
+            if self._done >= target:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._done >= target, timeout)
+
+    def close(self, timeout=10):
+        """Flush on shutdown; rows MySQL doesn't take in time stay in the spill file"""
+        if self._thread is not None and not self.flush(timeout):
+            with self._cond:
+                entries, self._rows = self._rows, []
+                self._done += len(entries)
+            if entries:
+                self._release(entries)
+
+    def pending(self):
+        """Rows buffered in memory, not yet written"""
+        with self._cond:
+            return len(self._rows)
+
+    def get_stats(self):
+        """Buffer and spill counters for the health endpoint"""
+        try:
+            with self._connect() as conn:
+                spill_rows = conn.execute("SELECT COUNT(*) FROM spill").fetchone()[0]
+                dead_letter_rows = conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+        except sqlite3.Error:
+            spill_rows = dead_letter_rows = None
+        with self._cond:
+            return {
+                'pending': len(self._rows),
+                'max_pending': self.max_pending,
+                'spill_rows': spill_rows,
+                'dead_letter_rows': dead_letter_rows,
+                'written': self.written,
+                'spilled': self.spilled,
+                'drained': self.drained,
+                'dropped': self.dropped,
+                'dead_lettered': self.dead_lettered,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+                'avg_batch_rows': round(self.written / self.flushes, 2) if self.flushes else 0.0,
+                'last_error': self.last_error
+            }
+
+    def _run(self):
+        """Flusher loop: write a batch when it is full, old enough or flushed; retry the spill file every few seconds"""
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._rows and (len(self._rows) >= self.max_rows or self._flush_requested
+                                       or now - self._first_at >= self.flush_seconds):
+                        break
+                    if now >= self._next_drain:
+                        break
+                    timeout = self._next_drain - now
+                    if self._rows:
+                        timeout = min(timeout, self._first_at + self.flush_seconds - now)
+                    self._cond.wait(timeout)
+
+                batch = self._rows[:self.max_rows]
+                del self._rows[:self.max_rows]
+                if not self._rows:
+                    self._flush_requested = False
+
+            if batch:
+                written = self._execute([row for _, row in batch])
+                if written:
+                    self._forget([journal_id for journal_id, _ in batch if journal_id is not None])
+                else:
+                    self._release(batch)
+                with self._cond:
+                    if written:
+                        self.written += len(batch)
+                        self.flushes += 1
+                    else:
+                        self.failed_flushes += 1
+                    self._done += len(batch)
+                    self._cond.notify_all()
+
+            if time.monotonic() >= self._next_drain:
+                try:
+                    self._drain()
+                except sqlite3.Error as e:
+                    print(f"✗ Error reading {self.spill_path}: {e}")
+                self._next_drain = time.monotonic() + self.drain_seconds
+
+    def _execute(self, rows):
+        """One multi-row INSERT; False if MySQL could not be reached or refused it"""
+        db = self.get_db()
+        try:
+            written = db.execute_many(self.query, rows)
+            # A handle that never connected has no connection; one whose query failed still does
+            self._reached = db.connection is not None
+            with self._cond:
+                self.last_error = None if written else ('Insert refused' if self._reached else 'Database unreachable')
+            return written
+        except Exception as e:
+            self._reached = False
+            with self._cond:
+                self.last_error = str(e)
+            print(f"✗ Write-behind flush failed: {e}")
+            return False
+        finally:
+            db.disconnect()
+
+    def _journal(self, rows):
+        """
+        Store rows in the spill file, hidden from the drain while this process
+        holds them in memory; returns their ids, or Nones if the file can't
+        take them, in which case they are only spilled if their INSERT fails
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                ids = [conn.execute("INSERT INTO spill (row, visible_at, created_at) VALUES (?, ?, ?)",
+                                    (_encode_row(row), now + self.visibility_timeout, now)).lastrowid
+                       for row in rows]
+                conn.execute("COMMIT")
+            return ids
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"✗ Could not journal {len(rows)} rows to {self.spill_path}: {e}")
+            return [None] * len(rows)
+
+    def _forget(self, journal_ids):
+        """Delete the journal entries of rows MySQL has committed"""
+        if not journal_ids:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(f"DELETE FROM spill WHERE id IN ({_placeholders(journal_ids)})", journal_ids)
+        except sqlite3.Error as e:
+            # Left in place they are written again later: a duplicate rather than a loss
+            print(f"✗ Could not clear {len(journal_ids)} written rows from {self.spill_path}: {e}")
+
+    def _release(self, entries):
+        """Hand (journal id, row) pairs MySQL didn't take to the drain: journaled ones are made visible"""
+        journal_ids = [journal_id for journal_id, _ in entries if journal_id is not None]
+        unjournaled = [row for journal_id, row in entries if journal_id is None]
+        if journal_ids:
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"UPDATE spill SET visible_at = ? WHERE id IN ({_placeholders(journal_ids)})",
+                                 [time.time()] + journal_ids)
+                with self._cond:
+                    self.spilled += len(journal_ids)
+            except sqlite3.Error as e:
+                # Still journaled; they become visible once visibility_timeout has passed
+                print(f"✗ Could not release {len(journal_ids)} rows in {self.spill_path}: {e}")
+        if unjournaled:
+            self._spill(unjournaled)
+
+    def _spill(self, rows):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany("INSERT INTO spill (row, visible_at, created_at) VALUES (?, ?, ?)",
+                                 [(_encode_row(row), now, now) for row in rows])
+            with self._cond:
+                self.spilled += len(rows)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            with self._cond:
+                self.dropped += len(rows)
+            print(f"✗ Could not spill {len(rows)} rows to {self.spill_path}: {e}")
+
+    def _drain(self):
+        """Write spilled rows back until the file is empty or MySQL takes none of the rows offered"""
+        while True:
+            claimed = self._claim()
+            if not claimed:
+                return
+
+            rows = [(row_id, _decode_row(text)) for row_id, text, _ in claimed]
+            written, refused = [], {}  # refused: row id -> MySQL's error
+            if self._execute([row for _, row in rows]):
+                written = [row_id for row_id, _ in rows]
+            elif self._reached and len(rows) > 1:
+                # MySQL refused the batch: write the rows one by one so a bad row doesn't hold back the rest
+                for row_id, row in rows:
+                    if self._execute([row]):
+                        written.append(row_id)
+                    elif self._reached:
+                        refused[row_id] = self.last_error
+            elif self._reached:
+                refused = {row_id: self.last_error for row_id, _ in rows}
+            # Rows MySQL refused max_attempts times go to the dead-letter table;
+            # rows that never reached it are only released
+            dead = [row_id for row_id, _, attempts in claimed
+                    if row_id in refused and attempts + 1 >= self.max_attempts]
+            retried = [row_id for row_id in refused if row_id not in dead]
+            released = [row_id for row_id, _ in rows if row_id not in written and row_id not in refused]
+
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if written:
+                    conn.execute(f"DELETE FROM spill WHERE id IN ({_placeholders(written)})", written)
+                if retried:
+                    # Retried on the next drain, not in this one; rows that keep failing sort after the rest
+                    conn.execute(f"UPDATE spill SET attempts = attempts + 1, visible_at = ? "
+                                 f"WHERE id IN ({_placeholders(retried)})",
+                                 [time.time() + self.drain_seconds] + retried)
+                if released:
+                    conn.execute(f"UPDATE spill SET visible_at = 0 WHERE id IN ({_placeholders(released)})", released)
+                for row_id in dead:
+                    conn.execute("INSERT INTO dead_letter (id, row, attempts, last_error, created_at, failed_at) "
+                                 "SELECT id, row, attempts + 1, ?, created_at, ? FROM spill WHERE id = ?",
+                                 (refused[row_id], time.time(), row_id))
+                if dead:
+                    conn.execute(f"DELETE FROM spill WHERE id IN ({_placeholders(dead)})", dead)
+                conn.execute("COMMIT")
+
+            with self._cond:
+                self.drained += len(written)
+                self.dead_lettered += len(dead)
+            if dead:
+                print(f"✗ {len(dead)} spilled rows refused {self.max_attempts} times, "
+                      f"moved to dead_letter in {self.spill_path}")
+            if not written:
+                return
+            print(f"✓ {len(written)} spilled rows written from {self.spill_path}")
+
+    def _claim(self):
+        """Hide the next batch of spilled rows from other workers draining the same file"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            claimed = conn.execute(
+                "SELECT id, row, attempts FROM spill WHERE visible_at <= ? ORDER BY attempts, id LIMIT ?",
+                (now, self.max_rows)
+            ).fetchall()
+            if claimed:
+                conn.execute(f"UPDATE spill SET visible_at = ? WHERE id IN ({_placeholders(claimed)})",
+                             [now + self.visibility_timeout] + [row_id for row_id, _, _ in claimed])
+            conn.execute("COMMIT")
+        return claimed